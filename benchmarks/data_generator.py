@@ -0,0 +1,214 @@
+"""
+Детерминированный генератор синтетического каталога для бенчмарков
+
+Одинаковые seed и размер всегда дают одинаковые книги, пользователей и
+историю бронирований: все случайные значения берутся из random.Random с
+фиксированным зерном, а даты отсчитываются от фиксированного момента.
+"""
+import random
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from src.auth.password_hashing import PasswordHasher
+from src.database.database_manager import DatabaseManager
+from src.models.book import Book
+
+# Размеры каталога: число книг
+SIZES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+# Пользователей на книгу и бронирований на пользователя в истории
+USERS_PER_BOOK = 0.05
+RESERVATIONS_PER_USER = 5
+
+# Пароль всех сгенерированных пользователей
+PASSWORD = "benchmark-password"
+
+# История бронирований охватывает год до этого момента
+HISTORY_END = datetime(2026, 1, 1)
+HISTORY_DAYS = 365
+
+# Доли статусов в истории; активные бронирования списывают экземпляры
+STATUS_WEIGHTS = {
+    'completed': 60,
+    'cancelled': 15,
+    'confirmed': 10,
+    'pending': 15,
+}
+
+TITLE_WORDS = [
+    "тайна", "город", "море", "ночь", "война", "мир", "дорога", "время", "сад",
+    "история", "письма", "остров", "зима", "лето", "тень", "свет", "огонь",
+    "память", "голос", "дом", "река", "небо", "звезда", "дети", "отец", "мать",
+    "сердце", "путь", "странник", "капитан", "доктор", "мастер", "песня", "ветер",
+    "лес", "гора", "поле", "камень", "золото", "серебро", "книга", "слово", "сон",
+    "утро", "вечер", "буря", "берег", "пламя", "завтра", "вчера", "север", "юг",
+    "восток", "запад", "последний", "первый", "тихий", "тёмный", "белый", "красный",
+]
+FIRST_NAMES = [
+    "Анна", "Борис", "Вера", "Глеб", "Дарья", "Егор", "Жанна", "Захар", "Ирина",
+    "Кирилл", "Лидия", "Максим", "Нина", "Олег", "Полина", "Роман", "Софья",
+    "Тимур", "Ульяна", "Фёдор", "Юлия", "Яков", "Алексей", "Мария", "Павел",
+]
+LAST_NAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов",
+    "Михайлов", "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев",
+    "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов", "Николаев", "Орлов",
+    "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв", "Борисов",
+    "Яковлев", "Григорьев", "Романов", "Воробьёв", "Сергеев", "Кузьмин", "Фролов",
+    "Александров", "Дмитриев", "Королёв", "Гусев", "Киселёв",
+]
+GENRES = [
+    "Роман", "Детектив", "Фантастика", "Фэнтези", "Поэзия", "Драма", "Приключения",
+    "История", "Биография", "Наука", "Психология", "Философия", "Детская",
+    "Учебная", "Справочная",
+]
+PUBLISHERS = [
+    "Эксмо", "АСТ", "Азбука", "Питер", "МИФ", "Просвещение", "Наука",
+    "Альпина", "Росмэн", "Вече",
+]
+
+# Сколько строк вставлять за один executemany
+CHUNK_SIZE = 10_000
+
+
+@dataclass
+class Catalog:
+    """Параметры сгенерированного каталога, нужные для нагрузки"""
+    size: str
+    seed: int
+    books: int
+    users: int
+    reservations: int
+    title_words: List[str] = field(default_factory=lambda: list(TITLE_WORDS))
+    authors: List[str] = field(default_factory=list)
+    genres: List[str] = field(default_factory=lambda: list(GENRES))
+
+    def username(self, n: int) -> str:
+        """Имя n-го пользователя (с нуля)"""
+        return f"reader{n:07d}"
+
+
+def authors() -> List[str]:
+    """Все авторы каталога в фиксированном порядке"""
+    return [f"{first} {last}" for last in LAST_NAMES for first in FIRST_NAMES]
+
+
+def generate_books(count: int, seed: int,
+                   available: Optional[Sequence[int]] = None) -> Iterator[Book]:
+    """Книги каталога; ISBN уникален и определяется номером книги
+
+    available, если задан, — число свободных экземпляров каждой книги;
+    иначе свободны все экземпляры.
+    """
+    rng = random.Random(f"{seed}:books")
+    names = authors()
+    for n in range(count):
+        quantity = rng.choice((1, 1, 2, 2, 3, 5))
+        yield Book(
+            id=0,
+            title=" ".join(rng.sample(TITLE_WORDS, rng.randint(2, 4))).capitalize(),
+            author=rng.choice(names),
+            year=rng.randint(1850, 2025),
+            isbn=f"978-5-{n:09d}",
+            publisher=rng.choice(PUBLISHERS),
+            genre=rng.choice(GENRES),
+            pages=rng.randint(60, 1200),
+            quantity=quantity,
+            available=quantity if available is None else available[n],
+        )
+
+
+def generate_reservations(available: array, users: int, count: int,
+                          seed: int) -> Iterator[Tuple[int, int, str, str, str]]:
+    """История бронирований: (book_id, user_id, status, дата, срок получения)
+
+    Спрос неравномерный: книги с меньшими номерами бронируют чаще.
+    Активные бронирования списывают экземпляры из available (по книге на
+    элемент) и создаются, только пока экземпляры есть. ID книг и
+    пользователей считаются с 1 в порядке генерации.
+    """
+    rng = random.Random(f"{seed}:reservations")
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    start = HISTORY_END - timedelta(days=HISTORY_DAYS)
+    for _ in range(count):
+        index = int(len(available) * rng.random() ** 2)
+        status = rng.choices(statuses, weights)[0]
+        if status in ('pending', 'confirmed'):
+            if available[index] <= 0:
+                status = 'completed'
+            else:
+                available[index] -= 1
+
+        when = start + timedelta(seconds=rng.randrange(HISTORY_DAYS * 24 * 60 * 60))
+        deadline = when + timedelta(days=3) if status == 'confirmed' else None
+        yield (
+            index + 1, rng.randint(1, users), status, when.isoformat(),
+            deadline.isoformat() if deadline else None,
+        )
+
+
+def catalog_spec(size: str, seed: int = 42) -> Catalog:
+    """Параметры каталога размера size без создания базы"""
+    if size not in SIZES:
+        raise ValueError(f"Размер каталога: {', '.join(SIZES)}")
+
+    books = SIZES[size]
+    users = max(int(books * USERS_PER_BOOK), 100)
+    return Catalog(size=size, seed=seed, books=books, users=users,
+                   reservations=users * RESERVATIONS_PER_USER, authors=authors())
+
+
+def build_catalog(db_path: str, size: str, seed: int = 42,
+                  profile: str = "balanced") -> Catalog:
+    """Создать базу с каталогом размера size
+
+    База должна быть пустой. Пароль всех пользователей — PASSWORD; хеш
+    вычисляется один раз, иначе создание пользователей заняло бы часы.
+    """
+    catalog = catalog_spec(size, seed)
+    book_count = catalog.books
+
+    # Книги генерируются дважды с одним зерном: сначала ради тиража,
+    # чтобы история бронирований могла списать экземпляры, затем для
+    # вставки. Так в памяти не держится миллион объектов Book
+    available = array('l', (book.quantity for book in generate_books(book_count, seed)))
+    reservations = list(
+        generate_reservations(available, catalog.users, catalog.reservations, seed)
+    )
+    password_hash = PasswordHasher().hash(PASSWORD)
+
+    db = DatabaseManager(db_path, profile=profile, search_cache_size=0, user_cache_size=0)
+    try:
+        db.add_books_bulk(generate_books(book_count, seed, available),
+                          on_duplicate="error", chunk_size=CHUNK_SIZE)
+
+        conn = db.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany('''
+                INSERT INTO users (username, email, password_hash, role, full_name)
+                VALUES (?, ?, ?, 'reader', ?)
+            ''', (
+                (catalog.username(n), f"{catalog.username(n)}@example.com",
+                 password_hash, f"Читатель {n}")
+                for n in range(catalog.users)
+            ))
+            conn.executemany('''
+                INSERT INTO reservations (book_id, user_id, status, reservation_date, pickup_deadline)
+                VALUES (?, ?, ?, ?, ?)
+            ''', reservations)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        db.close()
+
+    return catalog
@@ -0,0 +1,390 @@
+"""
+Конкурентная нагрузка на веб-API каталога
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.load --workers 16 --duration 10
+    python -m benchmarks.load --mix search=60,reserve=35,login=5 --hot-books 20
+    python -m benchmarks.load --url http://127.0.0.1:5000 --db library.db
+
+Без --url нагрузка подаётся на Flask-приложение в том же процессе через
+тестовый клиент (по клиенту на поток) на копии синтетического каталога
+из data_generator. С --url запросы идут по HTTP на запущенный сервер,
+например многопроцессный (--mode serve), каталог которого собран
+тем же генератором. После нагрузки проверяются инварианты фонда.
+Процесс завершается с кодом 1, если какой-либо инвариант нарушен.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.database.database_manager import STORAGE_PROFILES
+from .data_generator import PASSWORD, SIZES, Catalog, catalog_spec
+from .run import DEFAULT_DATA_DIR, prepare_catalog, summarize
+
+# Доли операций по умолчанию
+DEFAULT_MIX = {'search': 70, 'reserve': 25, 'login': 5}
+
+# Все операции нагрузки
+OPERATIONS = tuple(DEFAULT_MIX)
+
+# Верхние границы интервалов гистограммы задержки, мс
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+# Исходы запросов: успех, отказ приложения (например, нет экземпляров),
+# перегрузка (503 с Retry-After) и ошибка (исключение, 5xx, неверный ответ)
+OUTCOMES = ('ok', 'rejected', 'busy', 'error')
+
+BUSY_STATUS = 503
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """Доли операций из строки вида search=70,reserve=25,login=5"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX or not weight.strip().isdigit():
+            raise ValueError(f"Неверная доля '{part}': ожидается {'|'.join(DEFAULT_MIX)}=число")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("Сумма долей должна быть больше нуля")
+    return mix
+
+
+def histogram(latencies: List[float]) -> Dict[str, int]:
+    """Число запросов по интервалам задержки HISTOGRAM_BOUNDS"""
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for latency in latencies:
+        counts[bisect_left(HISTOGRAM_BOUNDS, latency * 1000)] += 1
+
+    labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS]
+    labels.append(f">{HISTOGRAM_BOUNDS[-1]}ms")
+    return dict(zip(labels, counts))
+
+
+class InProcessClient:
+    """Запросы к Flask-приложению через тестовый клиент"""
+
+    def __init__(self):
+        from src.ui.web.app import app
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                body: Optional[Dict[str, Any]] = None,
+                token: Optional[str] = None) -> Tuple[int, Any]:
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self.client.open(path, method=method, query_string=params,
+                                    json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """Запросы к запущенному серверу по HTTP"""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                body: Optional[Dict[str, Any]] = None,
+                token: Optional[str] = None) -> Tuple[int, Any]:
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+
+class Worker(threading.Thread):
+    """Поток нагрузки: входит под своим пользователем и выполняет смесь операций
+
+    Результаты копятся в собственных списках потока и объединяются после
+    завершения, чтобы сбор статистики не добавлял конкуренции за блокировки.
+    """
+
+    def __init__(self, number: int, client, catalog: Catalog, mix: Dict[str, int],
+                 hot_books: int, deadline: float, requests: Optional[int], seed: int):
+        super().__init__(name=f"load-worker-{number}", daemon=True)
+        self.client = client
+        self.catalog = catalog
+        self.deadline = deadline
+        self.requests = requests
+        self.hot_books = min(hot_books, catalog.books) if hot_books else catalog.books
+        self.rng = random.Random(f"{seed}:load:{number}")
+        self.username = catalog.username(number % catalog.users)
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.token: Optional[str] = None
+        # Вход учитывается и без доли в смеси: он нужен перед бронированием
+        self.latencies: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        self.outcomes: Dict[str, Counter] = {name: Counter() for name in OPERATIONS}
+        self.errors: Counter = Counter()
+
+    def run(self) -> None:
+        done = 0
+        while time.perf_counter() < self.deadline:
+            if self.requests is not None and done >= self.requests:
+                break
+            name = self.rng.choices(self.operations, self.weights)[0]
+            if name == 'reserve' and self.token is None:
+                # Бронирование требует токена: сначала вход
+                name = 'login'
+
+            start = time.perf_counter()
+            try:
+                outcome = getattr(self, name)()
+            except Exception as e:
+                outcome = 'error'
+                self.errors[f"{name}: {type(e).__name__}: {e}"] += 1
+            self.latencies[name].append(time.perf_counter() - start)
+            self.outcomes[name][outcome] += 1
+            done += 1
+
+    def search(self) -> str:
+        if self.rng.random() < 0.7:
+            words = self.rng.sample(self.catalog.title_words, self.rng.randint(1, 2))
+            params = {'q': ' '.join(words), 'limit': 20}
+        else:
+            params = {'genre': self.rng.choice(self.catalog.genres), 'limit': 20}
+        status, body = self.client.request('GET', '/api/books/search', params=params)
+        return self._outcome('search', status, body)
+
+    def login(self) -> str:
+        status, body = self.client.request(
+            'POST', '/api/login', body={'username': self.username, 'password': PASSWORD}
+        )
+        outcome = self._outcome('login', status, body)
+        if outcome == 'ok':
+            self.token = body['token']
+        elif outcome == 'rejected':
+            # Пользователь генератора всегда входит с PASSWORD: отказ — ошибка
+            self.errors[f"login: {body.get('error')}"] += 1
+            return 'error'
+        return outcome
+
+    def reserve(self) -> str:
+        # Спрос сосредоточен на «горячих» книгах, чтобы бронирования конкурировали
+        book_id = int(self.hot_books * self.rng.random() ** 2) + 1
+        status, body = self.client.request(
+            'POST', '/api/books/reserve', body={'book_id': book_id}, token=self.token
+        )
+        return self._outcome('reserve', status, body)
+
+    def _outcome(self, name: str, status: int, body: Any) -> str:
+        if status == BUSY_STATUS:
+            return 'busy'
+        if status != 200 or not isinstance(body, dict):
+            self.errors[f"{name}: HTTP {status}"] += 1
+            return 'error'
+        return 'ok' if body.get('success', True) else 'rejected'
+
+
+def check_invariants(db_path: str) -> Dict[str, int]:
+    """Число нарушений каждого инварианта фонда (0 — инвариант соблюдён)
+
+    negative_available — свободных экземпляров меньше нуля;
+    available_above_quantity — свободных экземпляров больше тиража;
+    copies_unaccounted — у действующей книги свободные экземпляры вместе
+    с активными бронированиями не равны тиражу.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return {
+            'negative_available': conn.execute(
+                "SELECT COUNT(*) FROM books WHERE available < 0"
+            ).fetchone()[0],
+            'available_above_quantity': conn.execute(
+                "SELECT COUNT(*) FROM books WHERE available > quantity"
+            ).fetchone()[0],
+            'copies_unaccounted': conn.execute('''
+                SELECT COUNT(*) FROM books b
+                WHERE b.is_active = 1 AND b.available + (
+                    SELECT COUNT(*) FROM reservations r
+                    WHERE r.book_id = b.id AND r.status IN ('pending', 'confirmed')
+                ) != b.quantity
+            ''').fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+
+def run_load(workers: int = 8, duration: float = 10.0, requests: Optional[int] = None,
+             mix: Optional[Dict[str, int]] = None, hot_books: int = 50,
+             size: str = '10k', seed: int = 42, profile: str = 'balanced',
+             url: Optional[str] = None, db_path: Optional[str] = None,
+             data_dir: str = DEFAULT_DATA_DIR) -> Dict[str, Any]:
+    """Подать нагрузку и вернуть статистику и результаты проверки инвариантов
+
+    requests ограничивает число запросов на поток; нагрузка заканчивается
+    по первому из ограничений (duration или requests). Для нагрузки по
+    HTTP инварианты проверяются, только если задан db_path — путь к базе
+    сервера.
+    """
+    mix = mix or dict(DEFAULT_MIX)
+    catalog = catalog_spec(size, seed)
+    workdir = None
+    if url is None:
+        from src.ui.web.app import configure_api
+        workdir = tempfile.mkdtemp(prefix='library-load-')
+        source = prepare_catalog(data_dir, size, seed, profile)
+        db_path = os.path.join(workdir, os.path.basename(source))
+        shutil.copyfile(source, db_path)
+        configure_api(db_path=db_path, profile=profile)
+
+    try:
+        clients = [HttpClient(url) if url else InProcessClient() for _ in range(workers)]
+        started = time.perf_counter()
+        deadline = started + duration
+        threads = [
+            Worker(n, client, catalog, mix, hot_books, deadline, requests, seed)
+            for n, client in enumerate(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if url is None:
+            # Закрываем соединения приложения до проверки базы
+            configure_api()
+        invariants = check_invariants(db_path) if db_path else None
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    operations = {}
+    for name in OPERATIONS:
+        latencies = [value for thread in threads for value in thread.latencies[name]]
+        if not latencies:
+            continue
+        outcomes = sum((thread.outcomes[name] for thread in threads), Counter())
+        stats = summarize(latencies, elapsed)
+        stats.update({outcome: outcomes[outcome] for outcome in OUTCOMES})
+        stats['error_rate'] = round(outcomes['error'] / len(latencies), 4)
+        stats['histogram'] = histogram(latencies)
+        operations[name] = stats
+
+    total = sum(stats['ops'] for stats in operations.values())
+    errors = sum((thread.errors for thread in threads), Counter())
+    return {
+        'meta': {
+            'target': url or 'in-process',
+            'workers': workers,
+            'mix': mix,
+            'hot_books': hot_books,
+            'size': size,
+            'seed': seed,
+            'profile': profile,
+        },
+        'elapsed_sec': round(elapsed, 3),
+        'requests': total,
+        'requests_per_sec': round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        'operations': operations,
+        'errors': dict(errors.most_common()),
+        'invariants': invariants,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Напечатать сводку нагрузки"""
+    meta = report['meta']
+    print(f"🔥 {meta['target']}: потоков {meta['workers']}, {report['elapsed_sec']} с, "
+          f"запросов {report['requests']} ({report['requests_per_sec']} в секунду)")
+    print(f"   {'операция':<10} {'запросов':>9} {'отказы':>8} {'503':>6} {'ошибки':>7} "
+          f"{'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+    for name, stats in report['operations'].items():
+        print(f"   {name:<10} {stats['ops']:>9} {stats['rejected']:>8} {stats['busy']:>6} "
+              f"{stats['error']:>7} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f}")
+
+    for name, stats in report['operations'].items():
+        print(f"   {name}: " + ", ".join(
+            f"{label} {count}" for label, count in stats['histogram'].items() if count
+        ))
+
+    for message, count in list(report['errors'].items())[:10]:
+        print(f"   ⚠️  {message} × {count}")
+
+    invariants = report['invariants']
+    if invariants is None:
+        print("   Инварианты не проверялись: не задан путь к базе сервера (--db)")
+        return
+    for name, violations in invariants.items():
+        mark = '✅' if violations == 0 else '❌'
+        print(f"   {mark} {name}: нарушений {violations}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Конкурентная нагрузка на веб-API каталога')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Число потоков нагрузки')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Длительность нагрузки, секунд')
+    parser.add_argument('--requests', type=int,
+                        help='Максимум запросов на поток')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help='Доли операций, например search=70,reserve=25,login=5')
+    parser.add_argument('--hot-books', type=int, default=50,
+                        help='Бронирования выбирают из стольких первых книг (0 — из всех)')
+    parser.add_argument('--size', choices=list(SIZES), default='10k',
+                        help='Размер синтетического каталога')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Зерно генератора каталога и нагрузки')
+    parser.add_argument('--profile', choices=list(STORAGE_PROFILES), default='balanced',
+                        help='Профиль хранения SQLite')
+    parser.add_argument('--url', help='Адрес запущенного сервера вместо приложения в процессе')
+    parser.add_argument('--db', help='База сервера для проверки инвариантов (с --url)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR,
+                        help='Каталог для сгенерированных баз')
+    parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+    args = parser.parse_args(argv)
+
+    report = run_load(
+        workers=args.workers, duration=args.duration, requests=args.requests,
+        mix=args.mix, hot_books=args.hot_books, size=args.size, seed=args.seed,
+        profile=args.profile, url=args.url, db_path=args.db, data_dir=args.data_dir
+    )
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if report['invariants'] and any(report['invariants'].values()):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Накладные расходы замеров запросов DatabaseManager
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.overhead --size 10k
+    python -m benchmarks.overhead --rounds 60 --budget 0.02 --only get_book reserve
+    python -m benchmarks.overhead --control
+
+Сценарии выполняются на двух одинаковых копиях каталога, у каждой —
+менеджер без замеров и менеджер с замерами (instrument=True). В раунде
+обе копии выполняют одну и ту же пачку операций: одна без замеров,
+другая с ними, и от раунда к раунду копии меняются ролями и очерёдностью.
+Так копии остаются одинаковыми, а разница между ними (расположение
+страниц и журнала даёт на бронированиях несколько процентов даже без
+замеров), дрейф частоты процессора и фоновая нагрузка делятся между
+конфигурациями поровну. Накладные расходы сценария — отношение
+суммарного времени пачек с замерами и без них. Процесс завершается
+с кодом 1, если расходы какого-либо сценария превышают бюджет.
+
+С --control замеры выключены у обоих менеджеров: «расходы» такого
+прогона — шум измерения на этой машине, и бюджет имеет смысл, только
+если шум заметно меньше его.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from src.api.library_api import LibraryAPI
+from src.database.database_manager import STORAGE_PROFILES
+from .data_generator import SIZES, Catalog, catalog_spec
+from .run import DEFAULT_DATA_DIR, prepare_catalog, workloads
+
+# Допустимые накладные расходы замеров
+DEFAULT_BUDGET = 0.02
+
+DEFAULT_ROUNDS = 60
+
+# Операций в пачке
+DEFAULT_BLOCK = 200
+
+# Сценарии run, кроме входа: вход почти целиком состоит из вычисления KDF
+SCENARIOS = ('get_book', 'search_text', 'search_filtered', 'user_reservations', 'reserve')
+
+
+def scenarios(api: LibraryAPI, catalog: Catalog, seed: int) -> Dict[str, Callable[[], Any]]:
+    """Сценарии замера; аргументы вызовов выбираются детерминированно по seed"""
+    rng = random.Random(f"{seed}:overhead")
+
+    def get_book():
+        api.db.get_book_by_id(rng.randint(1, catalog.books))
+
+    operations = {'get_book': get_book}
+    operations.update(workloads(api, catalog, seed))
+    return {name: operations[name] for name in SCENARIOS}
+
+
+class Switch:
+    """Клиент сценариев копии, переключаемый между её менеджерами"""
+
+    def __init__(self, plain: LibraryAPI, instrumented: LibraryAPI):
+        self.apis = (plain, instrumented)
+        self.target = plain
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.target, name)
+
+
+def run_block(operation: Callable[[], Any], block: int) -> float:
+    """Время пачки из block операций"""
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(block):
+        operation()
+    return clock() - start
+
+
+def run_overhead(size: str = '10k', seed: int = 42, rounds: int = DEFAULT_ROUNDS,
+                 block: int = DEFAULT_BLOCK, profile: str = 'balanced',
+                 only: Optional[List[str]] = None, control: bool = False,
+                 data_dir: str = DEFAULT_DATA_DIR) -> Dict[str, Any]:
+    """Накладные расходы замеров по сценариям в виде, пригодном для JSON
+
+    Кэши поиска и пользователей отключены, чтобы каждая операция
+    выполняла запросы к БД. control=True выключает замеры у обоих
+    менеджеров и измеряет шум.
+    """
+    catalog = catalog_spec(size, seed)
+    source = prepare_catalog(data_dir, size, seed, profile)
+    db_options = {'profile': profile, 'search_cache_size': 0, 'user_cache_size': 0}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        copies = []
+        try:
+            for number in range(2):
+                db_path = os.path.join(workdir, f"copy{number}.db")
+                shutil.copyfile(source, db_path)
+                copies.append(Switch(LibraryAPI(db_path, **db_options),
+                                     LibraryAPI(db_path, instrument=not control, **db_options)))
+            # Одинаковый seed: копии получают одни и те же вызовы
+            operations = [scenarios(copy, catalog, seed) for copy in copies]
+
+            for name in SCENARIOS:
+                if only and name not in only:
+                    continue
+
+                # Прогрев: соединения пулов, кэш страниц SQLite, статистика выражений
+                for copy, ops in zip(copies, operations):
+                    for api in copy.apis:
+                        copy.target = api
+                        run_block(ops[name], block)
+
+                times = [0.0, 0.0]
+                for i in range(rounds):
+                    # Роли копий меняются каждый раунд, очерёдность — каждые два
+                    order = (0, 1) if i // 2 % 2 else (1, 0)
+                    for number in order:
+                        config = (number + i) % 2
+                        copies[number].target = copies[number].apis[config]
+                        times[config] += run_block(operations[number][name], block)
+
+                plain_time, instrumented_time = times
+                count = rounds * block
+                results[name] = {
+                    'ops': count,
+                    'plain_us': round(plain_time / count * 1e6, 2),
+                    'instrumented_us': round(instrumented_time / count * 1e6, 2),
+                    'overhead': round(instrumented_time / plain_time - 1, 4),
+                }
+        finally:
+            for copy in copies:
+                for api in copy.apis:
+                    api.close()
+
+    return {
+        'meta': {'size': size, 'seed': seed, 'profile': profile,
+                 'rounds': rounds, 'block': block, 'control': control},
+        'results': results,
+    }
+
+
+def over_budget(report: Dict[str, Any], budget: float = DEFAULT_BUDGET) -> List[str]:
+    """Сценарии, накладные расходы которых превышают бюджет"""
+    return [
+        f"{name}: {result['overhead']:+.1%}"
+        for name, result in report['results'].items()
+        if result['overhead'] > budget
+    ]
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Напечатать таблицу накладных расходов"""
+    meta = report['meta']
+    if meta['control']:
+        print("🔬 Контрольный прогон: замеры выключены у обеих конфигураций")
+    print(f"📊 Замеры запросов: каталог {meta['size']} (seed {meta['seed']}, {meta['profile']}), "
+          f"{meta['rounds']} раундов по {meta['block']} операций")
+    print(f"   {'сценарий':<18} {'без, мкс':>10} {'с ними, мкс':>12} {'расходы':>9}")
+    for name, result in report['results'].items():
+        print(f"   {name:<18} {result['plain_us']:>10.2f} {result['instrumented_us']:>12.2f} "
+              f"{result['overhead']:>+9.1%}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Накладные расходы замеров запросов')
+    parser.add_argument('--size', choices=list(SIZES), default='10k',
+                        help='Размер синтетического каталога')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Зерно генератора каталога и нагрузки')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS,
+                        help='Число раундов на сценарий')
+    parser.add_argument('--block', type=int, default=DEFAULT_BLOCK,
+                        help='Операций в пачке')
+    parser.add_argument('--profile', choices=list(STORAGE_PROFILES), default='balanced',
+                        help='Профиль хранения SQLite')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS,
+                        help='Выполнить только указанные сценарии')
+    parser.add_argument('--control', action='store_true',
+                        help='Выключить замеры у обеих конфигураций и измерить шум')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR,
+                        help='Каталог для сгенерированных баз')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='Допустимые накладные расходы (0.02 = 2%%)')
+    args = parser.parse_args(argv)
+
+    report = run_overhead(
+        size=args.size, seed=args.seed, rounds=args.rounds, block=args.block,
+        profile=args.profile, only=args.only, control=args.control,
+        data_dir=args.data_dir
+    )
+    print_report(report)
+
+    exceeded = over_budget(report, args.budget)
+    if exceeded:
+        print(f"❌ Накладные расходы больше {args.budget:.0%}:")
+        for line in exceeded:
+            print(f"   {line}")
+        return 1
+    print(f"✅ Накладные расходы в пределах {args.budget:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Бенчмарки поиска, бронирования и входа на синтетическом каталоге
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run --size 10k --output baseline.json
+    python -m benchmarks.run --size 10k --baseline baseline.json --threshold 0.2
+
+Каталог строится генератором data_generator один раз для набора
+(размер, seed, профиль) и кэшируется в --data-dir. Каждый прогон
+работает с копией базы, поэтому бронирования прогона не меняют данные
+следующих. С --baseline прогон завершается с кодом 1, если какой-либо
+показатель ухудшился больше чем на порог.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from src.api.library_api import LibraryAPI
+from src.database.database_manager import STORAGE_PROFILES
+from .data_generator import PASSWORD, SIZES, Catalog, build_catalog, catalog_spec
+
+# Число измеряемых операций на сценарий
+DEFAULT_OPS = 1000
+
+# Вход почти целиком состоит из вычисления KDF, поэтому операций меньше
+DEFAULT_LOGIN_OPS = 50
+
+# Доля операций, выполняемых до начала замеров
+WARMUP_FRACTION = 0.1
+
+PERCENTILES = (50, 95, 99)
+
+# Показатели, по которым прогон сравнивается с базовым; p99 на коротких
+# прогонах слишком шумный, поэтому в сравнение не входит
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'ops_per_sec')
+
+# Допустимое ухудшение показателя относительно базового прогона
+DEFAULT_THRESHOLD = 0.2
+
+# Параметры прогона, которые должны совпадать с базовым для сравнения
+COMPARABLE_META = ('size', 'seed', 'profile', 'cache')
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'library-benchmarks')
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль q отсортированной выборки (метод ближайшего ранга)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Перцентили задержки в миллисекундах и пропускная способность"""
+    values = sorted(latencies)
+    result: Dict[str, float] = {'ops': len(values)}
+    for q in PERCENTILES:
+        result[f'p{q}_ms'] = round(percentile(values, q) * 1000, 4)
+    result['mean_ms'] = round(sum(values) / len(values) * 1000, 4) if values else 0.0
+    result['ops_per_sec'] = round(len(values) / elapsed, 2) if elapsed > 0 else 0.0
+    return result
+
+
+def measure(operation: Callable[[], Any], ops: int,
+            warmup: Optional[int] = None) -> Dict[str, float]:
+    """Выполнить операцию ops раз и измерить задержку каждого вызова"""
+    warmup = int(ops * WARMUP_FRACTION) if warmup is None else warmup
+    for _ in range(warmup):
+        operation()
+
+    clock = time.perf_counter
+    latencies = []
+    started = clock()
+    for _ in range(ops):
+        start = clock()
+        operation()
+        latencies.append(clock() - start)
+    return summarize(latencies, clock() - started)
+
+
+def workloads(api: LibraryAPI, catalog: Catalog, seed: int) -> Dict[str, Callable[[], Any]]:
+    """Сценарии нагрузки; аргументы вызовов выбираются детерминированно по seed"""
+    rng = random.Random(f"{seed}:workload")
+
+    def search_text():
+        words = rng.sample(catalog.title_words, rng.randint(1, 2))
+        api.search_books(" ".join(words), limit=20)
+
+    def search_filtered():
+        if rng.random() < 0.5:
+            api.search_books(author=rng.choice(catalog.authors), limit=20)
+        else:
+            api.search_books(genre=rng.choice(catalog.genres),
+                             year=rng.randint(1850, 2025), limit=20)
+
+    def reserve():
+        api.db.reserve_book(rng.randint(1, catalog.books), rng.randint(1, catalog.users))
+
+    def user_reservations():
+        api.db.get_user_reservations(rng.randint(1, catalog.users))
+
+    def login():
+        username = catalog.username(rng.randrange(catalog.users))
+        if api.login_with_token(username, PASSWORD) is None:
+            raise RuntimeError(f"Не удалось войти как {username}: каталог собран иначе")
+
+    return {
+        'search_text': search_text,
+        'search_filtered': search_filtered,
+        'reserve': reserve,
+        'user_reservations': user_reservations,
+        'login': login,
+    }
+
+
+def prepare_catalog(data_dir: str, size: str, seed: int, profile: str) -> str:
+    """Путь к базе с каталогом; база строится, если её ещё нет в data_dir"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"catalog-{size}-seed{seed}-{profile}.db")
+    if os.path.exists(path):
+        return path
+
+    print(f"⏳ Генерация каталога {size} (seed {seed}) в {path}", file=sys.stderr)
+    started = time.perf_counter()
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.unlink(partial)
+    build_catalog(partial, size, seed, profile)
+    # Недостроенная база не должна попасть в кэш, поэтому переименование в конце
+    os.replace(partial, path)
+    print(f"   готово за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+    return path
+
+
+def run_benchmarks(size: str = '10k', seed: int = 42, ops: int = DEFAULT_OPS,
+                   login_ops: int = DEFAULT_LOGIN_OPS, profile: str = 'balanced',
+                   cache: bool = False, instrument: bool = False,
+                   only: Optional[List[str]] = None,
+                   data_dir: str = DEFAULT_DATA_DIR) -> Dict[str, Any]:
+    """Выполнить сценарии и вернуть результаты в виде, пригодном для JSON
+
+    По умолчанию кэши поиска и пользователей отключены, чтобы замеры
+    отражали сами запросы к БД; cache=True измеряет конфигурацию по умолчанию.
+    instrument=True включает замеры запросов DatabaseManager: сравнение
+    с базовым прогоном без них показывает их накладные расходы.
+    """
+    catalog = catalog_spec(size, seed)
+    source = prepare_catalog(data_dir, size, seed, profile)
+    db_options = {} if cache else {'search_cache_size': 0, 'user_cache_size': 0}
+    if instrument:
+        db_options['instrument'] = True
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, os.path.basename(source))
+        shutil.copyfile(source, db_path)
+        api = LibraryAPI(db_path, profile=profile, **db_options)
+        try:
+            for name, operation in workloads(api, catalog, seed).items():
+                if only and name not in only:
+                    continue
+                results[name] = measure(operation, login_ops if name == 'login' else ops)
+        finally:
+            api.close()
+
+    return {
+        'meta': {
+            'size': size,
+            'seed': seed,
+            'profile': profile,
+            'cache': cache,
+            'instrument': instrument,
+            'books': catalog.books,
+            'users': catalog.users,
+            'reservations': catalog.reservations,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Показатели, ухудшившиеся относительно базового прогона больше чем на threshold
+
+    Сравниваются только сценарии, присутствующие в обоих прогонах.
+    Прогоны с разными параметрами (COMPARABLE_META) сравнивать нельзя —
+    в этом случае выбрасывается ValueError.
+    """
+    for key in COMPARABLE_META:
+        if current['meta'].get(key) != baseline['meta'].get(key):
+            raise ValueError(
+                f"Базовый прогон выполнен с другим параметром {key}: "
+                f"{baseline['meta'].get(key)} вместо {current['meta'].get(key)}"
+            )
+
+    regressions = []
+    for name, base in baseline['results'].items():
+        result = current['results'].get(name)
+        if result is None:
+            continue
+
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), result.get(metric)
+            if not old or not new:
+                continue
+            # Для пропускной способности хуже меньшее значение, для задержки — большее
+            change = old / new - 1 if metric == 'ops_per_sec' else new / old - 1
+            if change > threshold:
+                regressions.append(f"{name}.{metric}: {old} → {new} (хуже на {change:.0%})")
+    return regressions
+
+
+def print_results(report: Dict[str, Any]) -> None:
+    """Напечатать таблицу результатов"""
+    meta = report['meta']
+    print(f"📊 Каталог {meta['size']}: книг {meta['books']}, пользователей {meta['users']}, "
+          f"бронирований {meta['reservations']} (seed {meta['seed']}, {meta['profile']})")
+    print(f"   {'сценарий':<18} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10} {'оп/с':>10}")
+    for name, result in report['results'].items():
+        print(f"   {name:<18} {result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} "
+              f"{result['p99_ms']:>10.3f} {result['ops_per_sec']:>10.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарки библиотечного каталога')
+    parser.add_argument('--size', choices=list(SIZES), default='10k',
+                        help='Размер синтетического каталога')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Зерно генератора каталога и нагрузки')
+    parser.add_argument('--ops', type=int, default=DEFAULT_OPS,
+                        help='Число измеряемых операций на сценарий')
+    parser.add_argument('--login-ops', type=int, default=DEFAULT_LOGIN_OPS,
+                        help='Число измеряемых операций входа')
+    parser.add_argument('--profile', choices=list(STORAGE_PROFILES), default='balanced',
+                        help='Профиль хранения SQLite')
+    parser.add_argument('--with-cache', action='store_true',
+                        help='Не отключать кэши поиска и пользователей')
+    parser.add_argument('--instrument', action='store_true',
+                        help='Включить замеры запросов DatabaseManager')
+    parser.add_argument('--only', nargs='+',
+                        help='Выполнить только указанные сценарии')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR,
+                        help='Каталог для сгенерированных баз')
+    parser.add_argument('--output', help='Сохранить результаты в JSON-файл')
+    parser.add_argument('--baseline', help='JSON-файл базового прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Допустимое ухудшение относительно базового прогона (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        size=args.size, seed=args.seed, ops=args.ops, login_ops=args.login_ops,
+        profile=args.profile, cache=args.with_cache, instrument=args.instrument,
+        only=args.only, data_dir=args.data_dir
+    )
+    print_results(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.threshold)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 2
+
+        if regressions:
+            print(f"❌ Регрессия больше {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"✅ Регрессий больше {args.threshold:.0%} нет")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
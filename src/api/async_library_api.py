@@ -0,0 +1,194 @@
+"""
+Асинхронный фасад LibraryAPI для серверов на asyncio
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..auth.tokens import Identity
+from ..database.database_manager import BookPage
+from ..models.book import Book
+from ..models.reservation import Reservation, ReservationResult
+from ..models.user import User, UserRole
+from ..models.waitlist import WaitlistEntry
+from .library_api import LibraryAPI
+
+
+class AsyncLibraryAPI:
+    """Awaitable-версии основных методов LibraryAPI
+
+    sqlite3 блокирует поток на время запроса, поэтому вызовы выполняются
+    в выделенных пулах потоков, а корутины только ждут результата. Чтения
+    идут в пул размером с пул соединений на чтение, записи — в отдельный
+    пул из одного потока: SQLite всё равно допускает одного писателя, и
+    очередь бронирований не занимает потоки поиска. Тысячи медленных
+    клиентов стоят тысячи корутин, а число потоков остаётся постоянным.
+
+    Пользователь определяется только по токену: общий объект не хранит
+    текущего пользователя, поэтому login возвращает пару (пользователь, токен).
+    Хеширование паролей при входе и регистрации ждёт пул KDF без потока:
+    всплеск входов не отнимает у поиска потоки пула чтения.
+    """
+
+    def __init__(self, api: Optional[LibraryAPI] = None, read_workers: Optional[int] = None,
+                 **api_options: Any):
+        self.api = api or LibraryAPI(**api_options)
+        read_workers = read_workers or max(self.api.db.pool_size, 1)
+        self._readers = ThreadPoolExecutor(max_workers=read_workers,
+                                           thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    async def _run(self, executor: ThreadPoolExecutor, fn: Callable[..., Any],
+                   *args: Any, **kwargs: Any) -> Any:
+        """Выполнить блокирующий вызов в пуле и дождаться его в корутине"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    async def _kdf(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Вычислить KDF в пуле AuthenticationManager, не занимая потоков БД"""
+        kdf = self.api.auth.kdf
+        return await asyncio.wait_for(asyncio.wrap_future(kdf.submit(fn, *args)), kdf.timeout)
+
+    # === Книги ===
+
+    async def search_books(self, query: str = "", limit: Optional[int] = None,
+                           sort: str = "id", cursor: Optional[str] = None,
+                           **filters) -> List[Book]:
+        """Поиск книг по различным критериям"""
+        return await self._run(self._readers, self.api.search_books, query,
+                               limit=limit, sort=sort, cursor=cursor, **filters)
+
+    async def search_books_page(self, query: str = "", limit: Optional[int] = None,
+                                sort: str = "id", cursor: Optional[str] = None,
+                                use_cache: bool = True, **filters) -> BookPage:
+        """Страница результатов поиска с курсором на следующую страницу"""
+        return await self._run(self._readers, self.api.search_books_page, query,
+                               limit=limit, sort=sort, cursor=cursor,
+                               use_cache=use_cache, **filters)
+
+    async def catalog_version(self) -> int:
+        """Версия каталога, меняющаяся при любом изменении книг"""
+        return await self._run(self._readers, self.api.catalog_version)
+
+    async def get_books(self, book_ids: List[int]) -> List[Book]:
+        """Получить активные книги по списку ID одним запросом"""
+        return await self._run(self._readers, self.api.get_books, book_ids)
+
+    # === Бронирование ===
+
+    async def reserve_book(self, book_id: int, token: str) -> Optional[Reservation]:
+        """Забронировать книгу"""
+        return await self._run(self._writer, self.api.reserve_book, book_id, token=token)
+
+    async def try_reserve_book(self, book_id: int, token: str) -> Optional[ReservationResult]:
+        """Забронировать книгу с указанием причины отказа"""
+        return await self._run(self._writer, self.api.try_reserve_book, book_id, token=token)
+
+    async def reserve_books(self, book_ids: List[int], token: str,
+                            policy: str = "all_or_nothing") -> Optional[List[ReservationResult]]:
+        """Забронировать несколько книг одной транзакцией"""
+        return await self._run(self._writer, self.api.reserve_books, book_ids,
+                               policy=policy, token=token)
+
+    async def get_my_reservations(self, token: str) -> List[Reservation]:
+        """Получить бронирования пользователя из токена"""
+        return await self._run(self._readers, self.api.get_my_reservations, token=token)
+
+    # === Очередь ожидания ===
+
+    async def join_waitlist(self, book_id: int, token: str) -> Optional[WaitlistEntry]:
+        """Встать в очередь за книгой"""
+        return await self._run(self._writer, self.api.join_waitlist, book_id, token=token)
+
+    async def leave_waitlist(self, book_id: int, token: str) -> bool:
+        """Выйти из очереди за книгой"""
+        return await self._run(self._writer, self.api.leave_waitlist, book_id, token=token)
+
+    async def get_waitlist_position(self, book_id: int, token: str) -> Optional[int]:
+        """Место пользователя в очереди за книгой"""
+        return await self._run(self._readers, self.api.get_waitlist_position,
+                               book_id, token=token)
+
+    # === Отчёты ===
+
+    async def circulation_report(self, token: str, since: Optional[datetime] = None,
+                                 until: Optional[datetime] = None, limit: int = 10,
+                                 bucket: str = "week") -> Optional[Dict[str, Any]]:
+        """Отчёт об обороте фонда (только для админов)"""
+        return await self._run(self._readers, self.api.circulation_report, token,
+                               since, until, limit, bucket)
+
+    async def query_stats(self, token: str) -> Optional[Dict[str, Any]]:
+        """Замеры методов БД и медленные запросы (только для админов)"""
+        return await self._run(self._readers, self.api.query_stats, token)
+
+    # === Пользователи ===
+
+    async def login(self, username: str, password: str) -> Optional[Tuple[User, str]]:
+        """Проверить учётные данные и выпустить токен доступа
+
+        Повторяет AuthenticationManager.authenticate по шагам: запросы к БД
+        идут в пулы чтения и записи, а проверка пароля — в пул KDF, и
+        корутина ждёт её, не занимая поток пула чтения. При переполнении
+        очереди KDF выбрасывается AuthenticationBusyError.
+        """
+        auth = self.api.auth
+        user = await self._run(self._readers, auth.db.get_user_by_username, username)
+        if not user or not user.is_active:
+            return None
+
+        if not await self._kdf(auth.hasher.verify, password, user.password_hash):
+            return None
+
+        # Хеш со старыми параметрами пересчитываем, пока пароль известен
+        if auth.hasher.needs_rehash(user.password_hash):
+            user.password_hash = await self._kdf(auth.hasher.hash, password)
+            await self._run(self._writer, auth.db.update_user, user.id,
+                            password_hash=user.password_hash)
+
+        return user, auth.issue_token(user)
+
+    async def register(self, username: str, email: str, password: str,
+                       full_name: str, phone: str = None) -> Optional[User]:
+        """Регистрация нового пользователя
+
+        Почти всё время уходит на хеширование пароля в пуле KDF; пул чтения
+        занят только проверкой имени, пул записи — вставкой пользователя.
+        """
+        auth = self.api.auth
+        if await self._run(self._readers, auth.db.get_user_by_username, username):
+            return None
+
+        password_hash = await self._kdf(auth.hasher.hash, password)
+        user = User(id=0, username=username, email=email, password_hash=password_hash,
+                    role=UserRole.READER, full_name=full_name, phone=phone)
+        user_id = await self._run(self._writer, auth.db.add_user, user)
+        if not user_id:
+            return None
+
+        user.id = user_id
+        return user
+
+    async def resolve_token(self, token: str) -> Optional[Identity]:
+        """Пользователь, которому выдан токен, или None для недействительного токена"""
+        return await self._run(self._readers, self.api.resolve_token, token)
+
+    # === Служебное ===
+
+    async def close(self) -> None:
+        """Дождаться текущих вызовов и закрыть соединения"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    def _shutdown(self) -> None:
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self.api.close()
+
+    async def __aenter__(self) -> "AsyncLibraryAPI":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
@@ -0,0 +1,131 @@
+"""
+Потоковый импорт каталога книг из CSV и JSONL
+"""
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from ..database.database_manager import BulkImportResult, DatabaseManager
+from ..models.book import Book
+
+# Поддерживаемые форматы файлов каталога
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Как часто сообщать о ходе импорта, строк
+PROGRESS_EVERY = 10000
+
+
+def book_from_record(record: Dict[str, Any]) -> Book:
+    """Создать книгу из записи файла каталога
+
+    Обязательные поля: title, author, year, isbn. Если available не указан,
+    все экземпляры считаются доступными.
+    """
+    missing = [
+        field for field in ('title', 'author', 'year', 'isbn')
+        if not str(record.get(field) or '').strip()
+    ]
+    if missing:
+        raise ValueError(f"Не заполнены обязательные поля: {', '.join(missing)}")
+
+    quantity = int(record.get('quantity') or 1)
+    available = record.get('available')
+
+    return Book(
+        id=0,
+        title=str(record['title']).strip(),
+        author=str(record['author']).strip(),
+        year=int(record['year']),
+        isbn=str(record['isbn']).strip(),
+        publisher=record.get('publisher') or '',
+        genre=record.get('genre') or '',
+        pages=int(record.get('pages') or 0),
+        quantity=quantity,
+        available=quantity if available in (None, '') else int(available)
+    )
+
+
+def iter_csv_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Читать записи из CSV с заголовком построчно"""
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.DictReader(f)
+
+
+def iter_jsonl_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Читать записи из JSONL (один JSON-объект на строку) построчно"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def detect_format(path: str) -> str:
+    """Определить формат файла каталога по расширению"""
+    suffix = Path(path).suffix.lower().lstrip('.')
+    if suffix == 'ndjson':
+        suffix = 'jsonl'
+    if suffix not in IMPORT_FORMATS:
+        raise ValueError(f"Не удалось определить формат файла: {path}")
+    return suffix
+
+
+class ImportProgress:
+    """Счётчик хода импорта: прочитанные и отброшенные строки, скорость"""
+
+    def __init__(self, report: Optional[Callable[['ImportProgress'], None]] = None,
+                 every: int = PROGRESS_EVERY):
+        self.report = report
+        self.every = every
+        self.rows_read = 0
+        self.invalid_rows = 0
+        self.started_at = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        """Секунд с начала импорта"""
+        return time.perf_counter() - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        """Скорость чтения строк"""
+        elapsed = self.elapsed
+        return self.rows_read / elapsed if elapsed > 0 else 0.0
+
+    def iter_books(self, records: Iterable[Dict[str, Any]]) -> Iterator[Book]:
+        """Преобразовать записи в книги, пропуская некорректные строки"""
+        for record in records:
+            self.rows_read += 1
+            try:
+                book = book_from_record(record)
+            except (ValueError, TypeError):
+                self.invalid_rows += 1
+            else:
+                yield book
+
+            if self.report and self.rows_read % self.every == 0:
+                self.report(self)
+
+
+def import_catalog(db: DatabaseManager, path: str, file_format: Optional[str] = None,
+                   on_duplicate: str = "skip", chunk_size: int = 1000,
+                   progress: Optional[ImportProgress] = None) -> BulkImportResult:
+    """Импортировать каталог из файла одной транзакцией
+
+    Файл читается построчно и передаётся в add_books_bulk генератором,
+    поэтому в памяти одновременно находится не больше одной пачки книг.
+    """
+    file_format = file_format or detect_format(path)
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат: {file_format}")
+
+    records = iter_csv_records(path) if file_format == 'csv' else iter_jsonl_records(path)
+    progress = progress or ImportProgress()
+
+    return db.add_books_bulk(
+        progress.iter_books(records),
+        on_duplicate=on_duplicate,
+        chunk_size=chunk_size
+    )
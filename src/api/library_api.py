@@ -1,27 +1,41 @@
 """
 API для работы с библиотечной системой
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
 from ..models.book import Book
 from ..models.user import User, UserRole
-from ..models.reservation import Reservation, ReservationStatus
-from ..database.database_manager import DatabaseManager
+from ..models.reservation import Reservation, ReservationResult, ReservationStatus
+from ..models.waitlist import WaitlistEntry
+from ..database.database_manager import BookPage, BulkImportResult, DatabaseManager
+from ..database.reservation_sweeper import ReservationSweeper
+from ..reports.circulation_report import CirculationReport
+from .catalog_import import book_from_record
 from ..auth.authentication import AuthenticationManager
+from ..auth.tokens import Identity
 
 
 class LibraryAPI:
-    """Основной API для работы с библиотечной системой"""
+    """Основной API для работы с библиотечной системой
     
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.auth = AuthenticationManager(self.db)
+    Методы, требующие авторизации, принимают необязательный token. С токеном
+    пользователь определяется по нему, и один объект API можно безопасно
+    использовать из многих потоков для разных пользователей. Без токена
+    используется текущий пользователь сеанса (консольный интерфейс).
+    """
+    
+    def __init__(self, db_path: str = "book_catalog.db", profile: str = "durable",
+                 token_secret: str = None, **db_options):
+        # db_options передаются DatabaseManager (размер пула, кэши)
+        self.db = DatabaseManager(db_path, profile=profile, **db_options)
+        self.auth = AuthenticationManager(self.db, token_secret=token_secret)
+        self.sweeper: Optional[ReservationSweeper] = None
     
     # === Книги ===
     
-    def add_new_book(self, **book_data) -> Optional[Book]:
+    def add_new_book(self, token: str = None, **book_data) -> Optional[Book]:
         """Добавить новую книгу (только для админов)"""
-        if not self.auth.is_admin():
+        if not self.auth.is_admin(token):
             return None
         
         try:
@@ -47,59 +61,88 @@ class LibraryAPI:
         
         return None
     
-    def search_books(self, query: str = "", **filters) -> List[Book]:
+    def add_books_bulk(self, books_data: Iterable[Dict[str, Any]],
+                       on_duplicate: str = "skip",
+                       token: str = None) -> Optional[BulkImportResult]:
+        """Массово добавить книги одной транзакцией (только для админов)"""
+        if not self.auth.is_admin(token):
+            return None
+        
+        books = (book_from_record(book_data) for book_data in books_data)
+        return self.db.add_books_bulk(books, on_duplicate=on_duplicate)
+    
+    def search_books(self, query: str = "", limit: Optional[int] = None,
+                     sort: str = "id", cursor: Optional[str] = None,
+                     **filters) -> List[Book]:
         """Поиск книг по различным критериям"""
-        return self.db.search_books(query, **filters)
+        return self.db.search_books(query, limit=limit, sort=sort, cursor=cursor, **filters)
+    
+    def get_book(self, book_id: int) -> Optional[Book]:
+        """Получить активную книгу по ID"""
+        return self.db.get_book_by_id(book_id, active_only=True)
+    
+    def get_books(self, book_ids: Iterable[int]) -> List[Book]:
+        """Получить активные книги по списку ID одним запросом"""
+        with self.db.identity_map():
+            return self.db.get_books_by_ids(book_ids, active_only=True)
+    
+    def iter_search_books(self, query: str = "", sort: str = "id",
+                          **filters) -> Iterator[Book]:
+        """Поиск книг с ленивой выдачей результатов (для выгрузок и отчётов)"""
+        return self.db.iter_search_books(query, sort=sort, **filters)
+    
+    def search_books_page(self, query: str = "", limit: Optional[int] = None,
+                          sort: str = "id", cursor: Optional[str] = None,
+                          use_cache: bool = True, **filters) -> BookPage:
+        """Страница результатов поиска с курсором на следующую страницу"""
+        return self.db.search_books_page(query, limit=limit, sort=sort, cursor=cursor,
+                                         use_cache=use_cache, **filters)
     
-    def write_off_book(self, book_id: int) -> bool:
+    def catalog_version(self) -> int:
+        """Версия каталога, меняющаяся при любом изменении книг"""
+        return self.db.catalog_version()
+    
+    def write_off_book(self, book_id: int, token: str = None) -> bool:
         """Списать книгу (только для админов)"""
-        if not self.auth.is_admin():
+        if not self.auth.is_admin(token):
             return False
         
         return self.db.write_off_book(book_id)
     
     # === Бронирование ===
     
-    def reserve_book(self, book_id: int) -> Optional[Reservation]:
+    def reserve_book(self, book_id: int, token: str = None) -> Optional[Reservation]:
         """Забронировать книгу"""
-        if not self.auth.can_borrow_books():
-            return None
-        
-        # Проверяем доступность книги
-        books = self.db.search_books(id=book_id)
-        if not books:
-            return None
+        result = self.try_reserve_book(book_id, token)
+        return result.reservation if result else None
+    
+    def try_reserve_book(self, book_id: int, token: str = None) -> Optional[ReservationResult]:
+        """Забронировать книгу с указанием причины отказа
         
-        book = books[0]
-        if book.available <= 0:
+        Возвращает None, если пользователь не может брать книги.
+        """
+        principal = self.auth.principal(token)
+        if principal is None or not principal.can_borrow():
             return None
         
-        # Создаём бронирование
-        reservation = Reservation(
-            id=0,
-            book_id=book_id,
-            user_id=self.auth.current_user.id,
-            status=ReservationStatus.PENDING,
-            reservation_date=datetime.now(),
-            pickup_deadline=None
-        )
+        return self.db.reserve_book(book_id, principal.id)
+    
+    def reserve_books(self, book_ids: Iterable[int], policy: str = "all_or_nothing",
+                      token: str = None) -> Optional[List[ReservationResult]]:
+        """Забронировать несколько книг одной транзакцией
         
-        # Сохраняем в БД
-        reservation_id = self.db.create_reservation(reservation)
-        if reservation_id:
-            reservation.id = reservation_id
-            
-            # Уменьшаем количество доступных книг
-            book.borrow()
-            self.db.update_book(book_id, available=book.available)
-            
-            return reservation
+        Возвращает итоги по книгам в порядке запроса без повторов или None,
+        если пользователь не может брать книги.
+        """
+        principal = self.auth.principal(token)
+        if principal is None or not principal.can_borrow():
+            return None
         
-        return None
+        return self.db.reserve_books(book_ids, principal.id, policy=policy)
     
-    def confirm_reservation(self, reservation_id: int) -> bool:
+    def confirm_reservation(self, reservation_id: int, token: str = None) -> bool:
         """Подтвердить бронирование (только для админов)"""
-        if not self.auth.is_admin():
+        if not self.auth.is_admin(token):
             return False
         
         # В реальном проекте здесь была бы логика подтверждения
@@ -113,12 +156,108 @@ class LibraryAPI:
             pickup_deadline
         )
     
-    def get_my_reservations(self) -> List[Reservation]:
+    def cancel_reservation(self, reservation_id: int, token: str = None) -> bool:
+        """Отменить бронирование (своё или любое для админа)
+        
+        Экземпляр книги сразу снова становится доступным.
+        """
+        principal = self.auth.principal(token)
+        if principal is None:
+            return False
+        
+        reservation = self.db.get_reservation(reservation_id)
+        if reservation is None:
+            return False
+        if reservation.user_id != principal.id and not principal.is_admin():
+            return False
+        
+        return self.db.update_reservation_status(reservation_id, ReservationStatus.CANCELLED)
+    
+    def return_book(self, book_id: int, token: str = None) -> bool:
+        """Принять возвращённый экземпляр (только для админов)
+        
+        Экземпляр сразу бронируется на первого в очереди за книгой.
+        """
+        if not self.auth.is_admin(token):
+            return False
+        
+        return self.db.return_book(book_id)
+    
+    # === Очередь ожидания ===
+    
+    def join_waitlist(self, book_id: int, token: str = None) -> Optional[WaitlistEntry]:
+        """Встать в очередь за книгой, у которой нет свободных экземпляров
+        
+        Освободившийся экземпляр бронируется на первого в очереди
+        автоматически, повторять попытки бронирования не нужно. Возвращает
+        None, если пользователь не может брать книги или книга не найдена.
+        """
+        principal = self.auth.principal(token)
+        if principal is None or not principal.can_borrow():
+            return None
+        
+        return self.db.join_waitlist(book_id, principal.id)
+    
+    def leave_waitlist(self, book_id: int, token: str = None) -> bool:
+        """Выйти из очереди за книгой"""
+        principal = self.auth.principal(token)
+        if principal is None:
+            return False
+        
+        return self.db.leave_waitlist(book_id, principal.id)
+    
+    def get_waitlist_position(self, book_id: int, token: str = None) -> Optional[int]:
+        """Моё место в очереди за книгой (с 1) или None, если я не в очереди"""
+        principal = self.auth.principal(token)
+        if principal is None:
+            return None
+        
+        return self.db.waitlist_position(book_id, principal.id)
+    
+    def start_expiry_sweeper(self, interval: float = 60.0,
+                             batch_size: int = 100) -> ReservationSweeper:
+        """Запустить фоновую отмену просроченных бронирований
+        
+        Сборщик останавливается при закрытии API.
+        """
+        if self.sweeper is None:
+            self.sweeper = ReservationSweeper(self.db, interval=interval, batch_size=batch_size)
+        self.sweeper.start()
+        return self.sweeper
+    
+    def get_my_reservations(self, token: str = None) -> List[Reservation]:
         """Получить мои бронирования"""
-        if not self.auth.is_authenticated():
+        principal = self.auth.principal(token)
+        if principal is None:
             return []
         
-        return self.db.get_user_reservations(self.auth.current_user.id)
+        return self.db.get_user_reservations(principal.id)
+    
+    # === Отчёты ===
+    
+    def circulation_report(self, token: str = None, since: Optional[datetime] = None,
+                           until: Optional[datetime] = None, limit: int = 10,
+                           bucket: str = "week") -> Optional[Dict[str, Any]]:
+        """Отчёт об обороте фонда за период (только для админов)
+        
+        Состав отчёта описан в CirculationReport.to_dict. Данные читаются
+        через соединения для чтения и не задерживают бронирования.
+        """
+        if not self.auth.is_admin(token):
+            return None
+        
+        return CirculationReport.load(self.db, since, until).to_dict(limit, bucket)
+    
+    def query_stats(self, token: str = None) -> Optional[Dict[str, Any]]:
+        """Замеры методов БД и последние медленные запросы (только для админов)
+        
+        Замеры собираются, если DatabaseManager создан с instrument=True;
+        иначе возвращаются пустые показатели.
+        """
+        if not self.auth.is_admin(token):
+            return None
+        
+        return {'stats': self.db.query_stats(), 'slow_queries': self.db.slow_queries()}
     
     # === Пользователи ===
     
@@ -134,6 +273,21 @@ class LibraryAPI:
         """Вход в систему"""
         return self.auth.login(username, password)
     
+    def login_with_token(self, username: str, password: str) -> Optional[Tuple[User, str]]:
+        """Проверить учётные данные и выпустить токен доступа
+        
+        В отличие от login, не меняет текущего пользователя сеанса.
+        """
+        user = self.auth.authenticate(username, password)
+        if not user:
+            return None
+        
+        return user, self.auth.issue_token(user)
+    
+    def resolve_token(self, token: str) -> Optional[Identity]:
+        """Пользователь, которому выдан токен, или None для недействительного токена"""
+        return self.auth.resolve_token(token)
+    
     def logout(self) -> None:
         """Выход из системы"""
         self.auth.logout()
@@ -144,4 +298,7 @@ class LibraryAPI:
     
     def close(self) -> None:
         """Закрыть соединения"""
+        if self.sweeper is not None:
+            self.sweeper.stop()
+        self.auth.close()
         self.db.close()
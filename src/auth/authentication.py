@@ -1,28 +1,47 @@
 """
 Система аутентификации и авторизации
 """
-import hashlib
+import os
 import secrets
-from typing import Optional, Tuple
+from typing import Optional, Union
 from ..models.user import User, UserRole
 from ..database.database_manager import DatabaseManager
+from .password_hashing import KdfExecutor, PasswordHasher
+from .tokens import Identity, TokenSigner
+
+# Переменная окружения с секретом подписи токенов. Если она не задана,
+# секрет генерируется при запуске и токены действуют только в этом процессе.
+TOKEN_SECRET_ENV = "LIBRARY_TOKEN_SECRET"
 
 
 class AuthenticationManager:
     """Менеджер аутентификации"""
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, token_secret: str = None,
+                 token_ttl: int = 3600, password_hasher: PasswordHasher = None,
+                 kdf_workers: int = 2, kdf_queue_limit: int = 32):
         self.db = db_manager
         self.current_user: Optional[User] = None
+        
+        secret = token_secret or os.environ.get(TOKEN_SECRET_ENV) or secrets.token_bytes(32)
+        self.tokens = TokenSigner(secret, ttl=token_ttl)
+        
+        # Хеширование и проверка паролей выполняются в отдельном пуле:
+        # при всплеске входов потоки обработчиков остаются свободными
+        # для поиска, а сверх kdf_queue_limit запросы сразу отклоняются
+        self.hasher = password_hasher or PasswordHasher()
+        self.kdf = KdfExecutor(max_workers=kdf_workers, max_pending=kdf_queue_limit)
     
-    @staticmethod
-    def hash_password(password: str, salt: str = None) -> Tuple[str, str]:
-        """Хешировать пароль с солью"""
-        if salt is None:
-            salt = secrets.token_hex(16)
+    def hash_password(self, password: str) -> str:
+        """Хешировать пароль текущим алгоритмом
         
-        password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-        return password_hash, salt
+        Может выбросить AuthenticationBusyError, если очередь пула переполнена.
+        """
+        return self.kdf.run(self.hasher.hash, password)
+    
+    def verify_password(self, password: str, password_hash: str) -> bool:
+        """Проверить пароль по сохранённому хешу"""
+        return self.kdf.run(self.hasher.verify, password, password_hash)
     
     def register_user(self, username: str, email: str, password: str, 
                      full_name: str, role: UserRole = UserRole.READER, 
@@ -34,7 +53,7 @@ class AuthenticationManager:
             return None
         
         # Хешируем пароль
-        password_hash, _ = self.hash_password(password)
+        password_hash = self.hash_password(password)
         
         # Создаём пользователя
         user = User(
@@ -55,32 +74,80 @@ class AuthenticationManager:
         
         return None
     
-    def login(self, username: str, password: str) -> Optional[User]:
-        """Аутентификация пользователя"""
+    def authenticate(self, username: str, password: str) -> Optional[User]:
+        """Проверить учётные данные, не меняя текущего пользователя"""
         user = self.db.get_user_by_username(username)
         if not user or not user.is_active:
             return None
         
-        # Проверяем пароль (в реальном проекте нужно хранить соль отдельно)
-        password_hash, _ = self.hash_password(password)
-        if user.password_hash == password_hash:
-            self.current_user = user
-            return user
+        if not self.verify_password(password, user.password_hash):
+            return None
         
-        return None
+        # Хеш со старыми параметрами пересчитываем, пока пароль известен
+        if self.hasher.needs_rehash(user.password_hash):
+            user.password_hash = self.hash_password(password)
+            self.db.update_user(user.id, password_hash=user.password_hash)
+        
+        return user
+    
+    def login(self, username: str, password: str) -> Optional[User]:
+        """Аутентификация пользователя"""
+        user = self.authenticate(username, password)
+        if user:
+            self.current_user = user
+        return user
     
     def logout(self) -> None:
         """Выход из системы"""
         self.current_user = None
     
-    def is_authenticated(self) -> bool:
+    def close(self) -> None:
+        """Остановить пул хеширования паролей"""
+        self.kdf.shutdown()
+    
+    # === Токены доступа ===
+    
+    def issue_token(self, user: User) -> str:
+        """Выпустить подписанный токен доступа для пользователя"""
+        return self.tokens.issue(user)
+    
+    def resolve_token(self, token: str) -> Optional[Identity]:
+        """Установить пользователя по токену
+        
+        Подпись проверяется без обращения к БД, а сам пользователь берётся
+        из кэша: токен заблокированного пользователя или пользователя со
+        сменившейся ролью перестаёт действовать в пределах ttl кэша.
+        """
+        identity = self.tokens.verify(token)
+        if identity is None:
+            return None
+        
+        user = self.db.get_user_by_id(identity.id)
+        if not user or not user.is_active or user.role != identity.role:
+            return None
+        
+        return identity
+    
+    def principal(self, token: str = None) -> Optional[Union[User, Identity]]:
+        """Пользователь, от имени которого выполняется действие
+        
+        Если передан токен, пользователь определяется только по нему;
+        иначе используется текущий пользователь консольного сеанса.
+        """
+        if token is not None:
+            return self.resolve_token(token)
+        return self.current_user
+    
+    def is_authenticated(self, token: str = None) -> bool:
         """Проверить, аутентифицирован ли пользователь"""
-        return self.current_user is not None
+        return self.principal(token) is not None
     
-    def is_admin(self) -> bool:
+    def is_admin(self, token: str = None) -> bool:
         """Проверить, является ли текущий пользователь администратором"""
-        return self.is_authenticated() and self.current_user.is_admin()
+        principal = self.principal(token)
+        return principal is not None and principal.is_admin()
     
-    def can_borrow_books(self) -> bool:
+    def can_borrow_books(self, token: str = None) -> bool:
         """Может ли пользователь брать книги"""
-        return self.is_authenticated() and self.current_user.can_borrow()
+        principal = self.principal(token)
+        return principal is not None and principal.can_borrow()
@@ -0,0 +1,196 @@
+"""
+Хеширование паролей медленными функциями (KDF) и пул для их вычисления
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Поддерживаемые алгоритмы и параметры стоимости по умолчанию
+KDF_DEFAULTS = {
+    'scrypt': {'n': 2 ** 14, 'r': 8, 'p': 1},
+    'pbkdf2_sha256': {'i': 600000},
+}
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+class AuthenticationBusyError(Exception):
+    """Очередь проверки паролей переполнена, запрос нужно повторить позже"""
+
+
+class PasswordHasher:
+    """Хеширование паролей в версионированном формате
+
+    Хеш хранится строкой вида алгоритм$параметры$соль$хеш, например
+    scrypt$n=16384,r=8,p=1$<соль>$<хеш>. Параметры стоимости записаны в
+    самом хеше, поэтому после их изменения старые хеши продолжают
+    проверяться, а needs_rehash сообщает, что хеш пора пересчитать.
+    """
+
+    def __init__(self, algorithm: str = 'scrypt', **params: int):
+        if algorithm not in KDF_DEFAULTS:
+            raise ValueError(
+                f"Неизвестный алгоритм: {algorithm}. Доступны: {', '.join(KDF_DEFAULTS)}"
+            )
+
+        unknown = set(params) - set(KDF_DEFAULTS[algorithm])
+        if unknown:
+            raise ValueError(f"Неизвестные параметры {algorithm}: {', '.join(sorted(unknown))}")
+
+        self.algorithm = algorithm
+        self.params = {**KDF_DEFAULTS[algorithm], **params}
+
+    def hash(self, password: str) -> str:
+        """Вычислить хеш пароля со случайной солью"""
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = _derive(self.algorithm, self.params, password, salt)
+        return "$".join([
+            self.algorithm,
+            ",".join(f"{key}={value}" for key, value in self.params.items()),
+            _b64encode(salt),
+            _b64encode(digest),
+        ])
+
+    def verify(self, password: str, stored_hash: str) -> bool:
+        """Проверить пароль по хешу с любыми параметрами стоимости"""
+        parsed = _parse(stored_hash)
+        if parsed is None:
+            return False
+
+        algorithm, params, salt, expected = parsed
+        try:
+            digest = _derive(algorithm, params, password, salt, len(expected))
+        except (ValueError, MemoryError):
+            return False
+
+        return hmac.compare_digest(digest, expected)
+
+    def needs_rehash(self, stored_hash: str) -> bool:
+        """Отличаются ли алгоритм или стоимость хеша от текущих настроек"""
+        parsed = _parse(stored_hash)
+        if parsed is None:
+            return True
+
+        algorithm, params, _, _ = parsed
+        return algorithm != self.algorithm or params != self.params
+
+
+class KdfExecutor:
+    """Ограниченный пул потоков для вычисления KDF
+
+    hashlib выполняет scrypt и PBKDF2 без GIL, поэтому вычисления в пуле
+    не останавливают остальные потоки сервера. Число задач в очереди
+    ограничено: при всплеске входов лишние запросы сразу получают
+    AuthenticationBusyError, а не занимают потоки обработчиков.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32,
+                 timeout: Optional[float] = 30.0):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="kdf")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'pending': 0}
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Выполнить функцию в пуле и дождаться результата"""
+        return self.submit(fn, *args).result(timeout=self.timeout)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Поставить функцию в очередь пула, не дожидаясь результата
+
+        Корутины ждут возвращённый Future через asyncio.wrap_future и не
+        занимают поток на время вычисления.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise AuthenticationBusyError("Слишком много одновременных проверок пароля")
+
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['pending'] += 1
+
+        try:
+            future = self._executor.submit(self._call, fn, args)
+        except BaseException:
+            self._release()
+            raise
+
+        # Отменённая до запуска задача не выполнит _call и не освободит место сама
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _call(self, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+        """Выполнить задачу и освободить её место в очереди"""
+        try:
+            return fn(*args)
+        finally:
+            self._release()
+
+    def _release_cancelled(self, future: Future) -> None:
+        """Освободить место отменённой задачи"""
+        if future.cancelled():
+            self._release()
+
+    def _release(self) -> None:
+        """Освободить место в очереди"""
+        with self._lock:
+            self._stats['pending'] -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики принятых, отклонённых и ожидающих задач"""
+        with self._lock:
+            return dict(self._stats, max_pending=self.max_pending)
+
+    def shutdown(self) -> None:
+        """Остановить пул после завершения текущих задач"""
+        self._executor.shutdown(wait=True)
+
+
+def _derive(algorithm: str, params: Dict[str, int], password: str, salt: bytes,
+            length: int = HASH_BYTES) -> bytes:
+    """Вычислить ключ выбранной функцией"""
+    secret = password.encode('utf-8')
+    if algorithm == 'scrypt':
+        n, r, p = params['n'], params['r'], params['p']
+        return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=length)
+    if algorithm == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', secret, salt, params['i'], dklen=length)
+    raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+
+
+def _parse(stored_hash: str) -> Optional[Tuple[str, Dict[str, int], bytes, bytes]]:
+    """Разобрать хеш в формате алгоритм$параметры$соль$хеш"""
+    parts = (stored_hash or "").split("$")
+    if len(parts) != 4 or parts[0] not in KDF_DEFAULTS:
+        return None
+
+    algorithm, raw_params, salt, digest = parts
+    try:
+        params = {
+            key: int(value)
+            for key, value in (item.split("=", 1) for item in raw_params.split(","))
+        }
+        if set(params) != set(KDF_DEFAULTS[algorithm]):
+            return None
+        return algorithm, params, _b64decode(salt), _b64decode(digest)
+    except ValueError:
+        return None
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
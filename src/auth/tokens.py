@@ -0,0 +1,89 @@
+"""
+Подписанные токены доступа без хранения состояния на сервере
+"""
+import base64
+import hashlib
+import hmac
+import time
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from ..models.user import User, UserRole
+
+# Версия формата токена: меняется при несовместимом изменении полей
+TOKEN_VERSION = "v1"
+
+
+@dataclass(frozen=True)
+class Identity:
+    """Пользователь, установленный по токену доступа
+
+    Повторяет проверки прав User, поэтому может использоваться вместо него
+    там, где нужна только авторизация.
+    """
+    id: int
+    role: UserRole
+    expires_at: int
+
+    def is_admin(self) -> bool:
+        """Является ли пользователь администратором"""
+        return self.role == UserRole.ADMIN
+
+    def can_borrow(self) -> bool:
+        """Может ли пользователь брать книги
+
+        Блокировку пользователя проверяет AuthenticationManager.resolve_token.
+        """
+        return self.role == UserRole.READER
+
+
+class TokenSigner:
+    """Выпуск и проверка токенов вида v1.<id>.<роль>.<срок>.<подпись>
+
+    Подпись — HMAC-SHA256 от остальных полей, поэтому проверка токена
+    не обращается к базе и занимает микросекунды.
+    """
+
+    def __init__(self, secret: Union[str, bytes], ttl: int = 3600):
+        if not secret:
+            raise ValueError("Секрет для подписи токенов не может быть пустым")
+
+        self._secret = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.ttl = ttl
+
+    def issue(self, user: User, now: Optional[float] = None) -> str:
+        """Выпустить токен для пользователя"""
+        now = time.time() if now is None else now
+        payload = f"{TOKEN_VERSION}.{int(user.id)}.{user.role.value}.{int(now) + self.ttl}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str, now: Optional[float] = None) -> Optional[Identity]:
+        """Проверить токен; None, если подпись неверна или срок истёк"""
+        if not token or token.count('.') != 4:
+            return None
+
+        payload, _, signature = token.rpartition('.')
+        if not hmac.compare_digest(signature.encode('utf-8'),
+                                   self._sign(payload).encode('utf-8')):
+            return None
+
+        version, user_id, role, expires_at = payload.split('.')
+        if version != TOKEN_VERSION:
+            return None
+
+        try:
+            identity = Identity(id=int(user_id), role=UserRole(role),
+                                expires_at=int(expires_at))
+        except ValueError:
+            return None
+
+        now = time.time() if now is None else now
+        if identity.expires_at <= now:
+            return None
+
+        return identity
+
+    def _sign(self, payload: str) -> str:
+        """Подпись полезной нагрузки токена"""
+        digest = hmac.new(self._secret, payload.encode('utf-8'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')
@@ -0,0 +1,314 @@
+"""
+Кэши в памяти для DatabaseManager
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from ..models.book import Book
+from ..models.user import User
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Ограниченный потокобезопасный LRU-кэш со временем жизни записей
+
+    При переполнении вытесняется запись, к которой дольше всего не
+    обращались. Записи старше ttl секунд считаются отсутствующими.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        if maxsize <= 0:
+            raise ValueError("Размер кэша должен быть положительным")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, key: Hashable, default: Any = None,
+            validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Получить значение по ключу
+
+        validate позволяет отбросить запись, которая устарела не по
+        времени, а по внешним признакам; такая запись удаляется и
+        засчитывается как промах.
+        """
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self._stats['misses'] += 1
+                return default
+
+            stored_at, value = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return default
+
+            if validate is not None and not validate(value):
+                del self._data[key]
+                self._stats['invalidations'] += 1
+                self._stats['misses'] += 1
+                return default
+
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Сохранить значение, вытеснив самую старую запись при переполнении"""
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def pop(self, key: Hashable) -> None:
+        """Удалить запись, если она есть"""
+        with self._lock:
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self._stats['invalidations'] += 1
+
+    def clear(self) -> None:
+        """Удалить все записи"""
+        with self._lock:
+            self._data.clear()
+
+    def discard(self, keep: Callable[[Any], bool]) -> None:
+        """Удалить записи, значения которых не проходят проверку keep"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if not keep(value)]
+            for key in stale:
+                del self._data[key]
+            self._stats['invalidations'] += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий, промахов и вытеснений"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        stats['maxsize'] = self.maxsize
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SearchCache:
+    """Кэш результатов поиска книг с точечной инвалидацией
+
+    Каждая запись в базе увеличивает общий счётчик записей. Изменённой
+    книге присваивается поколение, равное новому значению счётчика, а
+    результат поиска запоминает значение счётчика на момент перед
+    выполнением SQL. Результат устарел, если после этого изменилась
+    хотя бы одна из вошедших в него книг.
+
+    Изменения, которые могут добавить книгу в чужую выдачу (новая книга,
+    правка названия, автора, жанра и т. п.), повышают поколение состава
+    каталога и делают устаревшими все результаты. Изменения наличия
+    экземпляров затрагивают только результаты, содержащие эту книгу.
+
+    Кэш помечен версией каталога в БД, как WaitlistIndex — версией
+    очередей. Записи этого процесса сдвигают версию через apply; если
+    версия в БД отличается от запомненной, каталог изменил другой
+    процесс, и все результаты устаревают.
+
+    Таблица поколений не растёт с числом записей в базу: когда в ней
+    больше maxsize книг, устаревшие выдачи удаляются, после чего
+    поколения ни на что не влияют и сбрасываются.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 10.0):
+        self.version: Optional[int] = None
+        self._entries = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._membership_generation = 0
+        self._book_generations: Dict[int, int] = {}
+        # Снимок последнего сброса поколений: более ранние выдачи не сохраняются
+        self._generations_floor = 0
+
+    def snapshot(self) -> int:
+        """Номер последней записи; снимается до выполнения запроса"""
+        return self._sequence
+
+    def get(self, key: Hashable) -> Optional[Tuple[List[Book], Optional[str]]]:
+        """Получить копию сохранённой выдачи: (книги, курсор следующей страницы)"""
+        entry = self._entries.get(key, validate=self._is_fresh)
+        if entry is None:
+            return None
+
+        _, books, next_cursor = entry
+        return [copy.copy(book) for book in books], next_cursor
+
+    def put(self, key: Hashable, snapshot: int, books: List[Book],
+            next_cursor: Optional[str] = None) -> None:
+        """Сохранить выдачу, полученную запросом после снимка snapshot"""
+        entry = (snapshot, tuple(copy.copy(book) for book in books), next_cursor)
+        with self._lock:
+            # Поколения, изменённые после снимка, могли быть уже сброшены
+            if snapshot >= self._generations_floor:
+                self._entries.put(key, entry)
+
+    def _is_fresh(self, entry: Tuple[int, Tuple[Book, ...], Optional[str]]) -> bool:
+        """Не изменилось ли ничего, от чего зависит результат"""
+        snapshot, books, _ = entry
+        if self._membership_generation > snapshot:
+            return False
+
+        generations = self._book_generations
+        return all(generations.get(book.id, 0) <= snapshot for book in books)
+
+    def invalidate_books(self, book_ids: Iterable[int]) -> None:
+        """Отметить изменение наличия или полей конкретных книг"""
+        with self._lock:
+            self._sequence += 1
+            for book_id in book_ids:
+                self._book_generations[book_id] = self._sequence
+
+            if len(self._book_generations) > self._entries.maxsize:
+                self._entries.discard(self._is_fresh)
+                self._reset_generations()
+
+    def invalidate_membership(self) -> None:
+        """Отметить изменение, способное поменять состав любой выдачи"""
+        with self._lock:
+            self._invalidate_membership()
+
+    def sync(self, version: int) -> None:
+        """Согласовать кэш с версией каталога, прочитанной из БД"""
+        with self._lock:
+            if self.version != version:
+                self._invalidate_membership()
+                self.version = version
+
+    def apply(self, before: int, after: int) -> None:
+        """Учесть запись этого процесса, сдвинувшую версию каталога
+
+        before и after — версии каталога в начале и в конце транзакции;
+        изменённые ею книги уже отмечены инвалидацией. Если кэш не
+        соответствовал версии before, изменения других процессов в нём
+        не учтены, и все результаты устаревают.
+        """
+        with self._lock:
+            if self.version != before:
+                self._invalidate_membership()
+            self.version = after
+
+    def _invalidate_membership(self) -> None:
+        self._sequence += 1
+        self._membership_generation = self._sequence
+        # Все выдачи со снимком раньше этой записи уже устарели
+        self._reset_generations()
+
+    def _reset_generations(self) -> None:
+        """Сбросить поколения книг, когда в кэше не осталось устаревших выдач"""
+        self._book_generations = {}
+        self._generations_floor = self._sequence
+
+    def clear(self) -> None:
+        """Удалить все записи"""
+        with self._lock:
+            self._entries.clear()
+            self._invalidate_membership()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики кэша"""
+        stats = self._entries.stats()
+        stats['book_generations'] = len(self._book_generations)
+        return stats
+
+
+class UserCache:
+    """Кэш пользователей по имени и по id с запоминанием отсутствующих имён
+
+    Отрицательные записи (имя не найдено) живут меньше положительных и
+    дёшево отсекают повторные входы с несуществующими именами. Короткий
+    ttl ограничивает время, за которое изменения, сделанные другими
+    процессами (например, блокировка пользователя), доходят до кэша.
+
+    Как и в SearchCache, запись сохраняется только если с момента снимка
+    перед чтением из базы не было инвалидаций: иначе строка, прочитанная
+    до обновления, могла бы вытеснить уже сброшенную запись.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 30.0,
+                 negative_ttl: Optional[float] = 5.0):
+        self._by_username = LRUCache(maxsize, ttl)
+        self._by_id = LRUCache(maxsize, ttl)
+        self._missing = LRUCache(maxsize, negative_ttl)
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def snapshot(self) -> int:
+        """Номер последней инвалидации; снимается до чтения из базы"""
+        return self._sequence
+
+    def get_by_username(self, username: str) -> Tuple[bool, Optional[User]]:
+        """Найти пользователя по имени: (есть ли запись, копия пользователя или None)"""
+        if self._missing.get(username, False):
+            return True, None
+
+        user = self._by_username.get(username)
+        return user is not None, copy.copy(user)
+
+    def get_by_id(self, user_id: int) -> Optional[User]:
+        """Копия пользователя по id или None, если записи нет"""
+        return copy.copy(self._by_id.get(user_id))
+
+    def put(self, snapshot: int, user: User) -> None:
+        """Сохранить пользователя, прочитанного после снимка snapshot"""
+        with self._lock:
+            if snapshot != self._sequence:
+                return
+            user = copy.copy(user)
+            self._missing.pop(user.username)
+            self._by_username.put(user.username, user)
+            self._by_id.put(user.id, user)
+
+    def put_missing(self, snapshot: int, username: str) -> None:
+        """Запомнить, что пользователя с таким именем нет"""
+        with self._lock:
+            if snapshot == self._sequence:
+                self._missing.put(username, True)
+
+    def invalidate(self, user_id: Optional[int] = None, *usernames: str) -> None:
+        """Сбросить записи пользователя по id и по именам"""
+        with self._lock:
+            self._sequence += 1
+            if user_id is not None:
+                self._by_id.pop(user_id)
+            for username in usernames:
+                self._by_username.pop(username)
+                self._missing.pop(username)
+
+    def clear(self) -> None:
+        """Удалить все записи"""
+        with self._lock:
+            self._sequence += 1
+            self._by_username.clear()
+            self._by_id.clear()
+            self._missing.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики кэша по видам записей"""
+        return {
+            'by_username': self._by_username.stats(),
+            'by_id': self._by_id.stats(),
+            'missing': self._missing.stats(),
+        }
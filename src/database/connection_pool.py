@@ -0,0 +1,228 @@
+"""
+Пул соединений SQLite для многопоточного доступа к базе
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class PoolTimeoutError(Exception):
+    """Соединение не удалось получить из пула за отведённое время"""
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений SQLite
+
+    Записи идут через единственное соединение, которое выдаётся одному
+    потоку за раз: SQLite всё равно допускает только одного писателя.
+    Чтения получают отдельные соединения из пула ограниченного размера
+    и выполняются параллельно. Поток, удерживающий соединение на запись,
+    читает через него же и видит собственные незафиксированные изменения.
+    """
+
+    def __init__(self, connection_factory: Callable[[], sqlite3.Connection],
+                 max_readers: int = 4, timeout: float = 5.0):
+        self._factory = connection_factory
+        self.max_readers = max_readers
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._idle_readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_in_use = 0
+
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._local = threading.local()
+        self._closed = False
+
+        self._stats = {
+            'reader_checkouts': 0,
+            'reader_waits': 0,
+            'reader_timeouts': 0,
+            'reader_wait_time': 0.0,
+            'peak_readers_in_use': 0,
+            'writer_checkouts': 0,
+            'writer_waits': 0,
+            'writer_timeouts': 0,
+            'writer_wait_time': 0.0,
+        }
+
+    # === Соединение на запись ===
+
+    def get_writer(self) -> sqlite3.Connection:
+        """Получить соединение на запись, не захватывая его"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+
+        with self._lock:
+            if self._writer is None:
+                self._writer = self._factory()
+            return self._writer
+
+    @contextmanager
+    def writer(self, timeout: Optional[float] = None) -> Iterator[sqlite3.Connection]:
+        """Захватить соединение на запись
+
+        Захват реентерабелен: вложенный вызов в том же потоке сразу
+        получает то же соединение.
+        """
+        depth = getattr(self._local, 'writer_depth', 0)
+        if depth:
+            self._local.writer_depth = depth + 1
+            try:
+                yield self._writer
+            finally:
+                self._local.writer_depth -= 1
+            return
+
+        timeout = self.timeout if timeout is None else timeout
+        if not self._writer_lock.acquire(blocking=False):
+            started = time.perf_counter()
+            acquired = self._writer_lock.acquire(timeout=timeout)
+            with self._lock:
+                self._stats['writer_waits'] += 1
+                self._stats['writer_wait_time'] += time.perf_counter() - started
+                if not acquired:
+                    self._stats['writer_timeouts'] += 1
+            if not acquired:
+                raise PoolTimeoutError(
+                    f"Соединение на запись занято дольше {timeout} с"
+                )
+
+        try:
+            conn = self.get_writer()
+            with self._lock:
+                self._stats['writer_checkouts'] += 1
+            self._local.writer_depth = 1
+            try:
+                yield conn
+            finally:
+                self._local.writer_depth = 0
+        finally:
+            self._writer_lock.release()
+
+    def holds_writer(self) -> bool:
+        """Удерживает ли текущий поток соединение на запись"""
+        return bool(getattr(self._local, 'writer_depth', 0))
+
+    # === Соединения на чтение ===
+
+    @contextmanager
+    def reader(self, timeout: Optional[float] = None) -> Iterator[sqlite3.Connection]:
+        """Получить соединение на чтение на время блока with"""
+        if self.holds_writer() or self.max_readers <= 0:
+            with self.writer(timeout) as conn:
+                yield conn
+            return
+
+        conn = self._checkout_reader(self.timeout if timeout is None else timeout)
+        try:
+            yield conn
+        finally:
+            self._checkin_reader(conn)
+
+    def _checkout_reader(self, timeout: float) -> sqlite3.Connection:
+        """Взять свободное соединение на чтение или открыть новое"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+
+        create = False
+        with self._lock:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                conn = None
+                if self._readers_created < self.max_readers:
+                    self._readers_created += 1
+                    create = True
+
+        if create:
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._lock:
+                    self._readers_created -= 1
+                raise
+        elif conn is None:
+            started = time.perf_counter()
+            try:
+                conn = self._idle_readers.get(timeout=timeout)
+            except queue.Empty:
+                conn = None
+            with self._lock:
+                self._stats['reader_waits'] += 1
+                self._stats['reader_wait_time'] += time.perf_counter() - started
+                if conn is None:
+                    self._stats['reader_timeouts'] += 1
+            if conn is None:
+                raise PoolTimeoutError(
+                    f"Нет свободных соединений на чтение за {timeout} с "
+                    f"(размер пула: {self.max_readers})"
+                )
+
+        with self._lock:
+            self._readers_in_use += 1
+            self._stats['reader_checkouts'] += 1
+            if self._readers_in_use > self._stats['peak_readers_in_use']:
+                self._stats['peak_readers_in_use'] = self._readers_in_use
+
+        return conn
+
+    def _checkin_reader(self, conn: sqlite3.Connection) -> None:
+        """Вернуть соединение на чтение в пул"""
+        with self._lock:
+            self._readers_in_use -= 1
+            if self._closed:
+                self._readers_created -= 1
+                conn.close()
+                return
+
+        self._idle_readers.put(conn)
+
+    # === Служебное ===
+
+    def connections(self) -> Iterator[sqlite3.Connection]:
+        """Открытые соединения, которые сейчас не выданы потокам, и соединение на запись"""
+        with self._lock:
+            connections = list(self._idle_readers.queue)
+            if self._writer is not None:
+                connections.append(self._writer)
+        return iter(connections)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика загрузки пула"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'max_readers': self.max_readers,
+                'readers_created': self._readers_created,
+                'readers_in_use': self._readers_in_use,
+                'readers_idle': self._idle_readers.qsize(),
+                'saturated': (
+                    self._readers_in_use >= self.max_readers and self.max_readers > 0
+                ),
+            })
+        return stats
+
+    def close(self) -> None:
+        """Закрыть все соединения пула
+
+        Соединения, выданные потокам в момент закрытия, закрываются при возврате.
+        """
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._idle_readers.get_nowait()
+                except queue.Empty:
+                    break
+                self._readers_created -= 1
+                conn.close()
+            writer, self._writer = self._writer, None
+
+        if writer is not None:
+            writer.close()
@@ -1,34 +1,336 @@
 """
 Менеджер базы данных для системы каталога
 """
+import base64
+import re
 import sqlite3
-from typing import List, Optional, Dict, Any
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple
 from pathlib import Path
 from ..models.book import Book
 from ..models.user import User, UserRole
-from ..models.reservation import Reservation, ReservationStatus
+from ..models.reservation import (
+    Reservation, ReservationOutcome, ReservationResult, ReservationStatus
+)
+from ..models.waitlist import WaitlistEntry
+from .cache import SearchCache, UserCache
+from .connection_pool import ConnectionPool
+from .instrumentation import InstrumentedConnection, QueryInstrumentation
+from .waitlist_index import QueueChange, WaitlistIndex
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+
+
+# Запрос, похожий на ISBN: цифры, дефисы и контрольный символ X
+ISBN_QUERY_PATTERN = re.compile(r'^[0-9][0-9\-]*[0-9Xx]$')
+
+# Слова запроса для полнотекстового поиска
+FTS_TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Профили хранения: PRAGMA, применяемые к каждому новому соединению.
+# durable повторяет настройки SQLite по умолчанию (журнал отката и fsync
+# на каждый commit), balanced включает WAL, при котором чтения не ждут
+# записи, а read-heavy дополнительно отдаёт под кэш и mmap больше памяти.
+STORAGE_PROFILES = {
+    'durable': {
+        'journal_mode': 'delete',
+        'synchronous': 'FULL',
+    },
+    'balanced': {
+        'journal_mode': 'wal',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,           # ~16 МБ
+        'temp_store': 'MEMORY',
+    },
+    'read-heavy': {
+        'journal_mode': 'wal',
+        'synchronous': 'NORMAL',
+        'cache_size': -262144,          # ~256 МБ
+        'mmap_size': 1024 * 1024 * 1024,  # 1 ГБ
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Политики обработки ISBN, уже существующих в каталоге, при массовом импорте
+DUPLICATE_POLICIES = ('skip', 'upsert', 'error')
+
+_BULK_INSERT_SQL = '''
+    INSERT INTO books (title, author, year, isbn, publisher, genre, pages, quantity, available)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_BULK_CONFLICT_SQL = {
+    'skip': " ON CONFLICT (isbn) DO NOTHING",
+    # При обновлении тиража сдвигаем available на разницу, сохраняя выданные экземпляры
+    'upsert': ''' ON CONFLICT (isbn) DO UPDATE SET
+        title = excluded.title,
+        author = excluded.author,
+        year = excluded.year,
+        publisher = excluded.publisher,
+        genre = excluded.genre,
+        pages = excluded.pages,
+        available = MAX(0, books.available + excluded.quantity - books.quantity),
+        quantity = excluded.quantity
+    ''',
+    'error': "",
+}
+
+# Политики пакетного бронирования: всё или ничего либо всё, что возможно
+RESERVATION_POLICIES = ('all_or_nothing', 'best_effort')
+
+# Допустимые переходы статуса бронирования: новый статус -> из каких статусов
+RESERVATION_TRANSITIONS = {
+    ReservationStatus.CONFIRMED: (ReservationStatus.PENDING,),
+    ReservationStatus.COMPLETED: (ReservationStatus.PENDING, ReservationStatus.CONFIRMED),
+    ReservationStatus.CANCELLED: (ReservationStatus.PENDING, ReservationStatus.CONFIRMED),
+}
+
+# Сколько времени у читателя, чтобы забрать забронированный экземпляр; не
+# забранный в срок экземпляр сборщик вернёт в фонд или передаст очереди
+PICKUP_WINDOW = timedelta(days=3)
+
+# Ключи сортировки результатов поиска и соответствующие им столбцы
+SORT_KEYS = {
+    'id': 'id',
+    'title': 'title',
+    'year': 'year',
+}
+
+# Поля книги, изменение которых не добавляет её в чужие выдачи поиска:
+# после их правки достаточно инвалидировать выдачи с этой книгой
+BOOK_STOCK_FIELDS = frozenset({'available', 'quantity', 'pages'})
+
+
+@dataclass
+class BookPage:
+    """Страница результатов поиска"""
+    books: List[Book]
+    next_cursor: Optional[str] = None  # Курсор следующей страницы или None
+
+
+@dataclass
+class BulkImportResult:
+    """Итог массового добавления книг"""
+    processed: int = 0  # Книг передано на вставку
+    written: int = 0    # Вставлено или обновлено строк
+    skipped: int = 0    # Пропущено из-за существующего ISBN
 
 
 class DatabaseManager:
     """Класс для управления базой данных SQLite"""
     
-    def __init__(self, db_path: str = "book_catalog.db"):
+    # Версионированные миграции схемы: (версия, метод миграции).
+    # Номер последней применённой миграции хранится в PRAGMA user_version.
+    MIGRATIONS = (
+        (1, '_migrate_fts_index'),
+        (2, '_migrate_secondary_indexes'),
+        (3, '_migrate_sort_indexes'),
+        (4, '_migrate_catalog_version'),
+        (5, '_migrate_reservation_expiry_index'),
+        (6, '_migrate_waitlist'),
+        (7, '_migrate_pending_deadlines'),
+    )
+    
+    def __init__(self, db_path: str = "book_catalog.db", pool_size: int = 4,
+                 pool_timeout: float = 5.0, profile: str = "durable",
+                 search_cache_size: int = 1024, search_cache_ttl: Optional[float] = 10.0,
+                 user_cache_size: int = 1024, user_cache_ttl: Optional[float] = 30.0,
+                 catalog_version_ttl: float = 1.0, instrument: bool = False,
+                 slow_query_threshold: float = 0.1, slow_query_log: Optional[str] = None):
+        if profile not in STORAGE_PROFILES:
+            raise ValueError(
+                f"Неизвестный профиль хранения: {profile}. "
+                f"Доступны: {', '.join(STORAGE_PROFILES)}"
+            )
+        
         self.db_path = db_path
-        self.connection = None
+        self.profile = profile
+        # Каждое соединение с :memory: открывает свою пустую базу,
+        # поэтому для неё всё идёт через одно соединение на запись
+        self.pool_size = 0 if db_path == ":memory:" else pool_size
+        self.pool_timeout = pool_timeout
+        self._trace_callback = None
+        self._local = threading.local()
+        # Кэш выдач поиска; ttl ограничивает устаревание при записи
+        # в ту же базу из других процессов
+        self._search_cache = (
+            SearchCache(search_cache_size, search_cache_ttl) if search_cache_size > 0 else None
+        )
+        # Кэш пользователей для входа и проверки токенов; короткий ttl
+        # ограничивает задержку блокировки, сделанной другим процессом
+        self._user_cache = (
+            UserCache(user_cache_size, user_cache_ttl) if user_cache_size > 0 else None
+        )
+        # Версия каталога запоминается на catalog_version_ttl секунд: столько
+        # могут не замечаться записи в ту же базу из других процессов
+        self.catalog_version_ttl = catalog_version_ttl
+        self._catalog_version: Optional[Tuple[int, float]] = None
+        self._catalog_generation = 0
+        # Очереди ожидания по книгам для быстрого ответа о месте в очереди
+        self._waitlist_index = WaitlistIndex()
+        # Замеры каждого SQL-выражения; выражения дольше slow_query_threshold
+        # секунд попадают в журнал медленных запросов
+        self._instrumentation = (
+            QueryInstrumentation(slow_query_threshold, slow_log_path=slow_query_log)
+            if instrument else None
+        )
+        self._pool = self._create_pool()
         self._initialize_database()
     
+    def _create_pool(self) -> ConnectionPool:
+        """Создать пул соединений; соединения открываются по требованию"""
+        return ConnectionPool(
+            self._open_connection,
+            max_readers=self.pool_size,
+            timeout=self.pool_timeout
+        )
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """Открыть новое соединение с БД"""
+        # Соединения переходят между потоками через пул, но в каждый
+        # момент используются только одним потоком
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.pool_timeout,
+            check_same_thread=False,
+            factory=InstrumentedConnection if self._instrumentation else sqlite3.Connection
+        )
+        conn.row_factory = sqlite3.Row
+        if self._instrumentation:
+            conn.instrumentation = self._instrumentation
+        self._apply_profile(conn)
+        if self._trace_callback is not None:
+            conn.set_trace_callback(self._trace_callback)
+        return conn
+    
+    def _apply_profile(self, conn: sqlite3.Connection) -> None:
+        """Применить PRAGMA профиля хранения к соединению"""
+        pragmas = dict(STORAGE_PROFILES[self.profile])
+        
+        # Режим журнала хранится в самом файле БД; переключение требует
+        # эксклюзивной блокировки, поэтому меняем его только при необходимости
+        journal_mode = pragmas.pop('journal_mode')
+        current_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if current_mode.lower() != journal_mode and self.db_path != ":memory:":
+            conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        
+        for name, value in pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+    
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Выполнить блок в одной транзакции на соединении для записи
+        
+        BEGIN IMMEDIATE сразу берёт блокировку на запись, поэтому транзакция
+        не может упасть с SQLITE_BUSY посередине. Вложенный вызов
+        присоединяется к внешней транзакции.
+        """
+        with self._pool.writer() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            
+            conn.execute("BEGIN IMMEDIATE")
+            track = self._search_cache is not None
+            try:
+                before = self._stored_catalog_version(conn) if track else None
+                yield conn
+                after = self._stored_catalog_version(conn) if track else None
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        
+        # Кэш выдач узнает о записи при инвалидации изменённых книг
+        if before != after:
+            self._local.catalog_change = (before, after)
+    
     def connect(self) -> sqlite3.Connection:
-        """Установить соединение с БД"""
-        if not self.connection:
-            self.connection = sqlite3.connect(self.db_path)
-            self.connection.row_factory = sqlite3.Row
-        return self.connection
+        """Получить служебное соединение с БД (соединение на запись)"""
+        return self._pool.get_writer()
+    
+    def set_trace_callback(self, callback) -> None:
+        """Установить обработчик трассировки SQL для всех соединений пула"""
+        self._trace_callback = callback
+        for conn in self._pool.connections():
+            conn.set_trace_callback(callback)
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Статистика загрузки пула соединений"""
+        return self._pool.stats()
+    
+    def search_cache_stats(self) -> Dict[str, Any]:
+        """Статистика кэша результатов поиска"""
+        return self._search_cache.stats() if self._search_cache else {}
+    
+    def user_cache_stats(self) -> Dict[str, Any]:
+        """Статистика кэша пользователей"""
+        return self._user_cache.stats() if self._user_cache else {}
+    
+    def query_stats(self) -> Dict[str, Any]:
+        """Время, число выражений и строк по методам и выражениям (если включены замеры)"""
+        return self._instrumentation.stats() if self._instrumentation else {}
+    
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """Последние медленные запросы с планом выполнения"""
+        return self._instrumentation.slow_queries() if self._instrumentation else []
+    
+    @contextmanager
+    def identity_map(self) -> Iterator[Dict[Tuple[str, int], Any]]:
+        """Карта идентичности на время блока with в текущем потоке
+        
+        Пока блок активен, каждая строка books разбирается в объект Book
+        один раз: повторные выборки той же книги возвращают тот же объект.
+        Вложенные блоки используют внешнюю карту.
+        """
+        identity_map = getattr(self._local, 'identity_map', None)
+        if identity_map is not None:
+            yield identity_map
+            return
+        
+        self._local.identity_map = {}
+        try:
+            yield self._local.identity_map
+        finally:
+            self._local.identity_map = None
+    
+    def _invalidate_books(self, *book_ids: int) -> None:
+        """Сбросить закэшированные выдачи, содержащие указанные книги"""
+        if self._search_cache:
+            self._search_cache.invalidate_books(book_ids)
+        self._forget_catalog_version()
+    
+    def _forget_catalog_version(self) -> None:
+        """Сбросить запомненную версию каталога после записи
+        
+        Версия кэша выдач сдвигается только после инвалидации изменённых
+        книг: иначе выдача со старыми данными получила бы ETag новой версии.
+        """
+        self._catalog_generation += 1
+        self._catalog_version = None
+        change = getattr(self._local, 'catalog_change', None)
+        if change is not None:
+            self._local.catalog_change = None
+            if self._search_cache:
+                self._search_cache.apply(*change)
+    
+    def _invalidate_catalog(self) -> None:
+        """Сбросить выдачи, состав которых могло изменить обновление каталога"""
+        if self._search_cache:
+            self._search_cache.invalidate_membership()
+        self._forget_catalog_version()
     
     def _initialize_database(self) -> None:
         """Инициализировать таблицы БД"""
-        conn = self.connect()
+        with self._pool.writer() as conn:
+            self._create_schema(conn)
+    
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        """Создать таблицы и применить миграции"""
         cursor = conn.cursor()
         
         # Таблица пользователей
@@ -80,37 +382,517 @@ class DatabaseManager:
         ''')
         
         conn.commit()
+        
+        self._apply_migrations(conn)
+        
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+        )
+        self.fts_enabled = cursor.fetchone() is not None
+    
+    def _apply_migrations(self, conn: sqlite3.Connection) -> None:
+        """Применить миграции схемы, которые ещё не были применены
+        
+        Каждая миграция выполняется в своей транзакции вместе с
+        обновлением user_version, поэтому прерванная миграция не
+        оставляет схему в промежуточном состоянии.
+        """
+        current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        
+        for version, method_name in self.MIGRATIONS:
+            if version <= current_version:
+                continue
+            
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Другой процесс мог применить миграцию, пока мы ждали блокировку
+                current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version <= current_version:
+                    conn.rollback()
+                    continue
+                
+                getattr(self, method_name)(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def _migrate_fts_index(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция 1: полнотекстовый индекс FTS5 по каталогу книг
+        
+        Индекс хранит только токены (external content) и синхронизируется
+        с таблицей books триггерами. Если SQLite собран без FTS5,
+        поиск откатывается на LIKE.
+        """
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                    title, author, publisher, genre,
+                    content='books', content_rowid='id',
+                    tokenize='unicode61'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            return
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+                INSERT INTO books_fts (rowid, title, author, publisher, genre)
+                VALUES (new.id, new.title, new.author, new.publisher, new.genre);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+                INSERT INTO books_fts (books_fts, rowid, title, author, publisher, genre)
+                VALUES ('delete', old.id, old.title, old.author, old.publisher, old.genre);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS books_fts_au
+            AFTER UPDATE OF title, author, publisher, genre ON books BEGIN
+                INSERT INTO books_fts (books_fts, rowid, title, author, publisher, genre)
+                VALUES ('delete', old.id, old.title, old.author, old.publisher, old.genre);
+                INSERT INTO books_fts (rowid, title, author, publisher, genre)
+                VALUES (new.id, new.title, new.author, new.publisher, new.genre);
+            END
+        ''')
+        
+        # Индексируем книги, добавленные до появления FTS
+        cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+    
+    def _migrate_secondary_indexes(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция 2: индексы под фильтры поиска и список бронирований
+        
+        search_books всегда фильтрует по is_active, поэтому он стоит первым
+        во всех индексах книг. Индекс бронирований отдаёт строки уже в
+        порядке created_at DESC без отдельной сортировки.
+        """
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_books_active_genre_year
+            ON books (is_active, genre, year)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_books_active_author_year
+            ON books (is_active, author, year)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_books_active_year
+            ON books (is_active, year)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reservations_user_created
+            ON reservations (user_id, created_at DESC)
+        ''')
+    
+    def _migrate_sort_indexes(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция 3: индексы для постраничной выдачи по ключу
+        
+        Индекс неявно содержит rowid последним столбцом, поэтому
+        ORDER BY title, id и условие (title, id) > (?, ?) обслуживаются
+        им без сортировки. Индекс по одному is_active отдаёт активные
+        книги в порядке id.
+        """
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_books_active_title
+            ON books (is_active, title)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_books_active
+            ON books (is_active)
+        ''')
+    
+    def _migrate_catalog_version(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция 4: счётчик версии каталога
+        
+        Триггеры увеличивают счётчик при любом изменении таблицы books,
+        в том числе из других процессов и при бронировании. По версии
+        веб-интерфейс строит ETag выдачи поиска.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+        
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS books_version_{event.lower()}
+                AFTER {event} ON books
+                BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+    
+    def _migrate_reservation_expiry_index(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция 5: индекс для поиска просроченных бронирований
+        
+        expire_reservations ищет активные бронирования с истёкшим сроком
+        получения; индекс отдаёт их диапазоном, не просматривая завершённые
+        и отменённые бронирования.
+        """
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_reservations_status_deadline
+            ON reservations (status, pickup_deadline)
+        ''')
+    
+    def _migrate_waitlist(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция 6: очереди ожидания книг
+        
+        Индекс (book_id, priority, id) отдаёт первого в очереди за книгой
+        без сортировки. Счётчик версии очередей увеличивается триггерами
+        при любом изменении таблицы; по нему WaitlistIndex замечает
+        изменения очередей, сделанные другими процессами.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS waitlist (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                book_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (book_id, user_id),
+                FOREIGN KEY (book_id) REFERENCES books (id),
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_waitlist_book_order
+            ON waitlist (book_id, priority, id)
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS waitlist_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO waitlist_version (id, version) VALUES (1, 0)")
+        
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS waitlist_version_{event.lower()}
+                AFTER {event} ON waitlist
+                BEGIN
+                    UPDATE waitlist_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+    
+    def _migrate_pending_deadlines(self, cursor: sqlite3.Cursor) -> None:
+        """Миграция 7: срок получения у неподтверждённых бронирований
+        
+        Раньше reserve_book создавал бронирования без срока получения, и
+        сборщик их не отменял: экземпляр оставался занятым навсегда. Таким
+        бронированиям назначается срок PICKUP_WINDOW от даты бронирования.
+        """
+        cursor.execute('''
+            UPDATE reservations
+            SET pickup_deadline = strftime('%Y-%m-%dT%H:%M:%f', reservation_date, ?)
+            WHERE status = ? AND pickup_deadline IS NULL
+        ''', (f"+{int(PICKUP_WINDOW.total_seconds())} seconds", ReservationStatus.PENDING.value))
+    
+    def catalog_version(self) -> int:
+        """Версия каталога: меняется при каждой записи в таблицу books
+        
+        Значение запоминается на catalog_version_ttl секунд, поэтому
+        повторные вызовы не выполняют SQL. Записи через этот менеджер
+        сбрасывают запомненное значение сразу. Кэш выдач согласуется с
+        прочитанной версией, поэтому выдача под ETag этой версии не
+        содержит данных до записей других процессов.
+        """
+        cached = self._catalog_version
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < self.catalog_version_ttl:
+            return cached[0]
+        
+        generation = self._catalog_generation
+        with self._pool.reader() as conn:
+            version = self._stored_catalog_version(conn)
+        
+        # Не запоминаем версию внутри транзакции (она может откатиться)
+        # и версию, прочитанную до записи, завершившейся во время чтения
+        if not self._pool.holds_writer() and generation == self._catalog_generation:
+            if self._search_cache:
+                self._search_cache.sync(version)
+            self._catalog_version = (version, now)
+        return version
+    
+    @staticmethod
+    def _stored_catalog_version(conn: sqlite3.Connection) -> int:
+        """Версия каталога в БД"""
+        return conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()[0]
+    
+    @staticmethod
+    def _build_fts_query(query: str) -> str:
+        """Преобразовать пользовательский запрос в выражение MATCH
+        
+        Каждое слово ищется по префиксу, все слова должны встретиться.
+        Слова берутся в кавычки, чтобы синтаксис FTS5 из запроса не
+        интерпретировался.
+        """
+        tokens = FTS_TOKEN_PATTERN.findall(query)
+        return " ".join(f'"{token}"*' for token in tokens)
     
     # === CRUD для книг ===
     
     def add_book(self, book: Book) -> int:
         """Добавить новую книгу"""
-        conn = self.connect()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO books (title, author, year, isbn, publisher, genre, pages, quantity, available)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            book.title, book.author, book.year, book.isbn,
-            book.publisher, book.genre, book.pages, book.quantity, book.available
-        ))
+        with self._transaction() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO books (title, author, year, isbn, publisher, genre, pages, quantity, available)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                book.title, book.author, book.year, book.isbn,
+                book.publisher, book.genre, book.pages, book.quantity, book.available
+            ))
         
-        conn.commit()
+        self._invalidate_catalog()
         return cursor.lastrowid
     
-    def search_books(self, query: str = "", **filters) -> List[Book]:
-        """Поиск книг по различным критериям"""
-        conn = self.connect()
-        cursor = conn.cursor()
+    def add_books_bulk(self, books: Iterable[Book], on_duplicate: str = "skip",
+                       chunk_size: int = 1000) -> BulkImportResult:
+        """Добавить книги пачками в одной транзакции
         
-        sql = "SELECT * FROM books WHERE is_active = 1"
-        params = []
+        Книги читаются из итерируемого объекта порциями по chunk_size и
+        вставляются через executemany, поэтому источник может быть
+        генератором, не помещающимся в память. on_duplicate задаёт
+        поведение при уже существующем ISBN: skip — пропустить,
+        upsert — обновить книгу, error — прервать импорт и откатить его.
+        """
+        if on_duplicate not in DUPLICATE_POLICIES:
+            raise ValueError(
+                f"Неизвестная политика дубликатов: {on_duplicate}. "
+                f"Доступны: {', '.join(DUPLICATE_POLICIES)}"
+            )
+        if chunk_size <= 0:
+            raise ValueError("Размер пачки должен быть положительным")
+        
+        sql = _BULK_INSERT_SQL + _BULK_CONFLICT_SQL[on_duplicate]
+        result = BulkImportResult()
+        books = iter(books)
+        
+        try:
+            with self._transaction() as conn:
+                while True:
+                    chunk = [
+                        (
+                            book.title, book.author, book.year, book.isbn,
+                            book.publisher, book.genre, book.pages,
+                            book.quantity, book.available
+                        )
+                        for book in islice(books, chunk_size)
+                    ]
+                    if not chunk:
+                        break
+                    
+                    cursor = conn.executemany(sql, chunk)
+                    result.processed += len(chunk)
+                    result.written += cursor.rowcount
+        finally:
+            self._invalidate_catalog()
+        
+        result.skipped = result.processed - result.written
+        return result
+    
+    def search_books(self, query: str = "", limit: Optional[int] = None,
+                     sort: str = "id", cursor: Optional[str] = None,
+                     **filters) -> List[Book]:
+        """Поиск книг по различным критериям
+        
+        limit ограничивает размер выдачи, sort задаёт ключ сортировки
+        (см. SORT_KEYS), cursor продолжает выдачу после книги, на которой
+        закончилась предыдущая страница (см. search_books_page).
+        """
+        return self.search_books_page(
+            query, limit=limit, sort=sort, cursor=cursor, **filters
+        ).books
+    
+    def search_books_page(self, query: str = "", limit: Optional[int] = None,
+                          sort: str = "id", cursor: Optional[str] = None,
+                          use_cache: bool = True, **filters) -> BookPage:
+        """Страница результатов поиска с курсором на следующую страницу
+        
+        Пагинация по ключу: следующая страница выбирается условием
+        (ключ, id) > (последний ключ, последний id) по индексу, поэтому
+        стоимость страницы не зависит от её глубины, в отличие от OFFSET.
+        use_cache=False читает страницу из базы, не заходя в кэш выдач:
+        так постраничная выгрузка всего каталога не вытесняет из кэша
+        интерактивные запросы.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(
+                f"Неизвестный ключ сортировки: {sort}. Доступны: {', '.join(SORT_KEYS)}"
+            )
+        if limit is not None and limit <= 0:
+            raise ValueError("Размер страницы должен быть положительным")
+        
+        after = self.decode_cursor(cursor, sort) if cursor else None
+        
+        # Внутри транзакции на запись выдача может содержать незафиксированные
+        # изменения; фильтры по наличию зависят от каждой записи о бронировании
+        cache = self._search_cache if use_cache else None
+        if cache and (self._pool.holds_writer() or BOOK_STOCK_FIELDS & filters.keys()):
+            cache = None
+        
+        if cache:
+            key = (
+                " ".join(query.lower().split()),
+                tuple(sorted((k, v) for k, v in filters.items() if v is not None)),
+                limit, sort, cursor
+            )
+            cached = cache.get(key)
+            if cached is not None:
+                return BookPage(books=cached[0], next_cursor=cached[1])
+            snapshot = cache.snapshot()
+        
+        page = self._search_page(query, limit, sort, after, filters)
+        
+        if cache:
+            cache.put(key, snapshot, page.books, page.next_cursor)
+        
+        return page
+    
+    def _search_page(self, query: str, limit: Optional[int], sort: str,
+                     after: Optional[Tuple[Any, int]],
+                     filters: Dict[str, Any]) -> BookPage:
+        """Выполнить поиск страницы в базе"""
+        condition = self._search_condition(query)
+        if condition is None:
+            return BookPage(books=[], next_cursor=None)
         
-        if query:
-            sql += " AND (title LIKE ? OR author LIKE ? OR isbn LIKE ?)"
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        books = self._select_books(
+            condition[0], condition[1], filters,
+            sort=sort, after=after,
+            limit=limit + 1 if limit is not None else None
+        )
+        
+        next_cursor = None
+        if limit is not None and len(books) > limit:
+            books = books[:limit]
+            next_cursor = self.encode_cursor(sort, books[-1])
+        
+        return BookPage(books=books, next_cursor=next_cursor)
+    
+    @staticmethod
+    def encode_cursor(sort: str, book: Book) -> str:
+        """Закодировать позицию после книги в непрозрачный курсор"""
+        payload = json.dumps([sort, getattr(book, SORT_KEYS[sort]), book.id],
+                             ensure_ascii=False, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+        """Раскодировать курсор в (значение ключа сортировки, id)"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            cursor_sort, value, book_id = json.loads(
+                base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+            )
+        except (ValueError, TypeError, UnicodeError):
+            raise ValueError("Некорректный курсор") from None
+        
+        if cursor_sort != sort or not isinstance(book_id, int):
+            raise ValueError("Курсор не соответствует сортировке запроса")
+        
+        return value, book_id
+    
+    def _search_condition(self, query: str) -> Optional[Tuple[str, List[Any]]]:
+        """Условие отбора книг по текстовому запросу
+        
+        Возвращает None, если запрос заведомо ничего не находит.
+        """
+        query = query.strip()
+        if not query:
+            return "", []
+        
+        # Точный ISBN ищем по уникальному индексу, минуя полнотекстовый поиск
+        if ISBN_QUERY_PATTERN.match(query):
+            with self._pool.reader() as conn:
+                found = conn.execute(
+                    "SELECT 1 FROM books WHERE isbn = ?", (query,)
+                ).fetchone()
+            if found:
+                return "isbn = ?", [query]
+        
+        if not self.fts_enabled:
             search_term = f"%{query}%"
-            params.extend([search_term, search_term, search_term])
+            return (
+                "(title LIKE ? OR author LIKE ? OR isbn LIKE ?)",
+                [search_term, search_term, search_term]
+            )
+        
+        match = self._build_fts_query(query)
+        if not match:
+            return None
+        
+        return "id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)", [match]
+    
+    def iter_search_books(self, query: str = "", sort: str = "id",
+                          batch_size: int = 500, **filters) -> Iterator[Book]:
+        """Поиск книг с ленивой выдачей результатов
+        
+        Строки читаются порциями по batch_size через fetchmany, поэтому в
+        памяти одновременно находится не больше одной порции. Соединение
+        на чтение занято, пока генератор не исчерпан или не закрыт
+        (close() или выход из цикла с последующим удалением генератора).
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(
+                f"Неизвестный ключ сортировки: {sort}. Доступны: {', '.join(SORT_KEYS)}"
+            )
+        if batch_size <= 0:
+            raise ValueError("Размер порции должен быть положительным")
+        
+        return self._iter_books(query, sort, batch_size, filters)
+    
+    def _iter_books(self, query: str, sort: str, batch_size: int,
+                    filters: Dict[str, Any]) -> Iterator[Book]:
+        """Генератор книг для iter_search_books"""
+        condition = self._search_condition(query)
+        if condition is None:
+            return
+        
+        sql, params = self._build_books_sql(condition[0], condition[1], filters, sort=sort)
+        
+        with self._pool.reader() as conn:
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield self._row_to_book(row)
+            finally:
+                cursor.close()
+    
+    def _select_books(self, condition: str, params: List[Any],
+                      filters: Dict[str, Any], sort: Optional[str] = None,
+                      after: Optional[Tuple[Any, int]] = None,
+                      limit: Optional[int] = None) -> List[Book]:
+        """Выбрать активные книги по условию и фильтрам по полям"""
+        sql, params = self._build_books_sql(condition, params, filters, sort, after, limit)
+        
+        with self._pool.reader() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        
+        return [self._row_to_book(row) for row in rows]
+    
+    @staticmethod
+    def _build_books_sql(condition: str, params: List[Any],
+                         filters: Dict[str, Any], sort: Optional[str] = None,
+                         after: Optional[Tuple[Any, int]] = None,
+                         limit: Optional[int] = None) -> Tuple[str, List[Any]]:
+        """Собрать запрос выборки активных книг"""
+        sql = "SELECT * FROM books WHERE is_active = 1"
+        params = list(params)
+        
+        if condition:
+            sql += f" AND {condition}"
         
         if filters:
             for field, value in filters.items():
@@ -118,44 +900,103 @@ class DatabaseManager:
                     sql += f" AND {field} = ?"
                     params.append(value)
         
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
-        
-        books = []
-        for row in rows:
-            books.append(Book(
-                id=row['id'],
-                title=row['title'],
-                author=row['author'],
-                year=row['year'],
-                isbn=row['isbn'],
-                publisher=row['publisher'],
-                genre=row['genre'],
-                pages=row['pages'],
-                quantity=row['quantity'],
-                available=row['available'],
-                is_active=bool(row['is_active']),
-                created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
-            ))
+        if sort is not None:
+            column = SORT_KEYS[sort]
+            if after is not None:
+                if column == "id":
+                    sql += " AND id > ?"
+                    params.append(after[1])
+                else:
+                    sql += f" AND ({column}, id) > (?, ?)"
+                    params.extend(after)
+            sql += " ORDER BY id" if column == "id" else f" ORDER BY {column}, id"
+        
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        return sql, params
+    
+    def _row_to_book(self, row: sqlite3.Row) -> Book:
+        """Создать книгу из строки таблицы books"""
+        identity_map = getattr(self._local, 'identity_map', None)
+        if identity_map is not None:
+            book = identity_map.get(('books', row['id']))
+            if book is not None:
+                return book
+        
+        book = Book(
+            id=row['id'],
+            title=row['title'],
+            author=row['author'],
+            year=row['year'],
+            isbn=row['isbn'],
+            publisher=row['publisher'],
+            genre=row['genre'],
+            pages=row['pages'],
+            quantity=row['quantity'],
+            available=row['available'],
+            is_active=bool(row['is_active']),
+            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+        )
         
-        return books
+        if identity_map is not None:
+            identity_map[('books', book.id)] = book
+        return book
+    
+    def get_book_by_id(self, book_id: int, active_only: bool = False) -> Optional[Book]:
+        """Получить книгу по первичному ключу"""
+        sql = "SELECT * FROM books WHERE id = ?"
+        if active_only:
+            sql += " AND is_active = 1"
+        
+        with self._pool.reader() as conn:
+            row = conn.execute(sql, (book_id,)).fetchone()
+        
+        return self._row_to_book(row) if row else None
+    
+    def get_books_by_ids(self, book_ids: Iterable[int],
+                         active_only: bool = False) -> List[Book]:
+        """Получить книги по списку первичных ключей одним запросом
+        
+        Ключи передаются одним JSON-параметром и разворачиваются через
+        json_each, поэтому текст запроса не зависит от их количества.
+        Книги возвращаются в порядке ключей; отсутствующие пропускаются.
+        """
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        if not book_ids:
+            return []
+        
+        sql = "SELECT * FROM books WHERE id IN (SELECT value FROM json_each(?))"
+        if active_only:
+            sql += " AND is_active = 1"
+        
+        with self._pool.reader() as conn:
+            rows = conn.execute(sql, (json.dumps(book_ids),)).fetchall()
+        
+        books = {book.id: book for book in map(self._row_to_book, rows)}
+        return [books[book_id] for book_id in book_ids if book_id in books]
     
     def update_book(self, book_id: int, **updates) -> bool:
         """Обновить информацию о книге"""
         if not updates:
             return False
         
-        conn = self.connect()
-        cursor = conn.cursor()
-        
         set_clause = ", ".join([f"{key} = ?" for key in updates.keys()])
         sql = f"UPDATE books SET {set_clause} WHERE id = ?"
         
         params = list(updates.values())
         params.append(book_id)
         
-        cursor.execute(sql, params)
-        conn.commit()
+        with self._transaction() as conn:
+            cursor = conn.execute(sql, params)
+        
+        # Снятие с учёта только убирает книгу из выдач, как и правка наличия
+        removal_only = {'is_active'} if not updates.get('is_active', 1) else set()
+        if set(updates) <= BOOK_STOCK_FIELDS | removal_only:
+            self._invalidate_books(book_id)
+        else:
+            self._invalidate_catalog()
         
         return cursor.rowcount > 0
     
@@ -167,50 +1008,122 @@ class DatabaseManager:
     
     def add_user(self, user: User) -> int:
         """Добавить нового пользователя"""
-        conn = self.connect()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO users (username, email, password_hash, role, full_name, phone)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            user.username, user.email, user.password_hash,
-            user.role.value, user.full_name, user.phone
-        ))
+        with self._pool.writer() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO users (username, email, password_hash, role, full_name, phone)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                user.username, user.email, user.password_hash,
+                user.role.value, user.full_name, user.phone
+            ))
+            
+            conn.commit()
         
-        conn.commit()
+        # Имя могло быть закэшировано как отсутствующее
+        self._invalidate_user(None, user.username)
         return cursor.lastrowid
     
     def get_user_by_username(self, username: str) -> Optional[User]:
         """Найти пользователя по имени"""
-        conn = self.connect()
-        cursor = conn.cursor()
+        cache = self._user_cache if not self._pool.holds_writer() else None
+        if cache:
+            found, user = cache.get_by_username(username)
+            if found:
+                return user
+            snapshot = cache.snapshot()
         
-        cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-        row = cursor.fetchone()
-        
-        if row:
-            return User(
-                id=row['id'],
-                username=row['username'],
-                email=row['email'],
-                password_hash=row['password_hash'],
-                role=UserRole(row['role']),
-                full_name=row['full_name'],
-                phone=row['phone'],
-                is_active=bool(row['is_active']),
-                created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
-            )
-        return None
+        with self._pool.reader() as conn:
+            row = conn.execute(
+                "SELECT * FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        
+        user = self._row_to_user(row) if row else None
+        if cache:
+            if user:
+                cache.put(snapshot, user)
+            else:
+                cache.put_missing(snapshot, username)
+        return user
+    
+    def get_user_by_id(self, user_id: int) -> Optional[User]:
+        """Найти пользователя по id"""
+        cache = self._user_cache if not self._pool.holds_writer() else None
+        if cache:
+            user = cache.get_by_id(user_id)
+            if user:
+                return user
+            snapshot = cache.snapshot()
+        
+        with self._pool.reader() as conn:
+            row = conn.execute(
+                "SELECT * FROM users WHERE id = ?", (user_id,)
+            ).fetchone()
+        
+        user = self._row_to_user(row) if row else None
+        if cache and user:
+            cache.put(snapshot, user)
+        return user
+    
+    @staticmethod
+    def _row_to_user(row: sqlite3.Row) -> User:
+        """Преобразовать строку таблицы users в объект User"""
+        return User(
+            id=row['id'],
+            username=row['username'],
+            email=row['email'],
+            password_hash=row['password_hash'],
+            role=UserRole(row['role']),
+            full_name=row['full_name'],
+            phone=row['phone'],
+            is_active=bool(row['is_active']),
+            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+        )
+    
+    def update_user(self, user_id: int, **updates) -> bool:
+        """Обновить поля пользователя"""
+        if not updates:
+            return False
+        
+        set_clause = ", ".join([f"{key} = ?" for key in updates.keys()])
+        params = list(updates.values())
+        params.append(user_id)
+        
+        with self._pool.writer() as conn:
+            row = conn.execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()
+            cursor = conn.execute(f"UPDATE users SET {set_clause} WHERE id = ?", params)
+            conn.commit()
+        
+        usernames = [row['username']] if row else []
+        if 'username' in updates:
+            usernames.append(updates['username'])
+        self._invalidate_user(user_id, *usernames)
+        
+        return cursor.rowcount > 0
+    
+    def deactivate_user(self, user_id: int) -> bool:
+        """Заблокировать пользователя"""
+        return self.update_user(user_id, is_active=0)
+    
+    def _invalidate_user(self, user_id: Optional[int], *usernames: str) -> None:
+        """Сбросить закэшированные записи пользователя"""
+        if self._user_cache:
+            self._user_cache.invalidate(user_id, *usernames)
     
     # === CRUD для бронирований ===
     
     def create_reservation(self, reservation: Reservation) -> int:
         """Создать новое бронирование"""
-        conn = self.connect()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        with self._pool.writer() as conn:
+            reservation_id = self._insert_reservation(conn, reservation)
+            conn.commit()
+            return reservation_id
+    
+    @staticmethod
+    def _insert_reservation(conn: sqlite3.Connection, reservation: Reservation) -> int:
+        """Вставить строку бронирования в текущей транзакции"""
+        cursor = conn.execute('''
             INSERT INTO reservations (book_id, user_id, status, reservation_date, pickup_deadline)
             VALUES (?, ?, ?, ?, ?)
         ''', (
@@ -218,41 +1131,481 @@ class DatabaseManager:
             reservation.status.value, reservation.reservation_date.isoformat(),
             reservation.pickup_deadline.isoformat() if reservation.pickup_deadline else None
         ))
-        
-        conn.commit()
         return cursor.lastrowid
     
+    def reserve_book(self, book_id: int, user_id: int) -> ReservationResult:
+        """Забронировать экземпляр книги одной транзакцией
+        
+        Экземпляр списывается условным UPDATE (available > 0), а бронирование
+        создаётся в той же транзакции BEGIN IMMEDIATE. Поэтому два
+        одновременных запроса на последний экземпляр не могут оба пройти,
+        а на всё бронирование приходится один commit. Срок получения —
+        PICKUP_WINDOW, после него бронирование отменяет сборщик.
+        """
+        now = datetime.now()
+        reservation = Reservation(
+            id=0,
+            book_id=book_id,
+            user_id=user_id,
+            status=ReservationStatus.PENDING,
+            reservation_date=now,
+            pickup_deadline=now + PICKUP_WINDOW
+        )
+        
+        with self._transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE books SET available = available - 1
+                WHERE id = ? AND is_active = 1 AND available > 0
+            ''', (book_id,))
+            
+            if cursor.rowcount == 0:
+                exists = conn.execute(
+                    "SELECT 1 FROM books WHERE id = ? AND is_active = 1", (book_id,)
+                ).fetchone()
+                outcome = ReservationOutcome.SOLD_OUT if exists else ReservationOutcome.NOT_FOUND
+                return ReservationResult(outcome)
+            
+            reservation.id = self._insert_reservation(conn, reservation)
+        
+        self._invalidate_books(book_id)
+        return ReservationResult(ReservationOutcome.RESERVED, reservation)
+    
+    def reserve_books(self, book_ids: Iterable[int], user_id: int,
+                      policy: str = "all_or_nothing") -> List[ReservationResult]:
+        """Забронировать несколько книг одной транзакцией
+        
+        Возвращает итог по каждой книге в порядке запроса (повторы ID
+        убираются). При политике all_or_nothing неудача хотя бы по одной
+        книге откатывает весь пакет до точки сохранения, а успешные до
+        этого книги получают итог ROLLED_BACK; при best_effort бронируется
+        всё, что удалось.
+        """
+        if policy not in RESERVATION_POLICIES:
+            raise ValueError(
+                f"Неизвестная политика бронирования: {policy}. "
+                f"Доступны: {', '.join(RESERVATION_POLICIES)}"
+            )
+        
+        book_ids = list(dict.fromkeys(book_ids))
+        results: List[ReservationResult] = []
+        now = datetime.now()
+        
+        with self._transaction() as conn:
+            # Точка сохранения позволяет откатить пакет, не затрагивая
+            # внешнюю транзакцию, к которой присоединился _transaction
+            conn.execute("SAVEPOINT reserve_books")
+            for book_id in book_ids:
+                cursor = conn.execute('''
+                    UPDATE books SET available = available - 1
+                    WHERE id = ? AND is_active = 1 AND available > 0
+                ''', (book_id,))
+                
+                if cursor.rowcount == 0:
+                    exists = conn.execute(
+                        "SELECT 1 FROM books WHERE id = ? AND is_active = 1", (book_id,)
+                    ).fetchone()
+                    outcome = ReservationOutcome.SOLD_OUT if exists else ReservationOutcome.NOT_FOUND
+                    results.append(ReservationResult(outcome))
+                    continue
+                
+                reservation = Reservation(
+                    id=0,
+                    book_id=book_id,
+                    user_id=user_id,
+                    status=ReservationStatus.PENDING,
+                    reservation_date=now,
+                    pickup_deadline=now + PICKUP_WINDOW
+                )
+                reservation.id = self._insert_reservation(conn, reservation)
+                results.append(ReservationResult(ReservationOutcome.RESERVED, reservation))
+            
+            failed = any(not result.success for result in results)
+            if failed and policy == 'all_or_nothing':
+                conn.execute("ROLLBACK TO reserve_books")
+                results = [
+                    ReservationResult(ReservationOutcome.ROLLED_BACK) if result.success else result
+                    for result in results
+                ]
+            conn.execute("RELEASE reserve_books")
+        
+        reserved = [result.reservation.book_id for result in results if result.success]
+        if reserved:
+            self._invalidate_books(*reserved)
+        return results
+    
+    def get_reservation(self, reservation_id: int) -> Optional[Reservation]:
+        """Получить бронирование по ID"""
+        with self._pool.reader() as conn:
+            row = conn.execute(
+                "SELECT * FROM reservations WHERE id = ?", (reservation_id,)
+            ).fetchone()
+        
+        return self._row_to_reservation(row) if row else None
+    
     def get_user_reservations(self, user_id: int) -> List[Reservation]:
         """Получить бронирования пользователя"""
-        conn = self.connect()
-        cursor = conn.cursor()
+        with self._pool.reader() as conn:
+            rows = conn.execute('''
+                SELECT r.*, b.title as book_title 
+                FROM reservations r
+                JOIN books b ON r.book_id = b.id
+                WHERE r.user_id = ?
+                ORDER BY r.created_at DESC
+            ''', (user_id,)).fetchall()
         
-        cursor.execute('''
-            SELECT r.*, b.title as book_title 
-            FROM reservations r
-            JOIN books b ON r.book_id = b.id
-            WHERE r.user_id = ?
-            ORDER BY r.created_at DESC
-        ''', (user_id,))
-        
-        rows = cursor.fetchall()
-        reservations = []
+        return [self._row_to_reservation(row) for row in rows]
+    
+    @staticmethod
+    def _row_to_reservation(row: sqlite3.Row) -> Reservation:
+        """Преобразовать строку таблицы reservations в Reservation"""
+        return Reservation(
+            id=row['id'],
+            book_id=row['book_id'],
+            user_id=row['user_id'],
+            status=ReservationStatus(row['status']),
+            reservation_date=datetime.fromisoformat(row['reservation_date']),
+            pickup_deadline=datetime.fromisoformat(row['pickup_deadline']) if row['pickup_deadline'] else None,
+            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+        )
+    
+    def update_reservation_status(self, reservation_id: int, status: ReservationStatus,
+                                  pickup_deadline: Optional[datetime] = None) -> bool:
+        """Изменить статус бронирования
         
-        for row in rows:
-            reservations.append(Reservation(
-                id=row['id'],
-                book_id=row['book_id'],
-                user_id=row['user_id'],
-                status=ReservationStatus(row['status']),
-                reservation_date=datetime.fromisoformat(row['reservation_date']),
-                pickup_deadline=datetime.fromisoformat(row['pickup_deadline']) if row['pickup_deadline'] else None,
-                created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+        Меняются только активные (ожидающие или подтверждённые)
+        бронирования, допустимые переходы заданы в RESERVATION_TRANSITIONS.
+        pickup_deadline, если указан, задаёт новый срок получения. При
+        отмене экземпляр в той же транзакции достаётся следующему в очереди
+        за книгой или возвращается в available.
+        Возвращает False, если бронирование не найдено или его статус
+        уже не допускает перехода.
+        """
+        if status not in RESERVATION_TRANSITIONS:
+            raise ValueError(f"Нельзя перевести бронирование в статус {status.value}")
+        
+        allowed = [previous.value for previous in RESERVATION_TRANSITIONS[status]]
+        with self._waitlist_transaction() as (conn, changes):
+            row = conn.execute(
+                "SELECT book_id FROM reservations WHERE id = ?", (reservation_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            
+            # Условие на текущий статус защищает от двойной отмены, если
+            # бронирование одновременно отменяют пользователь и сборщик
+            cursor = conn.execute(f'''
+                UPDATE reservations
+                SET status = ?, pickup_deadline = COALESCE(?, pickup_deadline)
+                WHERE id = ? AND status IN ({', '.join('?' * len(allowed))})
+            ''', (
+                status.value,
+                pickup_deadline.isoformat() if pickup_deadline else None,
+                reservation_id, *allowed
             ))
+            if cursor.rowcount == 0:
+                return False
+            
+            if status == ReservationStatus.CANCELLED:
+                self._release_copies(conn, [row['book_id']], changes)
+        
+        if status == ReservationStatus.CANCELLED:
+            self._invalidate_books(row['book_id'])
+        return True
+    
+    def expire_reservations(self, batch_size: int = 100,
+                            now: Optional[datetime] = None) -> List[int]:
+        """Отменить одну пачку просроченных бронирований
+        
+        Ищет до batch_size ожидающих или подтверждённых бронирований, срок
+        получения которых истёк к моменту now, отменяет их и передаёт
+        экземпляры ожидающим в очереди или возвращает в available одной
+        транзакцией. BEGIN IMMEDIATE
+        сериализует вызовы из разных процессов, поэтому одно бронирование
+        не будет отменено дважды. Возвращает ID отменённых бронирований;
+        если их меньше batch_size, просроченных больше нет.
+        """
+        if batch_size <= 0:
+            raise ValueError("Размер пачки должен быть положительным")
+        
+        deadline = (now or datetime.now()).isoformat()
+        active = (ReservationStatus.PENDING.value, ReservationStatus.CONFIRMED.value)
+        with self._waitlist_transaction() as (conn, changes):
+            rows = conn.execute('''
+                SELECT id, book_id FROM reservations
+                WHERE status IN (?, ?) AND pickup_deadline < ?
+                LIMIT ?
+            ''', (*active, deadline, batch_size)).fetchall()
+            if not rows:
+                return []
+            
+            conn.executemany(
+                "UPDATE reservations SET status = ? WHERE id = ?",
+                [(ReservationStatus.CANCELLED.value, row['id']) for row in rows]
+            )
+            book_ids = [row['book_id'] for row in rows]
+            self._release_copies(conn, book_ids, changes)
+        
+        self._invalidate_books(*set(book_ids))
+        return [row['id'] for row in rows]
+    
+    def return_book(self, book_id: int) -> bool:
+        """Принять возвращённый экземпляр книги
         
+        Экземпляр в той же транзакции достаётся первому в очереди за
+        книгой, а если очереди нет, возвращается в available. Возвращает
+        False, если книга не найдена, списана или все её экземпляры на месте.
+        """
+        with self._waitlist_transaction() as (conn, changes):
+            row = conn.execute(
+                "SELECT available, quantity FROM books WHERE id = ? AND is_active = 1", (book_id,)
+            ).fetchone()
+            if row is None or row['available'] >= row['quantity']:
+                return False
+            
+            self._release_copies(conn, [book_id], changes)
+        
+        self._invalidate_books(book_id)
+        return True
+    
+    def _release_copies(self, conn: sqlite3.Connection, book_ids: Iterable[int],
+                        changes: List[QueueChange]) -> List[Reservation]:
+        """Освободить экземпляры книг в текущей транзакции
+        
+        Каждое вхождение ID освобождает один экземпляр. Экземпляр
+        бронируется на первого в очереди за книгой, а если очередь пуста,
+        возвращается в available (не выше quantity). Возвращает
+        бронирования, созданные для ожидавших.
+        """
+        counts: Dict[int, int] = {}
+        for book_id in book_ids:
+            counts[book_id] = counts.get(book_id, 0) + 1
+        
+        handed_off: List[Reservation] = []
+        for book_id, count in counts.items():
+            reservations = self._hand_off(conn, book_id, count, changes)
+            handed_off.extend(reservations)
+            if count > len(reservations):
+                conn.execute(
+                    "UPDATE books SET available = MIN(quantity, available + ?) WHERE id = ?",
+                    (count - len(reservations), book_id)
+                )
+        return handed_off
+    
+    def _hand_off(self, conn: sqlite3.Connection, book_id: int, count: int,
+                  changes: List[QueueChange]) -> List[Reservation]:
+        """Забронировать до count экземпляров на первых в очереди за книгой
+        
+        Ожидавшие удаляются из очереди и получают бронирование со сроком
+        получения PICKUP_WINDOW; не забранный в срок экземпляр
+        сборщик передаст следующему. Списанные книги не раздаются.
+        """
+        active = conn.execute(
+            "SELECT 1 FROM books WHERE id = ? AND is_active = 1", (book_id,)
+        ).fetchone()
+        if not active:
+            return []
+        
+        reservations = []
+        now = datetime.now()
+        for _ in range(count):
+            waiter = conn.execute('''
+                SELECT id, user_id FROM waitlist
+                WHERE book_id = ?
+                ORDER BY priority, id
+                LIMIT 1
+            ''', (book_id,)).fetchone()
+            if waiter is None:
+                break
+            
+            conn.execute("DELETE FROM waitlist WHERE id = ?", (waiter['id'],))
+            changes.append(('remove', book_id, waiter['user_id'], None))
+            
+            reservation = Reservation(
+                id=0,
+                book_id=book_id,
+                user_id=waiter['user_id'],
+                status=ReservationStatus.PENDING,
+                reservation_date=now,
+                pickup_deadline=now + PICKUP_WINDOW
+            )
+            reservation.id = self._insert_reservation(conn, reservation)
+            reservations.append(reservation)
         return reservations
     
+    # === Очереди ожидания ===
+    
+    @contextmanager
+    def _waitlist_transaction(self) -> Iterator[Tuple[sqlite3.Connection, List[QueueChange]]]:
+        """Транзакция, которая может менять очереди ожидания
+        
+        Изменения очередей записываются в список и применяются к индексу
+        в памяти только после commit, поэтому откат транзакции индекс не
+        портит.
+        """
+        changes: List[QueueChange] = []
+        with self._transaction() as conn:
+            before = self._waitlist_version(conn)
+            yield conn, changes
+            after = self._waitlist_version(conn)
+        
+        if changes or before != after:
+            self._waitlist_index.apply(before, after, changes)
+    
+    @staticmethod
+    def _waitlist_version(conn: sqlite3.Connection) -> int:
+        """Версия очередей ожидания в БД"""
+        return conn.execute("SELECT version FROM waitlist_version WHERE id = 1").fetchone()[0]
+    
+    def join_waitlist(self, book_id: int, user_id: int,
+                      priority: int = 0) -> Optional[WaitlistEntry]:
+        """Встать в очередь за книгой
+        
+        Меньший priority обслуживается раньше, при равном — кто раньше
+        встал. Повторный вызов возвращает уже существующее место. Если
+        свободный экземпляр есть (например, тираж увеличили), он сразу
+        достаётся первым в очереди; если это сам пользователь, в записи
+        заполнено reservation, а position равен None. Возвращает None,
+        если книга не найдена или списана.
+        """
+        with self._waitlist_transaction() as (conn, changes):
+            book = conn.execute(
+                "SELECT available FROM books WHERE id = ? AND is_active = 1", (book_id,)
+            ).fetchone()
+            if book is None:
+                return None
+            
+            row = conn.execute(
+                "SELECT * FROM waitlist WHERE book_id = ? AND user_id = ?", (book_id, user_id)
+            ).fetchone()
+            if row is None:
+                cursor = conn.execute(
+                    "INSERT INTO waitlist (book_id, user_id, priority) VALUES (?, ?, ?)",
+                    (book_id, user_id, priority)
+                )
+                entry = WaitlistEntry(id=cursor.lastrowid, book_id=book_id,
+                                      user_id=user_id, priority=priority)
+                changes.append(('add', book_id, user_id, (priority, entry.id)))
+            else:
+                entry = self._row_to_waitlist_entry(row)
+            
+            handed_off = []
+            if book['available'] > 0:
+                handed_off = self._hand_off(conn, book_id, book['available'], changes)
+                conn.execute(
+                    "UPDATE books SET available = available - ? WHERE id = ?",
+                    (len(handed_off), book_id)
+                )
+        
+        if handed_off:
+            self._invalidate_books(book_id)
+        for reservation in handed_off:
+            if reservation.user_id == user_id:
+                entry.reservation = reservation
+                return entry
+        
+        entry.position = self.waitlist_position(book_id, user_id)
+        return entry
+    
+    def leave_waitlist(self, book_id: int, user_id: int) -> bool:
+        """Выйти из очереди за книгой"""
+        with self._waitlist_transaction() as (conn, changes):
+            cursor = conn.execute(
+                "DELETE FROM waitlist WHERE book_id = ? AND user_id = ?", (book_id, user_id)
+            )
+            if cursor.rowcount:
+                changes.append(('remove', book_id, user_id, None))
+        
+        return cursor.rowcount > 0
+    
+    def waitlist_position(self, book_id: int, user_id: int) -> Optional[int]:
+        """Место пользователя в очереди за книгой (с 1) или None
+        
+        Ответ даёт индекс в памяти за O(log n); очередь читается из БД,
+        только если индекс её ещё не содержит или очереди менял другой
+        процесс.
+        """
+        with self._pool.reader() as conn:
+            def load():
+                return conn.execute(
+                    "SELECT user_id, priority, id FROM waitlist WHERE book_id = ?", (book_id,)
+                ).fetchall()
+            
+            return self._waitlist_index.position(
+                book_id, user_id, self._waitlist_version(conn), load
+            )
+    
+    @staticmethod
+    def _row_to_waitlist_entry(row: sqlite3.Row) -> WaitlistEntry:
+        """Преобразовать строку таблицы waitlist в WaitlistEntry"""
+        return WaitlistEntry(
+            id=row['id'],
+            book_id=row['book_id'],
+            user_id=row['user_id'],
+            priority=row['priority'],
+            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None
+        )
+    
+    # === Выгрузка для отчётов ===
+    
+    def iter_reservation_rows(self, since: datetime, until: datetime,
+                              chunk_size: int = 10000) -> Iterator[List[sqlite3.Row]]:
+        """Бронирования за период [since, until) пачками по chunk_size
+        
+        Каждая пачка читается отдельным коротким запросом по ключу id на
+        соединении для чтения, поэтому выгрузка не удерживает блокировку
+        между пачками и не задерживает запись даже в журнале отката.
+        Строки содержат id, book_id, status и reservation_ts — время
+        бронирования в секундах от 1970-01-01 без учёта часового пояса.
+        """
+        if chunk_size <= 0:
+            raise ValueError("Размер пачки должен быть положительным")
+        
+        last_id = 0
+        while True:
+            with self._pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT id, book_id, status,
+                           CAST(strftime('%s', reservation_date) AS INTEGER) AS reservation_ts
+                    FROM reservations
+                    WHERE id > ? AND reservation_date >= ? AND reservation_date < ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, since.isoformat(), until.isoformat(), chunk_size)).fetchall()
+            
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1]['id']
+    
+    def iter_book_rows(self, chunk_size: int = 10000) -> Iterator[List[sqlite3.Row]]:
+        """Все книги, включая списанные, пачками по chunk_size в порядке id
+        
+        Строки содержат id, title, author, genre, quantity и is_active.
+        Как и iter_reservation_rows, каждая пачка — отдельный запрос.
+        """
+        if chunk_size <= 0:
+            raise ValueError("Размер пачки должен быть положительным")
+        
+        last_id = 0
+        while True:
+            with self._pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT id, title, author, genre, quantity, is_active
+                    FROM books
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, chunk_size)).fetchall()
+            
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1]['id']
+    
     def close(self) -> None:
-        """Закрыть соединение с БД"""
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        """Закрыть соединения с БД"""
+        # Новый пул откроет соединения заново, если менеджер ещё понадобится
+        pool, self._pool = self._pool, self._create_pool()
+        pool.close()
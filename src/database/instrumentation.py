@@ -0,0 +1,436 @@
+"""
+Замеры SQL-выражений DatabaseManager и журнал медленных запросов
+"""
+import json
+import math
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+from itertools import chain
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+# Верхние границы интервалов гистограммы задержки, мс
+LATENCY_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+_LATENCY_BOUNDS = tuple(bound / 1000 for bound in LATENCY_BOUNDS_MS)
+
+# Замеры выражения копятся в списке и переносятся в гистограмму пачками
+FOLD_SIZE = 1024
+
+# Тексты SQL учитываются по отдельности, пока их не больше MAX_STATEMENTS;
+# остальные (например, IN со всё новым числом параметров) учитываются вместе
+MAX_STATEMENTS = 2000
+OTHER_STATEMENTS = '<прочие выражения>'
+
+_clock = time.perf_counter
+
+# Методы базовых классов sqlite3, которые обёртки вызывают напрямую
+_new_cursor = sqlite3.Connection.cursor
+_execute = sqlite3.Cursor.execute
+_executemany = sqlite3.Cursor.executemany
+_executescript = sqlite3.Cursor.executescript
+
+
+class LatencyStats:
+    """Гистограмма времени выполнения выражений, ошибки и изменённые строки
+
+    Перцентили оцениваются по интервалам гистограммы: возвращается
+    верхняя граница интервала, в который попадает нужный ранг (для
+    последнего интервала — максимальное значение).
+    """
+
+    __slots__ = ('counts', 'time', 'max', 'errors', 'rows')
+
+    def __init__(self):
+        self.counts = [0] * (len(_LATENCY_BOUNDS) + 1)
+        self.time = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.rows = 0
+
+    @property
+    def executions(self) -> int:
+        return sum(self.counts)
+
+    def merge(self, other: "LatencyStats") -> None:
+        """Добавить показатели другого выражения"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.time += other.time
+        self.max = max(self.max, other.max)
+        self.errors += other.errors
+        self.rows += other.rows
+
+    def percentile(self, q: float) -> float:
+        """Оценка перцентиля q времени выражения, мс"""
+        executions = self.executions
+        if not executions:
+            return 0.0
+
+        rank = max(1, math.ceil(q / 100 * executions))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BOUNDS_MS[i] if i < len(LATENCY_BOUNDS_MS) else round(self.max * 1000, 4)
+        return round(self.max * 1000, 4)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"<={bound}ms" for bound in LATENCY_BOUNDS_MS]
+        labels.append(f">{LATENCY_BOUNDS_MS[-1]}ms")
+        executions = self.executions
+        return {
+            'statements': executions,
+            'errors': self.errors,
+            'total_ms': round(self.time * 1000, 3),
+            'mean_ms': round(self.time * 1000 / executions, 4) if executions else 0.0,
+            'max_ms': round(self.max * 1000, 4),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'histogram': {label: count for label, count in zip(labels, self.counts) if count},
+            'rows': self.rows,
+        }
+
+
+class StatementStats(LatencyStats):
+    """Показатели одного текста SQL
+
+    Выполнение выражения только дописывает своё время в pending, а число
+    изменённых строк — в changed: list.append атомарен, поэтому потоки
+    пишут туда без блокировки. В гистограмму замеры переносит fold, его
+    вызывают под блокировкой инструментации.
+    """
+
+    __slots__ = ('sql', 'method', 'pending', 'changed')
+
+    def __init__(self, sql: str, method: Optional[str]):
+        super().__init__()
+        self.sql = sql
+        self.method = method
+        self.pending: List[float] = []
+        self.changed: List[int] = []
+
+    def fold(self) -> None:
+        """Перенести накопленные замеры в гистограмму"""
+        # Замеры, дописанные во время переноса, остаются за size до следующего раза
+        pending = self.pending
+        size = len(pending)
+        if size:
+            batch = sorted(pending[:size])
+            del pending[:size]
+            # Отсортированная пачка раскладывается по интервалам одним
+            # bisect на границу, а не на каждое значение
+            start = 0
+            for i, bound in enumerate(_LATENCY_BOUNDS):
+                end = bisect_right(batch, bound, start)
+                self.counts[i] += end - start
+                start = end
+            self.counts[-1] += size - start
+            self.time += sum(batch)
+            self.max = max(self.max, batch[-1])
+
+        changed = self.changed
+        size = len(changed)
+        if size:
+            self.rows += sum(changed[:size])
+            del changed[:size]
+
+
+def parameter_shape(parameters: Any) -> Any:
+    """Типы связанных параметров без самих значений
+
+    Значения в журнал не попадают: среди них бывают хеши паролей и
+    личные данные. Для строк и blob указывается длина.
+    """
+    def shape(value: Any) -> str:
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {name: shape(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [shape(value) for value in parameters]
+    return shape(parameters)
+
+
+def explain(conn: sqlite3.Connection, sql: str, parameters: Any) -> List[str]:
+    """Строки EXPLAIN QUERY PLAN выражения; пустой список, если плана нет
+
+    Запрос выполняется обычным курсором, чтобы не попасть в замеры.
+    """
+    try:
+        cursor = sqlite3.Cursor(conn)
+        try:
+            rows = _execute(cursor, f"EXPLAIN QUERY PLAN {sql}", parameters or ()).fetchall()
+        finally:
+            cursor.close()
+    except sqlite3.Error:
+        # BEGIN, COMMIT, PRAGMA и скрипты плана не имеют
+        return []
+    return [row[-1] for row in rows]
+
+
+def _caller() -> Optional[str]:
+    """Имя функции, выполнившей выражение: ближайшая рамка стека вне модуля"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals is globals():
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else None
+
+
+class QueryInstrumentation:
+    """Время и строки SQL-выражений DatabaseManager
+
+    Замеряется каждое выражение: соединения открываются как
+    InstrumentedConnection, и время execute, executemany, executescript,
+    commit и rollback попадает в гистограмму своего текста SQL. Время
+    выражения — время execute: подготовка и первый шаг, для выборки по
+    ключу это почти весь запрос. Строки — записи, изменённые выражением
+    (rowcount). Выбранные строки не считаются: для этого conn.execute
+    пришлось бы возвращать подкласс курсора, а его создание обходится
+    дороже всего остального замера.
+
+    Выражения учитываются по тексту SQL: поиск по словарю — самый
+    дешёвый способ связать замер с выражением. Метод выражения —
+    функция, впервые его выполнившая; стек просматривается только при
+    первом выполнении текста и для медленных выражений. Отчёт по
+    методам складывает показатели их выражений, поэтому выражение,
+    общее для нескольких методов, попадает к первому из них.
+
+    Каждое выражение дольше slow_threshold секунд попадает в журнал
+    медленных запросов с методом, планом EXPLAIN QUERY PLAN и типами
+    параметров: последние slow_log_size записей хранятся в памяти, а
+    если задан slow_log_path — дописываются в файл по строке JSON на запрос.
+
+    Выполнение выражения не берёт блокировок: замеры дописываются в
+    списки выражения и переносятся в гистограмму пачками по FOLD_SIZE
+    и при построении отчёта.
+    """
+
+    def __init__(self, slow_threshold: float = 0.1, slow_log_size: int = 100,
+                 slow_log_path: Optional[str] = None):
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = slow_log_path
+        self._statements: Dict[str, StatementStats] = {}
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=slow_log_size)
+        self._slow_total = 0
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    # === Выражения ===
+
+    def _statement(self, sql: str) -> StatementStats:
+        """Показатели выражения, которое ещё не встречалось"""
+        with self._lock:
+            stats = self._statements.get(sql)
+            if stats is not None:
+                return stats
+            if len(self._statements) < MAX_STATEMENTS:
+                stats = self._statements[sql] = StatementStats(sql, _caller())
+                return stats
+            stats = self._statements.get(OTHER_STATEMENTS)
+            if stats is None:
+                stats = self._statements[OTHER_STATEMENTS] = StatementStats(OTHER_STATEMENTS, None)
+            return stats
+
+    def record(self, conn: sqlite3.Connection, sql: str, parameters: Any,
+               elapsed: float, rows: int) -> None:
+        """Учесть выполненное выражение; rows — изменённые строки или -1"""
+        stats = self._statements.get(sql) or self._statement(sql)
+        stats.pending.append(elapsed)
+        if rows > 0:
+            stats.changed.append(rows)
+        if len(stats.pending) >= FOLD_SIZE:
+            self._fold(stats)
+        if elapsed >= self.slow_threshold:
+            self._log_slow(conn, sql, parameters, elapsed, rows)
+
+    def record_error(self, conn: sqlite3.Connection, sql: str, parameters: Any,
+                     elapsed: float, error: BaseException) -> None:
+        """Учесть выражение, завершившееся ошибкой"""
+        stats = self._statements.get(sql) or self._statement(sql)
+        with self._lock:
+            stats.errors += 1
+        if elapsed >= self.slow_threshold:
+            self._log_slow(conn, sql, parameters, elapsed, -1, error)
+
+    def _fold(self, stats: StatementStats) -> None:
+        with self._lock:
+            stats.fold()
+
+    def _log_slow(self, conn: sqlite3.Connection, sql: str, parameters: Any,
+                  elapsed: float, rows: int, error: Optional[BaseException] = None) -> None:
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'method': _caller(),
+            'sql': ' '.join(sql.split()),
+            'duration_ms': round(elapsed * 1000, 3),
+            # У выборки rowcount равен -1
+            'rows': rows if rows >= 0 else None,
+            'parameters': parameter_shape(parameters),
+            'plan': explain(conn, sql, parameters),
+        }
+        if error is not None:
+            entry['error'] = type(error).__name__
+
+        with self._lock:
+            self._slow.append(entry)
+            self._slow_total += 1
+
+        if self.slow_log_path:
+            line = json.dumps(entry, ensure_ascii=False)
+            with self._file_lock, open(self.slow_log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    # === Отчёт ===
+
+    def stats(self) -> Dict[str, Any]:
+        """Показатели по методам и выражениям, от наибольшего суммарного времени"""
+        methods: Dict[str, LatencyStats] = {}
+        with self._lock:
+            statements = list(self._statements.values())
+            for stats in statements:
+                stats.fold()
+                methods.setdefault(stats.method or OTHER_STATEMENTS, LatencyStats()).merge(stats)
+            entries = [
+                {'sql': ' '.join(stats.sql.split()), 'method': stats.method, **stats.to_dict()}
+                for stats in statements if stats.executions or stats.errors
+            ]
+            slow_total = self._slow_total
+
+        method_entries = {name: stats.to_dict() for name, stats in methods.items()
+                          if stats.executions or stats.errors}
+        order = sorted(method_entries, key=lambda name: -method_entries[name]['total_ms'])
+        return {
+            'slow_threshold_ms': self.slow_threshold * 1000,
+            'slow_queries': slow_total,
+            'methods': {name: method_entries[name] for name in order},
+            'statements': sorted(entries, key=lambda entry: -entry['total_ms']),
+        }
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        """Последние записи журнала медленных запросов, от старых к новым"""
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self) -> None:
+        """Сбросить накопленные показатели и журнал в памяти"""
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self._slow_total = 0
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор conn.cursor(), замеряющий каждое выражение"""
+
+    def execute(self, sql: str, parameters: Any = ()) -> "InstrumentedCursor":
+        instrumentation = self.connection.instrumentation
+        start = _clock()
+        try:
+            _execute(self, sql, parameters)
+        except BaseException as e:
+            instrumentation.record_error(self.connection, sql, parameters, _clock() - start, e)
+            raise
+        instrumentation.record(self.connection, sql, parameters, _clock() - start, self.rowcount)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> "InstrumentedCursor":
+        # Для плана и журнала нужен первый набор параметров; наборы могут
+        # идти из генератора, поэтому первый берётся и возвращается в поток
+        parameters = iter(seq_of_parameters)
+        first = next(parameters, None)
+        if first is not None:
+            parameters = chain((first,), parameters)
+
+        instrumentation = self.connection.instrumentation
+        start = _clock()
+        try:
+            _executemany(self, sql, parameters)
+        except BaseException as e:
+            instrumentation.record_error(self.connection, sql, first, _clock() - start, e)
+            raise
+        instrumentation.record(self.connection, sql, first, _clock() - start, self.rowcount)
+        return self
+
+    def executescript(self, sql_script: str) -> "InstrumentedCursor":
+        instrumentation = self.connection.instrumentation
+        start = _clock()
+        try:
+            _executescript(self, sql_script)
+        except BaseException as e:
+            instrumentation.record_error(self.connection, sql_script, None, _clock() - start, e)
+            raise
+        instrumentation.record(self.connection, sql_script, None, _clock() - start, -1)
+        return self
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, замеряющее каждое выражение
+
+    Открывается через sqlite3.connect(factory=InstrumentedConnection);
+    до первого выражения соединению присваивается атрибут instrumentation.
+    conn.execute, самый частый путь, возвращает обычный sqlite3.Cursor;
+    conn.cursor() — InstrumentedCursor. Время commit и rollback
+    учитывается как выражения COMMIT и ROLLBACK.
+    """
+
+    instrumentation: Optional[QueryInstrumentation] = None
+
+    def cursor(self, factory: type = InstrumentedCursor) -> sqlite3.Cursor:
+        return _new_cursor(self, factory)
+
+    def execute(self, sql: str, parameters: Any = ()) -> sqlite3.Cursor:
+        # Выполняется на каждом выражении, поэтому record развёрнут здесь
+        cursor = _new_cursor(self)
+        instrumentation = self.instrumentation
+        start = _clock()
+        try:
+            _execute(cursor, sql, parameters)
+        except BaseException as e:
+            instrumentation.record_error(self, sql, parameters, _clock() - start, e)
+            raise
+        elapsed = _clock() - start
+
+        stats = instrumentation._statements.get(sql) or instrumentation._statement(sql)
+        pending = stats.pending
+        pending.append(elapsed)
+        rows = cursor.rowcount
+        if rows > 0:
+            stats.changed.append(rows)
+        if len(pending) >= FOLD_SIZE:
+            instrumentation._fold(stats)
+        if elapsed >= instrumentation.slow_threshold:
+            instrumentation._log_slow(self, sql, parameters, elapsed, rows)
+        return cursor
+
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]) -> InstrumentedCursor:
+        return _new_cursor(self, InstrumentedCursor).executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str) -> InstrumentedCursor:
+        return _new_cursor(self, InstrumentedCursor).executescript(sql_script)
+
+    def commit(self) -> None:
+        self._finish('COMMIT', sqlite3.Connection.commit)
+
+    def rollback(self) -> None:
+        self._finish('ROLLBACK', sqlite3.Connection.rollback)
+
+    def _finish(self, sql: str, operation: Any) -> None:
+        if not self.in_transaction:
+            operation(self)
+            return
+
+        start = _clock()
+        try:
+            operation(self)
+        except BaseException as e:
+            self.instrumentation.record_error(self, sql, None, _clock() - start, e)
+            raise
+        self.instrumentation.record(self, sql, None, _clock() - start, -1)
@@ -0,0 +1,79 @@
+"""
+Фоновая отмена просроченных бронирований
+"""
+import threading
+import traceback
+from typing import Optional
+
+from .database_manager import DatabaseManager
+
+
+class ReservationSweeper:
+    """Периодически отменяет бронирования с истёкшим сроком получения
+
+    Каждые interval секунд просроченные бронирования отменяются пачками
+    по batch_size, по транзакции на пачку, поэтому блокировка на запись
+    не удерживается надолго. Сборщики можно запускать одновременно в
+    нескольких процессах: DatabaseManager.expire_reservations выполняет
+    пачку в BEGIN IMMEDIATE, и одно бронирование отменяется один раз.
+    """
+
+    def __init__(self, db: DatabaseManager, interval: float = 60.0, batch_size: int = 100):
+        if interval <= 0:
+            raise ValueError("Интервал сборщика должен быть положительным")
+        if batch_size <= 0:
+            raise ValueError("Размер пачки должен быть положительным")
+
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.expired_total = 0
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sweep(self) -> int:
+        """Отменить все просроченные на данный момент бронирования
+
+        Возвращает число отменённых бронирований.
+        """
+        expired = 0
+        while not self._stop.is_set():
+            batch = self.db.expire_reservations(self.batch_size)
+            expired += len(batch)
+            if len(batch) < self.batch_size:
+                break
+
+        self.expired_total += expired
+        return expired
+
+    def start(self) -> None:
+        """Запустить сборщик в фоновом потоке"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="reservation-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Остановить сборщик, дождавшись текущей пачки"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                # Ошибка одного прохода (например, БД занята другим
+                # процессом дольше таймаута) не должна останавливать сборщик
+                traceback.print_exc()
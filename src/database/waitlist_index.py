@@ -0,0 +1,104 @@
+"""
+Индекс очередей ожидания в памяти
+"""
+import threading
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Ключ места в очереди: (приоритет, ID записи). Меньший ключ обслуживается
+# раньше, поэтому при равном приоритете очередь работает как FIFO
+QueueKey = Tuple[int, int]
+
+# Изменение очереди: ('add' или 'remove', ID книги, ID пользователя, ключ)
+QueueChange = Tuple[str, int, int, Optional[QueueKey]]
+
+
+class WaitlistIndex:
+    """Отсортированные очереди ожидания по книгам
+
+    Для каждой загруженной книги хранится список ключей в порядке
+    обслуживания, и место пользователя находится двоичным поиском за
+    O(log n). Индекс — кэш таблицы waitlist, помеченный версией очередей
+    в БД. Если версия в БД отличается (очередь изменил другой процесс),
+    индекс сбрасывается и очереди загружаются заново по мере запросов.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self._queues: Dict[int, List[QueueKey]] = {}
+        self._keys: Dict[Tuple[int, int], QueueKey] = {}  # (книга, пользователь) -> ключ
+        self._lock = threading.Lock()
+
+    def position(self, book_id: int, user_id: int, version: int,
+                 load: Callable[[], Iterable[Tuple[int, int, int]]]) -> Optional[int]:
+        """Место пользователя в очереди за книгой, начиная с 1, или None
+
+        version — текущая версия очередей в БД; load возвращает строки
+        (user_id, priority, id) очереди книги и вызывается, только если
+        очередь ещё не загружена.
+        """
+        with self._lock:
+            if self.version != version:
+                self._clear(version)
+            if book_id not in self._queues:
+                self._load(book_id, load())
+
+            key = self._keys.get((book_id, user_id))
+            if key is None:
+                return None
+            return bisect_left(self._queues[book_id], key) + 1
+
+    def apply(self, before: int, after: int, changes: Iterable[QueueChange]) -> None:
+        """Применить изменения очередей, записанные транзакцией
+
+        before и after — версии очередей в начале и в конце транзакции.
+        Если индекс не соответствовал версии before, изменения других
+        процессов в нём не учтены, и индекс сбрасывается.
+        """
+        with self._lock:
+            if self.version != before:
+                self._clear(None)
+                return
+
+            for action, book_id, user_id, key in changes:
+                if action == 'add':
+                    self._add(book_id, user_id, key)
+                else:
+                    self._remove(book_id, user_id)
+            self.version = after
+
+    def clear(self) -> None:
+        """Сбросить индекс"""
+        with self._lock:
+            self._clear(None)
+
+    def _clear(self, version: Optional[int]) -> None:
+        self._queues.clear()
+        self._keys.clear()
+        self.version = version
+
+    def _load(self, book_id: int, rows: Iterable[Tuple[int, int, int]]) -> None:
+        queue = []
+        for user_id, priority, entry_id in rows:
+            key = (priority, entry_id)
+            queue.append(key)
+            self._keys[(book_id, user_id)] = key
+        queue.sort()
+        self._queues[book_id] = queue
+
+    def _add(self, book_id: int, user_id: int, key: QueueKey) -> None:
+        # Очереди, которые ещё не загружены, прочитаются из БД целиком
+        queue = self._queues.get(book_id)
+        if queue is not None:
+            insort(queue, key)
+            self._keys[(book_id, user_id)] = key
+
+    def _remove(self, book_id: int, user_id: int) -> None:
+        key = self._keys.pop((book_id, user_id), None)
+        queue = self._queues.get(book_id)
+        if key is None or queue is None:
+            return
+
+        i = bisect_left(queue, key)
+        if i < len(queue) and queue[i] == key:
+            del queue[i]
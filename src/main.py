@@ -1,31 +1,243 @@
 """
 Главный файл для запуска приложения
 """
+import os
+import json
+import secrets
 import sys
 import argparse
+from datetime import datetime
+from src.api.catalog_import import IMPORT_FORMATS, ImportProgress, import_catalog
+from src.api.library_api import LibraryAPI
+from src.auth.authentication import TOKEN_SECRET_ENV
+from src.database.database_manager import DUPLICATE_POLICIES, STORAGE_PROFILES, DatabaseManager
+from src.reports.circulation_report import BUCKETS, CirculationReport
 from src.ui.console.main_menu import ConsoleUI
-from src.ui.web.app import app as web_app
+from src.ui.web.app import app as web_app, configure_api, get_api
+from src.ui.web.asgi import (
+    DB_PATH_ENV, DB_PROFILE_ENV, SLOW_QUERY_LOG_ENV, SLOW_QUERY_MS_ENV, SWEEP_BATCH_ENV,
+    SWEEP_INTERVAL_ENV
+)
+from src.ui.web.prefork import PreforkServer
+
+
+def run_import(args) -> None:
+    """Импортировать каталог из файла с выводом скорости"""
+    def report(progress: ImportProgress) -> None:
+        print(f"   ... {progress.rows_read} строк, {progress.rows_per_second:.0f} строк/с")
+    
+    db = DatabaseManager(args.db, profile=args.db_profile)
+    progress = ImportProgress(report)
+    
+    print(f"📥 Импорт каталога из {args.file}")
+    try:
+        result = import_catalog(
+            db, args.file,
+            file_format=args.format,
+            on_duplicate=args.on_duplicate,
+            chunk_size=args.batch_size,
+            progress=progress
+        )
+    finally:
+        db.close()
+    
+    print(f"✅ Прочитано строк: {progress.rows_read} за {progress.elapsed:.1f} с "
+          f"({progress.rows_per_second:.0f} строк/с)")
+    print(f"   Записано: {result.written}, пропущено дубликатов: {result.skipped}, "
+          f"некорректных строк: {progress.invalid_rows}")
+
+
+def run_report(args) -> None:
+    """Напечатать отчёт об обороте фонда"""
+    db = DatabaseManager(args.db, profile=args.db_profile)
+    try:
+        report = CirculationReport.load(db, args.since, args.until)
+    finally:
+        db.close()
+    
+    if args.json:
+        print(json.dumps(report.to_dict(args.top, args.bucket), ensure_ascii=False, indent=2))
+        return
+    
+    print(f"📊 Оборот фонда с {report.since:%Y-%m-%d %H:%M} по {report.until:%Y-%m-%d %H:%M}, "
+          f"бронирований: {report.total_reservations}")
+    
+    print("\n🏆 Самые популярные книги:")
+    for place, row in enumerate(report.popular_books(args.top), 1):
+        print(f"   {place:>3}. {row['title']} — {row['author']}: {row['reservations']}")
+    
+    print(f"\n📈 Спрос по жанрам ({args.bucket}):")
+    for row in report.demand('genre', args.bucket):
+        print(f"   {row['period']}  {row['genre'] or '—'}: {row['reservations']}")
+    
+    for by, title in (('genre', 'жанрам'), ('author', 'авторам')):
+        print(f"\n📚 Бронирований на экземпляр по {title}:")
+        for row in report.utilization(by)[:args.top]:
+            utilization = '—' if row['utilization'] is None else f"{row['utilization']:.2f}"
+            print(f"   {row[by] or '—'}: {utilization} "
+                  f"({row['reservations']} на {row['quantity']} экз.)")
+
+
+def db_options(args) -> dict:
+    """Параметры DatabaseManager из командной строки"""
+    options = {'db_path': args.db, 'profile': args.db_profile}
+    if args.slow_query_ms is not None:
+        options.update(
+            instrument=True,
+            slow_query_threshold=args.slow_query_ms / 1000,
+            slow_query_log=args.slow_query_log
+        )
+    return options
+
+
+def start_sweeper(args) -> None:
+    """Запустить отмену просроченных бронирований в веб-приложении"""
+    if args.sweep_interval > 0:
+        get_api().start_expiry_sweeper(args.sweep_interval, args.sweep_batch)
+
+
+def run_asgi(args) -> None:
+    """Запустить ASGI-приложение под uvicorn"""
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ Для режима asgi нужен uvicorn: pip install uvicorn")
+        sys.exit(1)
+    
+    # Рабочие процессы импортируют приложение заново и берут настройки
+    # из окружения. Общий секрет нужен, чтобы токен, выданный одним
+    # процессом, принимался остальными.
+    os.environ[DB_PATH_ENV] = args.db
+    os.environ[DB_PROFILE_ENV] = args.db_profile
+    os.environ[SWEEP_INTERVAL_ENV] = str(args.sweep_interval)
+    os.environ[SWEEP_BATCH_ENV] = str(args.sweep_batch)
+    if args.slow_query_ms is not None:
+        os.environ[SLOW_QUERY_MS_ENV] = str(args.slow_query_ms)
+        os.environ[SLOW_QUERY_LOG_ENV] = args.slow_query_log or ''
+    os.environ.setdefault(TOKEN_SECRET_ENV, secrets.token_hex(32))
+    
+    print(f"🚀 Запуск ASGI-сервера на http://{args.host}:{args.port} "
+          f"(процессов: {args.workers})")
+    uvicorn.run(
+        "src.ui.web.asgi:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=args.keep_alive,
+        lifespan="on"
+    )
+
+
+def run_prefork(args) -> None:
+    """Запустить Flask-приложение в нескольких процессах"""
+    # Токены, выданные одним рабочим процессом, должны приниматься остальными
+    os.environ.setdefault(TOKEN_SECRET_ENV, secrets.token_hex(32))
+    
+    def start_worker() -> None:
+        # Главный процесс не открывает БД, поэтому соединения создаются
+        # заново в каждом рабочем процессе при первом запросе
+        configure_api(**db_options(args))
+        # Сборщик работает в каждом процессе: пачки отмены сериализуются
+        # блокировкой БД, и одно бронирование отменяется один раз
+        start_sweeper(args)
+    
+    server = PreforkServer(
+        web_app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        on_worker_start=start_worker
+    )
+    host, port = server.bind()
+    print(f"🚀 Запуск веб-сервера на http://{host}:{port} (процессов: {args.workers})")
+    server.serve_forever()
 
 
 def main():
     """Главная функция запуска приложения"""
     parser = argparse.ArgumentParser(description='Система управления библиотечным каталогом')
-    parser.add_argument('--mode', choices=['console', 'web'], default='console',
-                       help='Режим запуска: console (консоль) или web (веб-интерфейс)')
+    parser.add_argument('--mode', choices=['console', 'web', 'serve', 'asgi', 'import', 'report'],
+                       default='console',
+                       help='Режим запуска: console (консоль), web (веб-интерфейс, отладочный '
+                            'сервер), serve (веб-интерфейс в нескольких процессах), '
+                            'asgi (веб-API под uvicorn), import (импорт каталога из файла) '
+                            'или report (отчёт об обороте фонда)')
+    parser.add_argument('--host', default='127.0.0.1',
+                       help='Адрес для веб-сервера (режимы serve и asgi)')
     parser.add_argument('--port', type=int, default=5000,
-                       help='Порт для веб-сервера (только для режима web)')
+                       help='Порт для веб-сервера (режимы web, serve и asgi)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                       help='Число рабочих процессов (режимы serve и asgi), '
+                            'по умолчанию по числу ядер')
+    parser.add_argument('--max-requests', type=int, default=10000,
+                       help='После скольких запросов перезапускать рабочий процесс '
+                            '(только для режима serve, 0 — не перезапускать)')
+    parser.add_argument('--max-requests-jitter', type=int, default=1000,
+                       help='Случайная добавка к --max-requests, чтобы процессы '
+                            'не перезапускались одновременно')
+    parser.add_argument('--keep-alive', type=int, default=5,
+                       help='Сколько секунд держать простаивающее keep-alive соединение '
+                            '(только для режима asgi)')
+    parser.add_argument('--sweep-interval', type=float, default=60.0,
+                       help='Как часто, в секундах, отменять просроченные бронирования '
+                            '(веб-режимы, 0 — не отменять)')
+    parser.add_argument('--sweep-batch', type=int, default=100,
+                       help='Сколько просроченных бронирований отменять одной транзакцией')
+    parser.add_argument('--db', default='book_catalog.db',
+                       help='Путь к файлу базы данных')
+    parser.add_argument('--db-profile', choices=list(STORAGE_PROFILES), default='balanced',
+                       help='Профиль хранения SQLite: durable (fsync на каждый commit), '
+                            'balanced (WAL) или read-heavy (WAL, большой кэш и mmap)')
+    parser.add_argument('--slow-query-ms', type=float,
+                       help='Включить замеры запросов к БД (веб-режимы) и записывать в '
+                            'журнал запросы дольше стольких миллисекунд')
+    parser.add_argument('--slow-query-log',
+                       help='Файл, в который дописывается журнал медленных запросов '
+                            '(по строке JSON на запрос)')
+    parser.add_argument('--file',
+                       help='Файл каталога CSV или JSONL (только для режима import)')
+    parser.add_argument('--format', choices=IMPORT_FORMATS,
+                       help='Формат файла каталога; по умолчанию по расширению')
+    parser.add_argument('--on-duplicate', choices=DUPLICATE_POLICIES, default='skip',
+                       help='Что делать с уже существующим ISBN: пропустить, обновить или прервать импорт')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                       help='Размер пачки вставки при импорте')
+    parser.add_argument('--since', type=datetime.fromisoformat,
+                       help='Начало периода отчёта (ГГГГ-ММ-ДД), по умолчанию 30 дней назад')
+    parser.add_argument('--until', type=datetime.fromisoformat,
+                       help='Конец периода отчёта (ГГГГ-ММ-ДД), по умолчанию сейчас')
+    parser.add_argument('--bucket', choices=list(BUCKETS), default='week',
+                       help='Шаг спроса по времени в отчёте')
+    parser.add_argument('--top', type=int, default=10,
+                       help='Сколько строк выводить в рейтингах отчёта')
+    parser.add_argument('--json', action='store_true',
+                       help='Вывести отчёт в формате JSON')
     
     args = parser.parse_args()
     
     if args.mode == 'console':
         # Запуск консольного интерфейса
-        console_ui = ConsoleUI()
+        console_ui = ConsoleUI(LibraryAPI(args.db, profile=args.db_profile))
         console_ui.show_main_menu()
     elif args.mode == 'web':
         # Запуск веб-интерфейса
+        configure_api(**db_options(args))
+        start_sweeper(args)
         print(f"🚀 Запуск веб-сервера на http://localhost:{args.port}")
         print("📖 Откройте браузер и перейдите по указанному адресу")
-        web_app.run(debug=True, port=args.port)
+        web_app.run(debug=True, port=args.port, threaded=True)
+    elif args.mode == 'serve':
+        run_prefork(args)
+    elif args.mode == 'asgi':
+        run_asgi(args)
+    elif args.mode == 'import':
+        if not args.file:
+            parser.error('для режима import нужно указать --file')
+        run_import(args)
+    elif args.mode == 'report':
+        run_report(args)
     else:
         print("❌ Неизвестный режим запуска")
         sys.exit(1)
@@ -4,6 +4,7 @@
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from typing import Optional
 
 
 class ReservationStatus(Enum):
@@ -14,6 +15,14 @@ class ReservationStatus(Enum):
     COMPLETED = "completed"  # Завершено
 
 
+class ReservationOutcome(Enum):
+    """Итоги попытки бронирования"""
+    RESERVED = "reserved"    # Бронирование создано
+    SOLD_OUT = "sold_out"    # Свободных экземпляров не осталось
+    NOT_FOUND = "not_found"  # Книга не найдена или списана
+    ROLLED_BACK = "rolled_back"  # Отменено вместе с пакетом, где не всё удалось
+
+
 @dataclass
 class Reservation:
     """Класс, представляющий бронирование"""
@@ -59,3 +68,15 @@ class Reservation:
             'pickup_deadline': self.pickup_deadline.isoformat() if self.pickup_deadline else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+@dataclass
+class ReservationResult:
+    """Результат попытки бронирования"""
+    outcome: ReservationOutcome
+    reservation: Optional[Reservation] = None
+    
+    @property
+    def success(self) -> bool:
+        """Было ли создано бронирование"""
+        return self.outcome == ReservationOutcome.RESERVED
@@ -4,6 +4,7 @@
 from dataclasses import dataclass
 from enum import Enum
 from datetime import datetime
+from typing import Optional
 
 
 class UserRole(Enum):
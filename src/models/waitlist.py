@@ -0,0 +1,42 @@
+"""
+Модель очереди ожидания книги
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from .reservation import Reservation
+
+
+@dataclass
+class WaitlistEntry:
+    """Место пользователя в очереди за книгой
+    
+    Очередь упорядочена по priority (меньшее значение обслуживается
+    раньше), а при равном приоритете — по времени записи. Если экземпляр
+    достался пользователю сразу при записи, position равен None, а
+    reservation содержит созданное бронирование.
+    """
+    id: int
+    book_id: int
+    user_id: int
+    priority: int = 0
+    position: Optional[int] = None  # Место в очереди, начиная с 1
+    reservation: Optional[Reservation] = None
+    created_at: datetime = None
+    
+    def __post_init__(self):
+        if self.created_at is None:
+            self.created_at = datetime.now()
+    
+    def to_dict(self) -> dict:
+        """Преобразовать в словарь"""
+        return {
+            'id': self.id,
+            'book_id': self.book_id,
+            'user_id': self.user_id,
+            'priority': self.priority,
+            'position': self.position,
+            'reservation': self.reservation.to_dict() if self.reservation else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,264 @@
+"""
+Отчёт об обороте фонда: популярность книг, спрос по периодам и загрузка
+
+Бронирования за период выгружаются из БД пачками и раскладываются по
+столбцам: массивам NumPy, если он установлен, иначе array из
+стандартной библиотеки. Показатели считаются по столбцам целиком —
+подсчёт по группам выполняется одним bincount по кодам групп. Выгрузка
+идёт только через соединения для чтения и не блокирует запись.
+"""
+import heapq
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from ..database.database_manager import DatabaseManager
+from ..models.reservation import ReservationStatus
+
+try:
+    import numpy as np
+except ImportError:  # необязательная зависимость
+    np = None
+
+# Группировки для спроса и загрузки фонда
+GROUPINGS = ('genre', 'author')
+
+# Длина периода для спроса, секунд
+BUCKETS = {
+    'day': 24 * 60 * 60,
+    'week': 7 * 24 * 60 * 60,
+}
+
+# Начало отсчёта периодов — понедельник, чтобы недели начинались с понедельника
+BUCKET_ORIGIN = datetime(1970, 1, 5)
+_EPOCH = datetime(1970, 1, 1)
+
+# Период отчёта по умолчанию, если не задано начало
+DEFAULT_PERIOD = timedelta(days=30)
+
+# Сколько строк читать из БД за один запрос
+CHUNK_SIZE = 10000
+
+# Коды статусов бронирований в столбце статусов
+STATUS_CODES = {status.value: code for code, status in enumerate(ReservationStatus)}
+_CANCELLED = STATUS_CODES[ReservationStatus.CANCELLED.value]
+
+
+def _column(values: array) -> Sequence[int]:
+    """Столбец для вычислений: массив NumPy поверх буфера array без копирования"""
+    if np is None:
+        return values
+    return np.frombuffer(values, dtype=np.dtype(values.typecode))
+
+
+def _bincount(codes: Sequence[int], size: int,
+              weights: Optional[Sequence[int]] = None) -> Sequence[int]:
+    """Число вхождений (или сумма весов) каждого кода от 0 до size - 1"""
+    if np is not None:
+        counts = np.bincount(codes, weights=weights, minlength=size)
+        return counts.astype(np.int64) if weights is not None else counts
+
+    counts = [0] * size
+    if weights is None:
+        for code in codes:
+            counts[code] += 1
+    else:
+        for code, weight in zip(codes, weights):
+            counts[code] += weight
+    return counts
+
+
+def _take(column: Sequence[int], indexes: Sequence[int]) -> Sequence[int]:
+    """Значения столбца по индексам"""
+    if np is not None:
+        return column[indexes]
+    return array('q', (column[i] for i in indexes))
+
+
+def _nonzero(counts: Sequence[int]) -> List[int]:
+    """Индексы ненулевых значений по возрастанию"""
+    if np is not None:
+        return np.flatnonzero(counts).tolist()
+    return [i for i, count in enumerate(counts) if count]
+
+
+def _top(counts: Sequence[int], limit: int) -> List[int]:
+    """Индексы limit наибольших ненулевых значений; при равенстве — по возрастанию индекса"""
+    if np is not None:
+        order = np.argsort(-counts, kind='stable')[:limit]
+        return [int(i) for i in order if counts[i] > 0]
+    return [i for i in heapq.nlargest(limit, range(len(counts)), key=counts.__getitem__)
+            if counts[i] > 0]
+
+
+class CirculationReport:
+    """Показатели оборота фонда за период [since, until)
+
+    Отменённые бронирования в показателях не учитываются. Загрузка группы
+    (жанра или автора) — число бронирований за период на один экземпляр
+    активных книг группы.
+    """
+
+    def __init__(self, since: datetime, until: datetime,
+                 book_ids: array, titles: List[str], quantity: array,
+                 groups: Dict[str, List[str]], group_codes: Dict[str, array],
+                 reservation_books: array, reservation_times: array,
+                 reservation_statuses: array):
+        self.since = since
+        self.until = until
+        self.book_ids = _column(book_ids)
+        self.titles = titles
+        self.quantity = _column(quantity)
+        self.groups = groups
+        self.group_codes = {by: _column(codes) for by, codes in group_codes.items()}
+
+        # Дальше нужны только неотменённые бронирования
+        books = _column(reservation_books)
+        times = _column(reservation_times)
+        statuses = _column(reservation_statuses)
+        if np is not None:
+            kept = statuses != _CANCELLED
+            self._books, self._times = books[kept], times[kept]
+        else:
+            kept = [i for i, status in enumerate(statuses) if status != _CANCELLED]
+            self._books, self._times = _take(books, kept), _take(times, kept)
+
+    @classmethod
+    def load(cls, db: DatabaseManager, since: Optional[datetime] = None,
+             until: Optional[datetime] = None,
+             chunk_size: int = CHUNK_SIZE) -> "CirculationReport":
+        """Выгрузить бронирования за период с данными книг
+
+        По умолчанию отчёт строится за последние DEFAULT_PERIOD до
+        текущего момента.
+        """
+        until = until or datetime.now()
+        since = since or until - DEFAULT_PERIOD
+        if since >= until:
+            raise ValueError("Начало периода должно быть раньше конца")
+
+        book_ids, quantity = array('q'), array('q')
+        titles: List[str] = []
+        names: Dict[str, Dict[str, int]] = {by: {} for by in GROUPINGS}
+        group_codes = {by: array('q') for by in GROUPINGS}
+        for rows in db.iter_book_rows(chunk_size):
+            book_ids.extend(row['id'] for row in rows)
+            titles.extend(row['title'] for row in rows)
+            # Списанные книги остаются в популярности, но не в фонде
+            quantity.extend((row['quantity'] or 0) if row['is_active'] else 0 for row in rows)
+            for by in GROUPINGS:
+                codes = names[by]
+                group_codes[by].extend(
+                    codes.setdefault(row[by] or '', len(codes)) for row in rows
+                )
+
+        book_index = {book_id: i for i, book_id in enumerate(book_ids)}
+        reservation_books, reservation_times = array('q'), array('q')
+        reservation_statuses = array('b')
+        for rows in db.iter_reservation_rows(since, until, chunk_size):
+            # Бронирования несуществующих книг пропускаются
+            rows = [row for row in rows if row['book_id'] in book_index]
+            reservation_books.extend(book_index[row['book_id']] for row in rows)
+            reservation_times.extend(row['reservation_ts'] for row in rows)
+            reservation_statuses.extend(STATUS_CODES[row['status']] for row in rows)
+
+        return cls(
+            since, until, book_ids, titles, quantity,
+            {by: list(codes) for by, codes in names.items()}, group_codes,
+            reservation_books, reservation_times, reservation_statuses
+        )
+
+    @property
+    def total_reservations(self) -> int:
+        return len(self._books)
+
+    def popular_books(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Самые бронируемые книги за период"""
+        counts = _bincount(self._books, len(self.book_ids))
+        return [
+            {
+                'book_id': int(self.book_ids[i]),
+                'title': self.titles[i],
+                'author': self.groups['author'][self.group_codes['author'][i]],
+                'reservations': int(counts[i]),
+            }
+            for i in _top(counts, limit)
+        ]
+
+    def demand(self, by: str = 'genre', bucket: str = 'week') -> List[Dict[str, Any]]:
+        """Число бронирований по периодам и группам
+
+        Строки упорядочены по периоду, внутри периода — по убыванию спроса.
+        """
+        self._check_grouping(by)
+        if bucket not in BUCKETS:
+            raise ValueError(f"Период: {' или '.join(BUCKETS)}")
+        if not self.total_reservations:
+            return []
+
+        width = BUCKETS[bucket]
+        offset = int((BUCKET_ORIGIN - _EPOCH).total_seconds())
+        names = self.groups[by]
+        groups = _take(self.group_codes[by], self._books)
+        if np is not None:
+            buckets = (self._times - offset) // width
+            first = int(buckets.min())
+            keys = (buckets - first) * len(names) + groups
+            size = (int(buckets.max()) - first + 1) * len(names)
+        else:
+            buckets = [(t - offset) // width for t in self._times]
+            first = min(buckets)
+            keys = [(b - first) * len(names) + g for b, g in zip(buckets, groups)]
+            size = (max(buckets) - first + 1) * len(names)
+        counts = _bincount(keys, size)
+
+        rows = []
+        for key in _nonzero(counts):
+            period, group = divmod(key, len(names))
+            start = BUCKET_ORIGIN + timedelta(seconds=(first + period) * width)
+            rows.append({
+                'period': start.date().isoformat(),
+                by: names[group],
+                'reservations': int(counts[key]),
+            })
+        rows.sort(key=lambda row: (row['period'], -row['reservations'], row[by]))
+        return rows
+
+    def utilization(self, by: str = 'genre') -> List[Dict[str, Any]]:
+        """Бронирования на экземпляр по группам, по убыванию загрузки"""
+        self._check_grouping(by)
+        names = self.groups[by]
+        codes = self.group_codes[by]
+        reserved = _bincount(_take(codes, self._books), len(names))
+        copies = _bincount(codes, len(names), weights=self.quantity)
+
+        rows = []
+        for group, name in enumerate(names):
+            if not reserved[group] and not copies[group]:
+                continue
+            rows.append({
+                by: name,
+                'reservations': int(reserved[group]),
+                'quantity': int(copies[group]),
+                'utilization': (round(float(reserved[group] / copies[group]), 4)
+                                if copies[group] else None),
+            })
+        rows.sort(key=lambda row: (-(row['utilization'] or 0), -row['reservations'], row[by]))
+        return rows
+
+    def to_dict(self, limit: int = 10, bucket: str = 'week') -> Dict[str, Any]:
+        """Полный отчёт: популярность, спрос по жанрам и загрузка"""
+        return {
+            'since': self.since.isoformat(),
+            'until': self.until.isoformat(),
+            'reservations': self.total_reservations,
+            'popular_books': self.popular_books(limit),
+            'demand_by_genre': self.demand('genre', bucket),
+            'utilization_by_genre': self.utilization('genre'),
+            'utilization_by_author': self.utilization('author'),
+        }
+
+    @staticmethod
+    def _check_grouping(by: str) -> None:
+        if by not in GROUPINGS:
+            raise ValueError(f"Группировка: {' или '.join(GROUPINGS)}")
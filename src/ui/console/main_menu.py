@@ -10,8 +10,8 @@ from ...api.library_api import LibraryAPI
 class ConsoleUI:
     """Класс консольного интерфейса"""
     
-    def __init__(self):
-        self.api = LibraryAPI()
+    def __init__(self, api: LibraryAPI = None):
+        self.api = api or LibraryAPI()
         self.is_running = True
     
     def clear_screen(self):
@@ -98,27 +98,32 @@ class ConsoleUI:
         
         year = int(year_input) if year_input.isdigit() else None
         
-        # Выполняем поиск
-        books = self.api.search_books(
+        # Выполняем поиск; книги выводятся по мере чтения из базы
+        books = self.api.iter_search_books(
             query=title or author,
             year=year,
             genre=genre if genre else None
         )
         
-        if not books:
+        found = 0
+        for i, book in enumerate(books, 1):
+            if i == 1:
+                print("\n📚 Найденные книги:")
+                print("-" * 80)
+        
+            status = "✅ Доступна" if book.available > 0 else "⛔ Нет в наличии"
+            print(f"{i}. {book.title}")
+            print(f"   Автор: {book.author} | Год: {book.year} | Жанр: {book.genre}")
+            print(f"   Издательство: {book.publisher} | Страниц: {book.pages}")
+            print(f"   ISBN: {book.isbn} | Статус: {status}")
+            print(f"   В наличии: {book.available}/{book.quantity}")
+            print("-" * 80)
+            found = i
+        
+        if not found:
             print("\n📭 Книги не найдены")
         else:
-            print(f"\n📚 Найдено книг: {len(books)}")
-            print("-" * 80)
-            
-            for i, book in enumerate(books, 1):
-                status = "✅ Доступна" if book.available > 0 else "⛔ Нет в наличии"
-                print(f"{i}. {book.title}")
-                print(f"   Автор: {book.author} | Год: {book.year} | Жанр: {book.genre}")
-                print(f"   Издательство: {book.publisher} | Страниц: {book.pages}")
-                print(f"   ISBN: {book.isbn} | Статус: {status}")
-                print(f"   В наличии: {book.available}/{book.quantity}")
-                print("-" * 80)
+            print(f"\n📚 Найдено книг: {found}")
         
         input("\nНажмите Enter для возврата в меню...")
     
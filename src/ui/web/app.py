@@ -1,16 +1,47 @@
 """
 Веб-интерфейс для системы каталога на Flask
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
+from typing import Any, Dict, Optional
 from ...api.library_api import LibraryAPI
+from ...auth.password_hashing import AuthenticationBusyError
+from . import handlers, streaming
 import json
-
+import threading
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # В реальном проекте используйте переменные окружения
 
-# Глобальный объект API (в реальном проекте используйте контекст приложения)
-api = LibraryAPI()
+# Глобальный объект API создаётся при первом запросе с параметрами из configure_api
+_api: Optional[LibraryAPI] = None
+_api_options: Dict[str, Any] = {}
+_api_lock = threading.Lock()
+
+
+def configure_api(**options) -> None:
+    """Задать параметры LibraryAPI (путь к БД, профиль хранения)"""
+    global _api
+    with _api_lock:
+        if _api is not None:
+            _api.close()
+            _api = None
+        _api_options.clear()
+        _api_options.update(options)
+
+
+def get_api() -> LibraryAPI:
+    """Получить общий объект API, создав его при необходимости"""
+    global _api
+    if _api is None:
+        with _api_lock:
+            if _api is None:
+                _api = LibraryAPI(**_api_options)
+    return _api
+
+
+def request_token() -> Optional[str]:
+    """Токен доступа запроса: заголовок Authorization: Bearer или сессия"""
+    return handlers.bearer_token(request.headers.get('Authorization')) or session.get('token')
 
 
 @app.route('/')
@@ -22,85 +53,199 @@ def index():
 @app.route('/api/login', methods=['POST'])
 def login():
     """API для входа в систему"""
-    data = request.json
-    username = data.get('username')
-    password = data.get('password')
+    username, password = handlers.login_credentials(request.json)
     
-    user = api.login(username, password)
+    # Общий объект API обслуживает всех пользователей, поэтому вход не
+    # меняет его состояние: пользователь получает подписанный токен
+    try:
+        result = get_api().login_with_token(username, password)
+    except AuthenticationBusyError:
+        # Пул проверки паролей переполнен: просим клиента повторить позже
+        return jsonify(handlers.busy_response()), handlers.BUSY_STATUS, handlers.BUSY_HEADERS
     
-    if user:
+    if result:
+        user, token = result
+        
         # Сохраняем информацию о пользователе в сессии
         session['user_id'] = user.id
         session['username'] = user.username
         session['role'] = user.role.value
-        
-        return jsonify({
-            'success': True,
-            'user': user.to_dict()
-        })
+        session['token'] = token
     
-    return jsonify({'success': False, 'error': 'Неверные учетные данные'})
+    return jsonify(handlers.login_response(result))
 
 
 @app.route('/api/books/search', methods=['GET'])
 def search_books():
-    """API для поиска книг"""
-    query = request.args.get('q', '')
-    author = request.args.get('author', '')
-    year = request.args.get('year', '')
-    genre = request.args.get('genre', '')
+    """API для поиска книг (параметры описаны в handlers.search_params)
     
-    filters = {}
-    if author:
-        filters['author'] = author
-    if year and year.isdigit():
-        filters['year'] = int(year)
-    if genre:
-        filters['genre'] = genre
+    Ответ содержит ETag; на запрос с совпадающим If-None-Match сервер
+    отвечает 304, не выполняя поиск. С заголовком Accept: application/x-ndjson
+    выдаётся вся выборка начиная с cursor построчно, по мере чтения из
+    базы; limit при этом не учитывается. Ответ сжимается gzip или deflate
+    согласно Accept-Encoding.
+    """
+    try:
+        params = handlers.search_params(request.args)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
     
-    books = api.search_books(query, **filters)
+    ndjson = streaming.wants_ndjson(request.headers.get('Accept'))
+    encoding = streaming.negotiate_encoding(request.headers.get('Accept-Encoding'))
+    etag = handlers.search_etag(get_api().catalog_version(), params, ndjson, encoding)
+    headers = handlers.search_cache_headers(etag, authenticated=request_token() is not None)
+    if handlers.etag_matches(request.headers.get('If-None-Match'), etag):
+        return '', 304, headers
     
-    return jsonify({
-        'success': True,
-        'books': [book.to_dict() for book in books]
-    })
+    if ndjson:
+        # Страницы выгрузки не кэшируются, чтобы не вытеснять интерактивные выдачи
+        params = dict(params, limit=streaming.STREAM_PAGE_SIZE, use_cache=False)
+    try:
+        page = get_api().search_books_page(**params)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
+    
+    if ndjson:
+        body = streaming.ndjson_stream(get_api().search_books_page, params, page)
+        if encoding:
+            body = streaming.compress_stream(body, encoding)
+            headers['Content-Encoding'] = encoding
+        return Response(body, mimetype=streaming.NDJSON_MIME, headers=headers)
+    
+    body = streaming.encode_body(streaming.dumps(handlers.search_response(page)), encoding, headers)
+    return Response(body, mimetype=streaming.JSON_MIME, headers=headers)
+
+
+@app.route('/api/books/batch', methods=['GET'])
+def get_books_batch():
+    """API для получения нескольких книг по ID одним запросом
+    
+    ID передаются через запятую: /api/books/batch?ids=1,2,3
+    """
+    try:
+        book_ids = handlers.batch_book_ids(request.args)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
+    
+    books = get_api().get_books(book_ids)
+    return jsonify(handlers.books_batch_response(book_ids, books))
 
 
 @app.route('/api/books/reserve', methods=['POST'])
 def reserve_book():
     """API для бронирования книги"""
-    if 'user_id' not in session:
-        return jsonify({'success': False, 'error': 'Требуется авторизация'})
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
+    
+    try:
+        book_id = handlers.reserve_book_id(request.json)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
+    
+    result = get_api().try_reserve_book(book_id, token=token)
+    return jsonify(handlers.reservation_response(result))
+
+
+@app.route('/api/books/reserve/batch', methods=['POST'])
+def reserve_books_batch():
+    """API для бронирования нескольких книг одной транзакцией"""
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
+    
+    try:
+        book_ids, policy = handlers.reserve_batch_params(request.json)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
+    
+    results = get_api().reserve_books(book_ids, policy=policy, token=token)
+    return jsonify(handlers.batch_reservation_response(book_ids, results))
+
+
+@app.route('/api/books/waitlist', methods=['POST'])
+def join_waitlist():
+    """API для записи в очередь за книгой без свободных экземпляров"""
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
+    
+    try:
+        book_id = handlers.reserve_book_id(request.json)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
+    
+    entry = get_api().join_waitlist(book_id, token=token)
+    return jsonify(handlers.waitlist_response(entry))
+
+
+@app.route('/api/books/waitlist', methods=['DELETE'])
+def leave_waitlist():
+    """API для выхода из очереди: /api/books/waitlist?book_id=1"""
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
     
-    data = request.json
-    book_id = data.get('book_id')
+    try:
+        book_id = handlers.reserve_book_id(request.args)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
     
-    if not book_id:
-        return jsonify({'success': False, 'error': 'Не указан ID книги'})
+    left = get_api().leave_waitlist(book_id, token=token)
+    return jsonify(handlers.waitlist_leave_response(left))
+
+
+@app.route('/api/books/waitlist', methods=['GET'])
+def get_waitlist_position():
+    """API для получения места в очереди: /api/books/waitlist?book_id=1"""
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
+    
+    try:
+        book_id = handlers.reserve_book_id(request.args)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
     
-    reservation = api.reserve_book(int(book_id))
+    position = get_api().get_waitlist_position(book_id, token=token)
+    return jsonify(handlers.waitlist_position_response(position))
+
+
+@app.route('/api/admin/reports/circulation', methods=['GET'])
+def circulation_report():
+    """API отчёта об обороте фонда (параметры описаны в handlers.report_params)"""
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
     
-    if reservation:
-        return jsonify({
-            'success': True,
-            'reservation': reservation.to_dict()
-        })
+    try:
+        params = handlers.report_params(request.args)
+        report = get_api().circulation_report(token=token, **params)
+    except ValueError as e:
+        return jsonify(handlers.error(str(e)))
     
-    return jsonify({'success': False, 'error': 'Ошибка бронирования'})
+    return jsonify(handlers.report_response(report))
+
+
+@app.route('/api/admin/stats/queries', methods=['GET'])
+def query_stats():
+    """API замеров запросов к БД и журнала медленных запросов"""
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
+    
+    return jsonify(handlers.query_stats_response(get_api().query_stats(token=token)))
 
 
 @app.route('/api/user/reservations', methods=['GET'])
 def get_user_reservations():
     """API для получения бронирований пользователя"""
-    if 'user_id' not in session:
-        return jsonify({'success': False, 'error': 'Требуется авторизация'})
-    
-    reservations = api.get_my_reservations()
+    token = request_token()
+    if not token or not get_api().resolve_token(token):
+        return jsonify(handlers.error(handlers.AUTH_REQUIRED))
     
-    return jsonify({
-        'success': True,
-        'reservations': [r.to_dict() for r in reservations]
-    })
+    reservations = get_api().get_my_reservations(token=token)
+    return jsonify(handlers.reservations_response(reservations))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,375 @@
+"""
+ASGI-приложение с тем же JSON API, что и Flask-приложение app.py
+
+Приложение написано на голом протоколе ASGI и не требует веб-фреймворка;
+запускается любым ASGI-сервером, например:
+
+    uvicorn src.ui.web.asgi:app --workers 4
+
+Запросы обслуживаются корутинами через AsyncLibraryAPI, поэтому медленные
+клиенты не занимают потоки. Разбор параметров и формирование ответов
+общие с Flask-приложением (модуль handlers). Сессий на cookie нет:
+пользователь определяется по заголовку Authorization: Bearer <токен>.
+"""
+import json
+import os
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple, Union
+)
+from urllib.parse import parse_qs
+
+from ...api.async_library_api import AsyncLibraryAPI
+from ...auth.password_hashing import AuthenticationBusyError
+from . import handlers, streaming
+
+# Переменные окружения с параметрами базы; через них настраиваются
+# рабочие процессы, которые ASGI-сервер запускает по строке импорта
+DB_PATH_ENV = "LIBRARY_DB_PATH"
+DB_PROFILE_ENV = "LIBRARY_DB_PROFILE"
+
+# Параметры отмены просроченных бронирований; интервал 0 отключает её
+SWEEP_INTERVAL_ENV = "LIBRARY_SWEEP_INTERVAL"
+SWEEP_BATCH_ENV = "LIBRARY_SWEEP_BATCH"
+
+# Порог медленного запроса в миллисекундах; если задан, включаются замеры
+# запросов к БД. Журнал медленных запросов дописывается в файл SLOW_QUERY_LOG_ENV
+SLOW_QUERY_MS_ENV = "LIBRARY_SLOW_QUERY_MS"
+SLOW_QUERY_LOG_ENV = "LIBRARY_SLOW_QUERY_LOG"
+
+# Максимальный размер тела запроса
+MAX_BODY_SIZE = 64 * 1024
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+# Тело ответа: объект для JSON, готовые байты, поток байтов или None (без тела)
+Body = Union[None, Dict[str, Any], bytes, AsyncIterator[bytes]]
+Response = Tuple[int, Body, Dict[str, str]]
+
+
+class BadRequest(Exception):
+    """Запрос нельзя разобрать; содержит статус ответа"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """Разобранный HTTP-запрос ASGI"""
+
+    def __init__(self, scope: Scope, body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        query = parse_qs(scope.get('query_string', b'').decode('utf-8'), keep_blank_values=True)
+        # Как и в Flask, из повторяющихся параметров берётся первый
+        self.args = {name: values[0] for name, values in query.items()}
+        self.body = body
+
+    @property
+    def token(self) -> Optional[str]:
+        return handlers.bearer_token(self.headers.get('authorization'))
+
+    def json(self) -> Mapping[str, Any]:
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            raise BadRequest(400, 'Некорректный JSON')
+        if not isinstance(data, dict):
+            raise BadRequest(400, 'Ожидался JSON-объект')
+        return data
+
+
+class LibraryASGIApp:
+    """ASGI-приложение библиотеки
+
+    AsyncLibraryAPI создаётся при запуске (событие lifespan) или при первом
+    запросе и закрывается при остановке сервера.
+    """
+
+    def __init__(self, api: Optional[AsyncLibraryAPI] = None, **api_options: Any):
+        self._api = api
+        self._api_options = api_options
+        self._routes: Dict[Tuple[str, str], Callable[[Request], Awaitable[Response]]] = {
+            ('POST', '/api/login'): self.login,
+            ('GET', '/api/books/search'): self.search_books,
+            ('GET', '/api/books/batch'): self.get_books_batch,
+            ('POST', '/api/books/reserve'): self.reserve_book,
+            ('POST', '/api/books/reserve/batch'): self.reserve_books_batch,
+            ('POST', '/api/books/waitlist'): self.join_waitlist,
+            ('DELETE', '/api/books/waitlist'): self.leave_waitlist,
+            ('GET', '/api/books/waitlist'): self.get_waitlist_position,
+            ('GET', '/api/user/reservations'): self.get_user_reservations,
+            ('GET', '/api/admin/reports/circulation'): self.circulation_report,
+            ('GET', '/api/admin/stats/queries'): self.query_stats,
+        }
+
+    @property
+    def api(self) -> AsyncLibraryAPI:
+        if self._api is None:
+            options = dict(self._api_options)
+            if DB_PATH_ENV in os.environ:
+                options.setdefault('db_path', os.environ[DB_PATH_ENV])
+            if DB_PROFILE_ENV in os.environ:
+                options.setdefault('profile', os.environ[DB_PROFILE_ENV])
+            if os.environ.get(SLOW_QUERY_MS_ENV):
+                options.setdefault('instrument', True)
+                options.setdefault('slow_query_threshold',
+                                   float(os.environ[SLOW_QUERY_MS_ENV]) / 1000)
+                options.setdefault('slow_query_log', os.environ.get(SLOW_QUERY_LOG_ENV) or None)
+            self._api = AsyncLibraryAPI(**options)
+            interval = float(os.environ.get(SWEEP_INTERVAL_ENV) or 0)
+            if interval > 0:
+                self._api.api.start_expiry_sweeper(
+                    interval, int(os.environ.get(SWEEP_BATCH_ENV) or 100)
+                )
+        return self._api
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        """Запуск и остановка приложения"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.api
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Обработать HTTP-запрос"""
+        try:
+            request = Request(scope, await self._read_body(receive))
+            handler = self._routes.get((request.method, request.path))
+            if handler is None:
+                if any(path == request.path for _, path in self._routes):
+                    raise BadRequest(405, 'Метод не поддерживается')
+                raise BadRequest(404, 'Не найдено')
+            status, payload, headers = await handler(request)
+        except BadRequest as e:
+            status, payload, headers = e.status, handlers.error(str(e)), {}
+
+        await self._send_response(send, status, payload, headers)
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        """Прочитать тело запроса целиком, ограничив его размер"""
+        chunks: List[bytes] = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                raise BadRequest(413, 'Слишком большой запрос')
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _send_response(send: Send, status: int, body: Body,
+                             headers: Dict[str, str]) -> None:
+        """Отправить ответ; поток отправляется по частям без Content-Length"""
+        headers = dict(headers)
+        if isinstance(body, dict):
+            body = streaming.dumps(body)
+            headers.setdefault('Content-Type', 'application/json; charset=utf-8')
+
+        raw_headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in headers.items()]
+        if body is None or isinstance(body, bytes):
+            body = body or b''
+            raw_headers.append((b'content-length', str(len(body)).encode('ascii')))
+            await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+        async for chunk in body:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    # === Обработчики ===
+
+    async def login(self, request: Request) -> Response:
+        """API для входа в систему"""
+        username, password = handlers.login_credentials(request.json())
+        try:
+            result = await self.api.login(username, password)
+        except AuthenticationBusyError:
+            return handlers.BUSY_STATUS, handlers.busy_response(), handlers.BUSY_HEADERS
+
+        return 200, handlers.login_response(result), {}
+
+    async def search_books(self, request: Request) -> Response:
+        """API для поиска книг (параметры описаны в handlers.search_params)
+
+        Ответ содержит ETag; на запрос с совпадающим If-None-Match сервер
+        отвечает 304, не выполняя поиск. Потоковая выдача NDJSON и сжатие
+        работают так же, как во Flask-приложении.
+        """
+        try:
+            params = handlers.search_params(request.args)
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        ndjson = streaming.wants_ndjson(request.headers.get('accept'))
+        encoding = streaming.negotiate_encoding(request.headers.get('accept-encoding'))
+        etag = handlers.search_etag(await self.api.catalog_version(), params, ndjson, encoding)
+        headers = handlers.search_cache_headers(etag, authenticated=request.token is not None)
+        if handlers.etag_matches(request.headers.get('if-none-match'), etag):
+            return 304, None, headers
+
+        if ndjson:
+            # Страницы выгрузки не кэшируются, чтобы не вытеснять интерактивные выдачи
+            params = dict(params, limit=streaming.STREAM_PAGE_SIZE, use_cache=False)
+        try:
+            page = await self.api.search_books_page(**params)
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        if ndjson:
+            headers['Content-Type'] = streaming.NDJSON_MIME
+            body = streaming.andjson_stream(self.api.search_books_page, params, page)
+            if encoding:
+                body = streaming.acompress_stream(body, encoding)
+                headers['Content-Encoding'] = encoding
+            return 200, body, headers
+
+        headers['Content-Type'] = 'application/json; charset=utf-8'
+        body = streaming.dumps(handlers.search_response(page))
+        return 200, streaming.encode_body(body, encoding, headers), headers
+
+    async def get_books_batch(self, request: Request) -> Response:
+        """API для получения нескольких книг по ID одним запросом: ?ids=1,2,3"""
+        try:
+            book_ids = handlers.batch_book_ids(request.args)
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        books = await self.api.get_books(book_ids)
+        return 200, handlers.books_batch_response(book_ids, books), {}
+
+    async def reserve_book(self, request: Request) -> Response:
+        """API для бронирования книги"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        try:
+            book_id = handlers.reserve_book_id(request.json())
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        result = await self.api.try_reserve_book(book_id, token)
+        return 200, handlers.reservation_response(result), {}
+
+    async def reserve_books_batch(self, request: Request) -> Response:
+        """API для бронирования нескольких книг одной транзакцией"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        try:
+            book_ids, policy = handlers.reserve_batch_params(request.json())
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        results = await self.api.reserve_books(book_ids, token, policy=policy)
+        return 200, handlers.batch_reservation_response(book_ids, results), {}
+
+    async def join_waitlist(self, request: Request) -> Response:
+        """API для записи в очередь за книгой без свободных экземпляров"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        try:
+            book_id = handlers.reserve_book_id(request.json())
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        entry = await self.api.join_waitlist(book_id, token)
+        return 200, handlers.waitlist_response(entry), {}
+
+    async def leave_waitlist(self, request: Request) -> Response:
+        """API для выхода из очереди: /api/books/waitlist?book_id=1"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        try:
+            book_id = handlers.reserve_book_id(request.args)
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        left = await self.api.leave_waitlist(book_id, token)
+        return 200, handlers.waitlist_leave_response(left), {}
+
+    async def get_waitlist_position(self, request: Request) -> Response:
+        """API для получения места в очереди: /api/books/waitlist?book_id=1"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        try:
+            book_id = handlers.reserve_book_id(request.args)
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        position = await self.api.get_waitlist_position(book_id, token)
+        return 200, handlers.waitlist_position_response(position), {}
+
+    async def get_user_reservations(self, request: Request) -> Response:
+        """API для получения бронирований пользователя"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        reservations = await self.api.get_my_reservations(token)
+        return 200, handlers.reservations_response(reservations), {}
+
+    async def circulation_report(self, request: Request) -> Response:
+        """API отчёта об обороте фонда (параметры описаны в handlers.report_params)"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        try:
+            params = handlers.report_params(request.args)
+            report = await self.api.circulation_report(token, **params)
+        except ValueError as e:
+            return 200, handlers.error(str(e)), {}
+
+        return 200, handlers.report_response(report), {}
+
+    async def query_stats(self, request: Request) -> Response:
+        """API замеров запросов к БД и журнала медленных запросов"""
+        token = request.token
+        if not token or not await self.api.resolve_token(token):
+            return 200, handlers.error(handlers.AUTH_REQUIRED), {}
+
+        return 200, handlers.query_stats_response(await self.api.query_stats(token)), {}
+
+    async def close(self) -> None:
+        """Закрыть API и соединения с БД"""
+        if self._api is not None:
+            api, self._api = self._api, None
+            await api.close()
+
+
+app = LibraryASGIApp()
@@ -0,0 +1,311 @@
+"""
+Общая логика веб-API: разбор параметров запросов и формирование ответов
+
+Модуль не зависит от веб-фреймворка. Его используют и Flask-приложение
+(app.py), и ASGI-приложение (asgi.py), поэтому оба фронтенда отвечают
+на одинаковые запросы одинаково.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from ...database.database_manager import RESERVATION_POLICIES, BookPage
+from ...models.book import Book
+from ...models.reservation import Reservation, ReservationOutcome, ReservationResult
+from ...models.user import User
+from ...models.waitlist import WaitlistEntry
+from ...reports.circulation_report import BUCKETS
+
+# Размер страницы поиска по умолчанию и максимальный
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Максимальное число книг в одном пакетном запросе
+MAX_BATCH_IDS = 100
+
+# Максимальное число книг в одном пакетном бронировании
+MAX_RESERVE_BATCH = 20
+
+AUTH_REQUIRED = 'Требуется авторизация'
+ADMIN_REQUIRED = 'Доступно только администраторам'
+NOT_IN_WAITLIST = 'Вы не стоите в очереди за этой книгой'
+
+# Максимальное число книг в рейтинге популярности отчёта
+MAX_REPORT_TOP = 100
+
+# Сколько секунд кэши могут отдавать выдачу поиска без перепроверки
+SEARCH_MAX_AGE = 0
+
+# Статус и заголовки ответа при переполнении пула проверки паролей
+BUSY_STATUS = 503
+BUSY_HEADERS = {'Retry-After': '1'}
+
+
+def error(message: str, **extra: Any) -> Dict[str, Any]:
+    """Ответ об ошибке"""
+    return {'success': False, 'error': message, **extra}
+
+
+def bearer_token(header: Optional[str]) -> Optional[str]:
+    """Токен из заголовка Authorization: Bearer"""
+    if header and header.startswith('Bearer '):
+        return header[len('Bearer '):].strip() or None
+    return None
+
+
+def login_credentials(data: Optional[Mapping[str, Any]]) -> Tuple[Any, Any]:
+    """Имя пользователя и пароль из тела запроса на вход"""
+    data = data or {}
+    return data.get('username'), data.get('password')
+
+
+def login_response(result: Optional[Tuple[User, str]]) -> Dict[str, Any]:
+    """Ответ на вход: пользователь и токен или ошибка"""
+    if not result:
+        return error('Неверные учетные данные')
+
+    user, token = result
+    return {'success': True, 'user': user.to_dict(), 'token': token}
+
+
+def busy_response() -> Dict[str, Any]:
+    """Ответ при переполнении пула проверки паролей"""
+    return error('Сервер перегружен, повторите попытку')
+
+
+def search_params(args: Mapping[str, str]) -> Dict[str, Any]:
+    """Параметры search_books_page из строки запроса
+
+    Выдача постраничная: limit задаёт размер страницы, sort — ключ
+    сортировки, cursor — значение next_cursor из предыдущего ответа.
+    Некорректные параметры вызывают ValueError с текстом для клиента.
+    """
+    limit = args.get('limit', '')
+    if limit and not limit.isdigit():
+        raise ValueError('Некорректный размер страницы')
+    limit = min(int(limit), MAX_PAGE_SIZE) if limit else DEFAULT_PAGE_SIZE
+    if limit <= 0:
+        raise ValueError('Некорректный размер страницы')
+
+    params: Dict[str, Any] = {
+        'query': args.get('q', ''),
+        'limit': limit,
+        'sort': args.get('sort', 'id'),
+        'cursor': args.get('cursor') or None,
+    }
+
+    author = args.get('author', '')
+    year = args.get('year', '')
+    genre = args.get('genre', '')
+    if author:
+        params['author'] = author
+    if year and year.isdigit():
+        params['year'] = int(year)
+    if genre:
+        params['genre'] = genre
+
+    return params
+
+
+def search_etag(catalog_version: int, params: Mapping[str, Any],
+                ndjson: bool = False, encoding: Optional[str] = None) -> str:
+    """Сильный ETag выдачи поиска по параметрам запроса и версии каталога
+
+    Выдача не зависит от пользователя, поэтому одинаковые запросы при
+    одной версии каталога получают одинаковый ETag. Формат и сжатие
+    ответа входят в ETag: разные представления имеют разные ETag.
+    """
+    key = [catalog_version, sorted(params.items())]
+    if ndjson or encoding:
+        key.append([ndjson, encoding])
+    key = json.dumps(key, ensure_ascii=False)
+    return '"' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли ETag с одним из значений заголовка If-None-Match"""
+    if not if_none_match:
+        return False
+
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    # Для If-None-Match используется слабое сравнение: префикс W/ не учитывается
+    return '*' in candidates or any(
+        (value[2:] if value.startswith('W/') else value) == etag for value in candidates
+    )
+
+
+def search_cache_headers(etag: str, authenticated: bool) -> Dict[str, str]:
+    """Заголовки кэширования выдачи поиска
+
+    Анонимные выдачи разрешено хранить общим кэшам (обратному прокси),
+    запросы с токеном — только кэшу клиента. Кэш обязан перепроверять
+    выдачу по ETag, что для сервера стоит одного сравнения версий.
+    """
+    scope = 'private' if authenticated else 'public'
+    return {
+        'ETag': etag,
+        'Cache-Control': f'{scope}, max-age={SEARCH_MAX_AGE}, must-revalidate',
+        'Vary': 'Authorization, Accept, Accept-Encoding',
+    }
+
+
+def search_response(page: BookPage) -> Dict[str, Any]:
+    """Ответ со страницей результатов поиска"""
+    return {
+        'success': True,
+        'books': [book.to_dict() for book in page.books],
+        'next_cursor': page.next_cursor
+    }
+
+
+def batch_book_ids(args: Mapping[str, str]) -> List[int]:
+    """ID книг из параметра ids=1,2,3; ValueError, если список некорректен"""
+    raw_ids = [part.strip() for part in args.get('ids', '').split(',') if part.strip()]
+
+    if not raw_ids or not all(part.isdigit() for part in raw_ids):
+        raise ValueError('Не указаны ID книг')
+    if len(raw_ids) > MAX_BATCH_IDS:
+        raise ValueError(f'Не больше {MAX_BATCH_IDS} книг за запрос')
+    return [int(part) for part in raw_ids]
+
+
+def books_batch_response(book_ids: List[int], books: List[Book]) -> Dict[str, Any]:
+    """Ответ с найденными книгами и ID, которых нет в каталоге"""
+    found = {book.id for book in books}
+    return {
+        'success': True,
+        'books': [book.to_dict() for book in books],
+        'missing': [book_id for book_id in dict.fromkeys(book_ids) if book_id not in found]
+    }
+
+
+def reserve_book_id(data: Optional[Mapping[str, Any]]) -> int:
+    """ID книги из тела или параметров запроса; ValueError, если его нет"""
+    book_id = (data or {}).get('book_id')
+    try:
+        book_id = int(book_id) if book_id else 0
+    except (TypeError, ValueError):
+        book_id = 0
+
+    if book_id <= 0:
+        raise ValueError('Не указан ID книги')
+    return book_id
+
+
+def reservation_response(result: Optional[ReservationResult]) -> Dict[str, Any]:
+    """Ответ на бронирование с причиной отказа"""
+    if result and result.success:
+        return {'success': True, 'reservation': result.reservation.to_dict()}
+
+    if result and result.outcome == ReservationOutcome.SOLD_OUT:
+        return error('Нет свободных экземпляров', sold_out=True)
+
+    return error('Ошибка бронирования')
+
+
+def reserve_batch_params(data: Optional[Mapping[str, Any]]) -> Tuple[List[int], str]:
+    """ID книг и политика из тела запроса на пакетное бронирование
+
+    Ожидается {"book_ids": [1, 2, 3], "policy": "all_or_nothing"}; политика
+    необязательна. Некорректный запрос вызывает ValueError.
+    """
+    data = data or {}
+    book_ids = data.get('book_ids')
+    if (not isinstance(book_ids, list) or not book_ids
+            or not all(isinstance(book_id, int) and book_id > 0 for book_id in book_ids)):
+        raise ValueError('Не указаны ID книг')
+    if len(book_ids) > MAX_RESERVE_BATCH:
+        raise ValueError(f'Не больше {MAX_RESERVE_BATCH} книг за запрос')
+
+    policy = data.get('policy') or 'all_or_nothing'
+    if policy not in RESERVATION_POLICIES:
+        raise ValueError(f"Политика бронирования: {' или '.join(RESERVATION_POLICIES)}")
+    return book_ids, policy
+
+
+def batch_reservation_response(book_ids: List[int],
+                               results: Optional[List[ReservationResult]]) -> Dict[str, Any]:
+    """Ответ на пакетное бронирование с итогом по каждой книге
+
+    success истинно, если забронирована хотя бы одна книга.
+    """
+    if results is None:
+        return error('Ошибка бронирования')
+
+    items = []
+    for book_id, result in zip(dict.fromkeys(book_ids), results):
+        item = {'book_id': book_id, 'outcome': result.outcome.value}
+        if result.success:
+            item['reservation'] = result.reservation.to_dict()
+        items.append(item)
+
+    return {'success': any(result.success for result in results), 'results': items}
+
+
+def waitlist_response(entry: Optional[WaitlistEntry]) -> Dict[str, Any]:
+    """Ответ на запись в очередь: место в очереди или сразу бронирование"""
+    if entry is None:
+        return error('Не удалось встать в очередь')
+    return {'success': True, 'waitlist': entry.to_dict()}
+
+
+def waitlist_leave_response(left: bool) -> Dict[str, Any]:
+    """Ответ на выход из очереди"""
+    if not left:
+        return error(NOT_IN_WAITLIST)
+    return {'success': True}
+
+
+def waitlist_position_response(position: Optional[int]) -> Dict[str, Any]:
+    """Ответ с местом пользователя в очереди"""
+    if position is None:
+        return error(NOT_IN_WAITLIST)
+    return {'success': True, 'position': position}
+
+
+def report_params(args: Mapping[str, str]) -> Dict[str, Any]:
+    """Параметры отчёта об обороте из строки запроса
+    
+    since и until — даты или моменты в формате ISO 8601, top — длина
+    рейтинга популярности, bucket — day или week. Некорректные параметры
+    вызывают ValueError с текстом для клиента.
+    """
+    params: Dict[str, Any] = {}
+    for name in ('since', 'until'):
+        value = args.get(name, '')
+        if value:
+            try:
+                params[name] = datetime.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f'Некорректная дата {name}')
+    
+    top = args.get('top', '')
+    if top and not top.isdigit():
+        raise ValueError('Некорректная длина рейтинга')
+    params['limit'] = min(int(top), MAX_REPORT_TOP) if top else 10
+    
+    bucket = args.get('bucket') or 'week'
+    if bucket not in BUCKETS:
+        raise ValueError(f"Период: {' или '.join(BUCKETS)}")
+    params['bucket'] = bucket
+    return params
+
+
+def report_response(report: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ответ с отчётом или отказ для не-администратора"""
+    if report is None:
+        return error(ADMIN_REQUIRED)
+    return {'success': True, 'report': report}
+
+
+def query_stats_response(stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ответ с замерами запросов к БД или отказ для не-администратора"""
+    if stats is None:
+        return error(ADMIN_REQUIRED)
+    return {'success': True, **stats}
+
+
+def reservations_response(reservations: List[Reservation]) -> Dict[str, Any]:
+    """Ответ со списком бронирований пользователя"""
+    return {'success': True, 'reservations': [r.to_dict() for r in reservations]}
@@ -0,0 +1,194 @@
+"""
+Многопроцессный сервер WSGI с заранее запущенными рабочими процессами
+
+Главный процесс открывает слушающий сокет и запускает через fork
+несколько рабочих процессов, которые принимают соединения с этого
+сокета. Главный процесс не обращается к базе: каждый рабочий процесс
+открывает свои соединения после fork в on_worker_start. Отработав
+заданное число запросов, рабочий процесс завершается после текущего
+запроса, и главный процесс запускает вместо него новый.
+"""
+import os
+import random
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Callable, Dict, Optional, Tuple
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+# Как часто рабочий процесс проверяет флаг остановки, секунд
+POLL_INTERVAL = 0.5
+
+# Сигналы, по которым сервер завершает работу
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+# Минимальная пауза между перезапусками упавших рабочих процессов, секунд
+RESPAWN_DELAY = 1.0
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """Обработчик запросов без записи каждого запроса в stderr"""
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class _WorkerServer(WSGIServer):
+    """WSGIServer, обслуживающий уже открытый слушающий сокет"""
+
+    def __init__(self, listener: socket.socket, app: Callable):
+        super().__init__(listener.getsockname()[:2], _QuietRequestHandler,
+                         bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+        self.setup_environ()
+        self.set_app(app)
+        self.timeout = POLL_INTERVAL
+        self.requests_handled = 0
+
+    def finish_request(self, request, client_address) -> None:
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            self.requests_handled += 1
+
+
+class PreforkServer:
+    """Сервер из главного процесса и N рабочих процессов
+
+    max_requests ограничивает число запросов на рабочий процесс (0 — без
+    ограничения); к нему добавляется случайная добавка до
+    max_requests_jitter, чтобы процессы не перезапускались одновременно.
+    """
+
+    def __init__(self, app: Callable, host: str = "127.0.0.1", port: int = 8000,
+                 workers: int = 2, max_requests: int = 10000, max_requests_jitter: int = 0,
+                 on_worker_start: Optional[Callable[[], None]] = None, backlog: int = 128):
+        if workers <= 0:
+            raise ValueError("Число рабочих процессов должно быть положительным")
+
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.on_worker_start = on_worker_start
+        self.backlog = backlog
+
+        self._listener: Optional[socket.socket] = None
+        self._children: Dict[int, int] = {}  # pid -> номер рабочего процесса
+        self._stopping = False
+
+    def bind(self) -> Tuple[str, int]:
+        """Открыть слушающий сокет; возвращает фактический адрес"""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.backlog)
+        # Простаивающие процессы не должны зависать в accept после того,
+        # как соединение забрал другой процесс. Неблокирующим делаем только
+        # дескриптор: таймаут объекта сокета остаётся None, иначе
+        # handle_request опрашивал бы сокет без паузы
+        os.set_blocking(listener.fileno(), False)
+        self._listener = listener
+        return listener.getsockname()[:2]
+
+    # === Главный процесс ===
+
+    def serve_forever(self) -> None:
+        """Запустить рабочие процессы и перезапускать их до сигнала остановки"""
+        if self._listener is None:
+            self.bind()
+
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, self._handle_stop)
+
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            slot = self._children.pop(pid, None)
+            if slot is None or self._stopping:
+                continue
+
+            # Код возврата 0 — плановый перезапуск после лимита запросов;
+            # иначе процесс упал, и перед перезапуском выдерживаем паузу
+            if not (os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0):
+                time.sleep(RESPAWN_DELAY)
+            if not self._stopping:
+                self._spawn(slot)
+
+        self._listener.close()
+
+    def _spawn(self, slot: int) -> None:
+        """Запустить рабочий процесс"""
+        # Иначе недописанный буфер вывода продублируется в дочернем процессе
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Сигналы остановки блокируются до того, как рабочий процесс
+        # установит свои обработчики: иначе он выполнил бы обработчик
+        # главного процесса и разослал SIGTERM соседям
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        pid = os.fork()
+        if pid:
+            self._children[pid] = slot
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+            return
+
+        code = 1
+        try:
+            self._run_worker(mask)
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            # os._exit не запускает унаследованные обработчики atexit
+            # главного процесса, но и буферы вывода не сбрасывает
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _handle_stop(self, signum, frame) -> None:
+        """Остановить сервер: рабочие процессы дообслуживают текущие запросы"""
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # === Рабочий процесс ===
+
+    def _run_worker(self, mask) -> None:
+        """Обслуживать запросы до исчерпания лимита или сигнала остановки"""
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, stop)
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+        if self.on_worker_start is not None:
+            self.on_worker_start()
+
+        budget = 0
+        if self.max_requests > 0:
+            budget = self.max_requests + random.randint(0, max(self.max_requests_jitter, 0))
+
+        server = _WorkerServer(self._listener, self.app)
+        while not stopping and (not budget or server.requests_handled < budget):
+            server.handle_request()
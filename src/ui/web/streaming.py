@@ -0,0 +1,158 @@
+"""
+Кодирование ответов веб-API: быстрый JSON, потоковый NDJSON и сжатие
+
+Используется Flask- и ASGI-приложениями. Если установлен orjson, JSON
+кодируется им, иначе стандартным модулем json.
+"""
+import json
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional
+
+from ...database.database_manager import BookPage
+from ...models.book import Book
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+NDJSON_MIME = 'application/x-ndjson'
+JSON_MIME = 'application/json'
+
+# Размер страницы, которыми потоковая выдача читает результаты из базы
+STREAM_PAGE_SIZE = 500
+
+# Ответы меньше этого размера не сжимаются
+MIN_COMPRESS_SIZE = 1024
+
+# Уровень сжатия zlib: 6 — обычный компромисс скорости и размера
+COMPRESS_LEVEL = 6
+
+# Сколько байт потока накапливать перед отправкой сжатого фрагмента
+FLUSH_EVERY = 64 * 1024
+
+# Поддерживаемые кодировки в порядке предпочтения и параметр wbits zlib
+ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def dumps(obj: Any) -> bytes:
+    """Закодировать объект в JSON (UTF-8)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """Запрошена ли потоковая выдача в формате NDJSON"""
+    return bool(accept) and NDJSON_MIME in accept
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Выбрать сжатие по заголовку Accept-Encoding; None — без сжатия"""
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for name in ENCODINGS:
+        quality = weights.get(name, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Сжать тело ответа целиком"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(body) + compressor.flush()
+
+
+def encode_body(body: bytes, encoding: Optional[str], headers: dict) -> bytes:
+    """Сжать тело ответа, если клиент это поддерживает и ответ не слишком мал"""
+    if encoding is None or len(body) < MIN_COMPRESS_SIZE:
+        return body
+
+    headers['Content-Encoding'] = encoding
+    return compress(body, encoding)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Сжимать поток по мере поступления данных
+
+    Каждые FLUSH_EVERY байт входа выполняется Z_SYNC_FLUSH, чтобы клиент
+    получал и мог распаковать данные, не дожидаясь конца выдачи.
+    """
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, ENCODINGS[encoding])
+    pending = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= FLUSH_EVERY:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def acompress_stream(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    """Асинхронный вариант compress_stream"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, ENCODINGS[encoding])
+    pending = 0
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= FLUSH_EVERY:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def ndjson_chunk(books: List[Book]) -> bytes:
+    """Строки NDJSON для страницы книг: по объекту JSON на строку"""
+    return b''.join(dumps(book.to_dict()) + b'\n' for book in books)
+
+
+def ndjson_stream(search_page: Callable[..., BookPage], params: dict,
+                  first: BookPage) -> Iterator[bytes]:
+    """Поток NDJSON по всей выборке, начиная с уже полученной страницы first
+
+    Следующие страницы запрашиваются по курсору, поэтому соединение с
+    базой не удерживается, пока медленный клиент читает ответ, а в
+    памяти находится не больше одной страницы.
+    """
+    page = first
+    while True:
+        if page.books:
+            yield ndjson_chunk(page.books)
+        if not page.next_cursor:
+            return
+        page = search_page(**dict(params, cursor=page.next_cursor))
+
+
+async def andjson_stream(search_page: Callable[..., Awaitable[BookPage]], params: dict,
+                         first: BookPage) -> AsyncIterator[bytes]:
+    """Асинхронный вариант ndjson_stream"""
+    page = first
+    while True:
+        if page.books:
+            yield ndjson_chunk(page.books)
+        if not page.next_cursor:
+            return
+        page = await search_page(**dict(params, cursor=page.next_cursor))
@@ -7,9 +7,9 @@ from src.models.user import UserRole
 
 
 @pytest.fixture
-def library_api():
+def library_api(tmp_path):
     """Фикстура для API библиотеки"""
-    api = LibraryAPI()
+    api = LibraryAPI(db_path=str(tmp_path / "library.db"))
     yield api
     api.close()
 
@@ -103,3 +103,321 @@ class TestLibraryAPI:
         
         # Проверяем, что вышли
         assert library_api.get_current_user() is None
+
+
+class TestCatalogImport:
+    """Тесты потокового импорта каталога"""
+    
+    def test_import_csv(self, tmp_path):
+        """Тест импорта CSV с пропуском некорректных строк"""
+        from src.api.catalog_import import ImportProgress, import_catalog
+        from src.database.database_manager import DatabaseManager
+        
+        path = tmp_path / "catalog.csv"
+        path.write_text(
+            "title,author,year,isbn,genre,quantity\n"
+            "Идиот,Фёдор Достоевский,1869,978-1,Роман,3\n"
+            "Без года,Автор,,978-2,Роман,1\n"
+            "Бесы,Фёдор Достоевский,1872,978-3,Роман,\n",
+            encoding="utf-8"
+        )
+        
+        db = DatabaseManager(str(tmp_path / "library.db"))
+        progress = ImportProgress()
+        result = import_catalog(db, str(path), progress=progress)
+        
+        assert progress.rows_read == 3
+        assert progress.invalid_rows == 1
+        assert result.written == 2
+        
+        books = db.search_books("Достоевский")
+        assert {book.title for book in books} == {"Идиот", "Бесы"}
+        assert {book.available for book in books} == {3, 1}
+        db.close()
+    
+    def test_import_jsonl(self, tmp_path):
+        """Тест импорта JSONL с обновлением существующих книг"""
+        from src.api.catalog_import import import_catalog
+        from src.database.database_manager import DatabaseManager
+        
+        path = tmp_path / "catalog.jsonl"
+        path.write_text(
+            '{"title": "Обломов", "author": "Иван Гончаров", "year": 1859, "isbn": "978-4"}\n'
+            '\n'
+            '{"title": "Обломов (переиздание)", "author": "Иван Гончаров", "year": 1859, "isbn": "978-4"}\n',
+            encoding="utf-8"
+        )
+        
+        db = DatabaseManager(str(tmp_path / "library.db"))
+        result = import_catalog(db, str(path), on_duplicate="upsert")
+        
+        assert result.processed == 2
+        assert [book.title for book in db.search_books("Гончаров")] == ["Обломов (переиздание)"]
+        db.close()
+
+
+class TestAccessTokens:
+    """Тесты подписанных токенов доступа"""
+    
+    def _user(self, user_id=7, role=UserRole.READER):
+        from src.models.user import User
+        return User(id=user_id, username="reader", email="r@example.com",
+                    password_hash="hash", role=role, full_name="Читатель")
+    
+    def test_issue_and_verify(self):
+        """Тест выпуска и проверки токена"""
+        from src.auth.tokens import TokenSigner
+        
+        signer = TokenSigner("secret", ttl=60)
+        identity = signer.verify(signer.issue(self._user()))
+        
+        assert identity.id == 7
+        assert identity.role == UserRole.READER
+        assert identity.can_borrow() is True
+        assert identity.is_admin() is False
+    
+    def test_expired_and_tampered_tokens(self):
+        """Тест отклонения просроченного, подделанного и чужого токена"""
+        from src.auth.tokens import TokenSigner
+        
+        signer = TokenSigner("secret", ttl=60)
+        token = signer.issue(self._user(), now=1000)
+        
+        assert signer.verify(token, now=1059) is not None
+        assert signer.verify(token, now=1060) is None
+        
+        forged = token.replace(".reader.", ".admin.")
+        assert signer.verify(forged, now=1000) is None
+        assert TokenSigner("other", ttl=60).verify(token, now=1000) is None
+        assert signer.verify("не.токен", now=1000) is None
+    
+    def test_api_methods_use_token_identity(self, library_api):
+        """Тест действий от имени пользователя из токена без входа в сеанс"""
+        from src.models.book import Book
+        from src.models.user import User
+        
+        user_id = library_api.db.add_user(User(
+            id=0, username="tokenreader", email="tr@example.com", password_hash="hash",
+            role=UserRole.READER, full_name="Читатель по токену"
+        ))
+        book_id = library_api.db.add_book(Book(
+            id=0, title="Книга", author="Автор", year=2024, isbn="TOKEN-1",
+            publisher="Изд", genre="Жанр", pages=10, quantity=1, available=1
+        ))
+        token = library_api.auth.issue_token(self._user(user_id))
+        
+        assert library_api.get_current_user() is None
+        assert library_api.reserve_book(book_id) is None
+        
+        reservation = library_api.reserve_book(book_id, token=token)
+        assert reservation is not None
+        assert reservation.user_id == user_id
+        assert [r.id for r in library_api.get_my_reservations(token=token)] == [reservation.id]
+        assert library_api.get_my_reservations(token="подделка") == []
+        assert library_api.write_off_book(book_id, token=token) is False
+    
+    def test_token_rejected_after_deactivation(self, library_api):
+        """Тест отзыва токена заблокированного пользователя"""
+        library_api.register("blocked", "b@example.com", "secret", "Пользователь")
+        user, token = library_api.login_with_token("blocked", "secret")
+        assert library_api.resolve_token(token).id == user.id
+        
+        library_api.db.deactivate_user(user.id)
+        assert library_api.resolve_token(token) is None
+    
+    def test_query_stats_admin_only(self, library_api):
+        """Тест доступа к замерам запросов только для администратора"""
+        from src.models.user import User
+        
+        admin_id = library_api.db.add_user(User(
+            id=0, username="statsadmin", email="sa@example.com", password_hash="hash",
+            role=UserRole.ADMIN, full_name="Администратор"
+        ))
+        admin = library_api.auth.issue_token(self._user(admin_id, role=UserRole.ADMIN))
+        reader = library_api.auth.issue_token(self._user())
+        
+        assert library_api.query_stats(token=reader) is None
+        assert library_api.query_stats(token=admin) == {'stats': {}, 'slow_queries': []}
+
+
+class TestReservationLifecycle:
+    """Тесты подтверждения, отмены и истечения бронирований"""
+    
+    def test_confirm_cancel_and_expire(self, library_api):
+        """Тест подтверждения админом, отмены владельцем и сборщика"""
+        from src.models.book import Book
+        from src.models.reservation import ReservationStatus
+        
+        book_id = library_api.db.add_book(Book(
+            id=0, title="Книга", author="Автор", year=2024, isbn="LIFE-1",
+            publisher="Изд", genre="Жанр", pages=10, quantity=2, available=2
+        ))
+        admin = library_api.auth.register_user("admin", "a@example.com", "secret",
+                                               "Админ", UserRole.ADMIN)
+        library_api.register("owner", "o@example.com", "secret", "Владелец")
+        library_api.register("other", "x@example.com", "secret", "Другой")
+        admin_token = library_api.login_with_token("admin", "secret")[1]
+        owner_token = library_api.login_with_token("owner", "secret")[1]
+        other_token = library_api.login_with_token("other", "secret")[1]
+        assert admin is not None
+        
+        first = library_api.reserve_book(book_id, token=owner_token)
+        second = library_api.reserve_book(book_id, token=owner_token)
+        assert library_api.confirm_reservation(first.id, token=owner_token) is False
+        assert library_api.confirm_reservation(first.id, token=admin_token) is True
+        assert library_api.db.get_reservation(first.id).status == ReservationStatus.CONFIRMED
+        
+        assert library_api.cancel_reservation(second.id, token=other_token) is False
+        assert library_api.cancel_reservation(second.id, token=owner_token) is True
+        assert library_api.db.get_book_by_id(book_id).available == 1
+        
+        # Срок получения подтверждённой брони истекает, сборщик её отменяет
+        library_api.db.connect().execute(
+            "UPDATE reservations SET pickup_deadline = '2000-01-01T00:00:00' WHERE id = ?",
+            (first.id,)
+        )
+        library_api.db.connect().commit()
+        sweeper = library_api.start_expiry_sweeper(interval=3600, batch_size=10)
+        assert sweeper.running
+        assert sweeper.sweep() == 1
+        assert library_api.db.get_book_by_id(book_id).available == 2
+        
+        library_api.close()
+        assert not sweeper.running
+
+
+class TestPasswordHashing:
+    """Тесты хеширования паролей"""
+    
+    def test_hash_format_and_verify(self):
+        """Тест версионированного формата и проверки хеша"""
+        from src.auth.password_hashing import PasswordHasher
+        
+        hasher = PasswordHasher('scrypt', n=2 ** 10)
+        stored = hasher.hash("пароль")
+        
+        assert stored.startswith("scrypt$n=1024,r=8,p=1$")
+        assert stored != hasher.hash("пароль")
+        assert hasher.verify("пароль", stored) is True
+        assert hasher.verify("другой", stored) is False
+        assert hasher.verify("пароль", "не хеш") is False
+        assert hasher.needs_rehash(stored) is False
+        assert PasswordHasher('scrypt', n=2 ** 11).needs_rehash(stored) is True
+        assert PasswordHasher('pbkdf2_sha256', i=1000).verify("пароль", stored) is True
+    
+    def test_rehash_on_login(self, tmp_path):
+        """Тест пересчёта хеша при входе после смены стоимости"""
+        from src.auth.password_hashing import PasswordHasher
+        
+        api = LibraryAPI(db_path=str(tmp_path / "library.db"))
+        api.auth.hasher = PasswordHasher('pbkdf2_sha256', i=1000)
+        api.register("rehash", "rh@example.com", "secret", "Пользователь")
+        old_hash = api.db.get_user_by_username("rehash").password_hash
+        
+        api.auth.hasher = PasswordHasher('scrypt', n=2 ** 10)
+        assert api.login("rehash", "secret") is not None
+        new_hash = api.db.get_user_by_username("rehash").password_hash
+        
+        assert old_hash.startswith("pbkdf2_sha256$i=1000$")
+        assert new_hash.startswith("scrypt$n=1024,")
+        assert api.login("rehash", "secret") is not None
+        assert api.db.get_user_by_username("rehash").password_hash == new_hash
+        api.close()
+    
+    def test_kdf_queue_limit(self):
+        """Тест отказа при переполнении очереди хеширования"""
+        import threading
+        from src.auth.password_hashing import AuthenticationBusyError, KdfExecutor
+        
+        kdf = KdfExecutor(max_workers=1, max_pending=1)
+        started, release = threading.Event(), threading.Event()
+        
+        def slow():
+            started.set()
+            release.wait(5)
+            return True
+        
+        worker = threading.Thread(target=kdf.run, args=(slow,))
+        worker.start()
+        started.wait(5)
+        
+        with pytest.raises(AuthenticationBusyError):
+            kdf.run(slow)
+        
+        release.set()
+        worker.join()
+        assert kdf.run(lambda: 42) == 42
+        assert kdf.stats()['rejected'] == 1
+        kdf.shutdown()
+
+
+class TestAsyncLibraryAPI:
+    """Тесты асинхронного фасада"""
+    
+    def test_async_flow(self, tmp_path):
+        """Тест регистрации, входа, поиска и бронирования через корутины"""
+        import asyncio
+        from src.api.async_library_api import AsyncLibraryAPI
+        from src.models.book import Book
+        
+        async def scenario():
+            async with AsyncLibraryAPI(db_path=str(tmp_path / "library.db")) as api:
+                api.api.db.add_book(Book(
+                    id=0, title="Асинхронная книга", author="Автор", year=2024,
+                    isbn="ASYNC-1", publisher="Изд", genre="Жанр", pages=10,
+                    quantity=1, available=1
+                ))
+                
+                assert await api.register("async", "a@example.com", "secret", "Пользователь")
+                user, token = await api.login("async", "secret")
+                books = await api.search_books("Асинхронная")
+                
+                results = await asyncio.gather(
+                    api.reserve_book(books[0].id, token),
+                    api.reserve_book(books[0].id, token),
+                )
+                reservations = await api.get_my_reservations(token)
+                return user, results, reservations
+        
+        user, results, reservations = asyncio.run(scenario())
+        
+        assert sum(result is not None for result in results) == 1
+        assert [r.user_id for r in reservations] == [user.id]
+    
+    def test_login_burst_does_not_block_search(self, tmp_path):
+        """Тест: всплеск входов не занимает потоки пула чтения"""
+        import asyncio
+        import threading
+        from src.api.async_library_api import AsyncLibraryAPI
+        from src.auth.password_hashing import PasswordHasher
+        
+        release = threading.Event()
+        
+        class BlockingHasher(PasswordHasher):
+            def verify(self, password, stored_hash):
+                release.wait(5)
+                return super().verify(password, stored_hash)
+        
+        async def scenario():
+            async with AsyncLibraryAPI(db_path=str(tmp_path / "library.db"),
+                                       read_workers=1) as api:
+                assert await api.register("burst", "b@example.com", "secret", "Пользователь")
+                api.api.auth.hasher = BlockingHasher()
+                
+                logins = [asyncio.ensure_future(api.login("burst", "secret")) for _ in range(8)]
+                for _ in range(200):
+                    if api.api.auth.kdf.stats()['pending'] == len(logins):
+                        break
+                    await asyncio.sleep(0.01)
+                
+                try:
+                    # Единственный поток чтения свободен, пока входы ждут KDF
+                    books = await asyncio.wait_for(api.search_books("книга"), 2)
+                finally:
+                    release.set()
+                return books, await asyncio.gather(*logins)
+        
+        books, results = asyncio.run(scenario())
+        
+        assert books == []
+        assert all(result is not None for result in results)
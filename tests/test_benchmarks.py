@@ -0,0 +1,149 @@
+"""
+Тесты генератора каталога и сравнения результатов бенчмарков
+"""
+import pytest
+from benchmarks import data_generator, load, overhead, run
+from benchmarks.data_generator import build_catalog, generate_books
+from src.api.library_api import LibraryAPI
+
+
+@pytest.fixture
+def tiny_size(monkeypatch):
+    """Маленький размер каталога, чтобы тесты не строили 10 тысяч книг"""
+    monkeypatch.setitem(data_generator.SIZES, 'tiny', 300)
+    return 'tiny'
+
+
+def report(results, **meta):
+    """Результаты прогона в формате run_benchmarks"""
+    base = {'size': '10k', 'seed': 42, 'profile': 'balanced', 'cache': False}
+    base.update(meta)
+    return {'meta': base, 'results': results}
+
+
+class TestDataGenerator:
+    """Тесты детерминированности генератора"""
+
+    def test_same_seed_same_books(self):
+        """Тест одинаковых книг при одинаковом seed"""
+        def books(seed):
+            # created_at — момент создания объекта, от seed он не зависит
+            return [{**book.to_dict(), 'created_at': None}
+                    for book in generate_books(50, seed=seed)]
+
+        first, second, other = books(7), books(7), books(8)
+        assert first == second
+        assert first != other
+
+    def test_build_catalog(self, tmp_path, tiny_size):
+        """Тест сборки базы: счётчики, вход и согласованность экземпляров"""
+        catalog = build_catalog(str(tmp_path / "bench.db"), tiny_size, seed=3)
+        api = LibraryAPI(str(tmp_path / "bench.db"), profile="balanced")
+        try:
+            conn = api.db.connect()
+            assert conn.execute("SELECT COUNT(*) FROM books").fetchone()[0] == catalog.books
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == catalog.users
+            assert conn.execute(
+                "SELECT COUNT(*) FROM reservations").fetchone()[0] == catalog.reservations
+
+            # Свободные экземпляры = тираж минус активные бронирования
+            mismatched = conn.execute('''
+                SELECT COUNT(*) FROM books b
+                WHERE b.available < 0 OR b.available != b.quantity - (
+                    SELECT COUNT(*) FROM reservations r
+                    WHERE r.book_id = b.id AND r.status IN ('pending', 'confirmed')
+                )
+            ''').fetchone()[0]
+            assert mismatched == 0
+
+            assert api.login_with_token(catalog.username(0), data_generator.PASSWORD)
+        finally:
+            api.close()
+
+
+class TestBenchmarkRun:
+    """Тесты замеров и сравнения с базовым прогоном"""
+
+    def test_summarize(self):
+        """Тест перцентилей по ближайшему рангу"""
+        result = run.summarize([i / 1000 for i in range(1, 101)], elapsed=2.0)
+        assert result['ops'] == 100
+        assert result['p50_ms'] == 50.0
+        assert result['p95_ms'] == 95.0
+        assert result['p99_ms'] == 99.0
+        assert result['ops_per_sec'] == 50.0
+
+    def test_compare(self):
+        """Тест обнаружения регрессий по порогу"""
+        baseline = report({
+            'search': {'p50_ms': 1.0, 'p95_ms': 2.0, 'ops_per_sec': 1000},
+            'login': {'p50_ms': 50.0, 'p95_ms': 60.0, 'ops_per_sec': 20},
+        })
+        current = report({
+            'search': {'p50_ms': 1.1, 'p95_ms': 2.6, 'ops_per_sec': 800},
+            'login': {'p50_ms': 40.0, 'p95_ms': 45.0, 'ops_per_sec': 25},
+        })
+
+        regressions = run.compare(current, baseline, threshold=0.2)
+        assert [line.split(':')[0] for line in regressions] == [
+            'search.p95_ms', 'search.ops_per_sec'
+        ]
+        assert run.compare(current, baseline, threshold=0.5) == []
+
+        with pytest.raises(ValueError):
+            run.compare(report({}, size='100k'), baseline)
+
+    def test_run_benchmarks(self, tmp_path, tiny_size):
+        """Тест прогона всех сценариев на маленьком каталоге"""
+        result = run.run_benchmarks(size=tiny_size, seed=3, ops=20, login_ops=2,
+                                    data_dir=str(tmp_path))
+        assert set(result['results']) == {
+            'search_text', 'search_filtered', 'reserve', 'user_reservations', 'login'
+        }
+        assert result['results']['reserve']['ops'] == 20
+        assert result['results']['login']['ops'] == 2
+        assert result['meta']['books'] == 300
+
+    def test_overhead(self, tmp_path, tiny_size):
+        """Тест прогона накладных расходов замеров и проверки бюджета"""
+        result = overhead.run_overhead(size=tiny_size, seed=3, rounds=4, block=5,
+                                       data_dir=str(tmp_path))
+        assert set(result['results']) == set(overhead.SCENARIOS)
+        assert result['results']['reserve']['ops'] == 20
+        assert all(r['plain_us'] > 0 and r['instrumented_us'] > 0
+                   for r in result['results'].values())
+
+        report = {'results': {'get_book': {'overhead': 0.05}, 'reserve': {'overhead': 0.01}}}
+        assert overhead.over_budget(report, 0.02) == ['get_book: +5.0%']
+
+
+class TestLoad:
+    """Тесты генератора конкурентной нагрузки"""
+
+    def test_mix_and_histogram(self):
+        """Тест разбора смеси операций и гистограммы задержки"""
+        assert load.parse_mix("search=3, reserve=1") == {'search': 3, 'reserve': 1}
+        with pytest.raises(ValueError):
+            load.parse_mix("delete=1")
+        with pytest.raises(ValueError):
+            load.parse_mix("search=0")
+
+        counts = load.histogram([0.0005, 0.0015, 0.0015, 5.0])
+        assert counts['<=1ms'] == 1
+        assert counts['<=2ms'] == 2
+        assert counts['>2000ms'] == 1
+
+    def test_in_process_load(self, tmp_path, tiny_size):
+        """Тест конкурентных бронирований через приложение: инварианты соблюдены"""
+        result = load.run_load(workers=4, duration=60, requests=15,
+                               mix={'search': 1, 'reserve': 3}, hot_books=3,
+                               size=tiny_size, seed=3, data_dir=str(tmp_path))
+
+        operations = result['operations']
+        assert result['requests'] == 60
+        assert sum(stats['error'] for stats in operations.values()) == 0
+        # Три «горячие» книги быстро разобраны, остальные попытки получают отказ
+        assert operations['reserve']['rejected'] > 0
+        assert result['invariants'] == {
+            'negative_available': 0, 'available_above_quantity': 0, 'copies_unaccounted': 0
+        }
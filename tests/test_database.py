@@ -1,14 +1,19 @@
 """
 Интеграционные тесты для базы данных
 """
+import json
 import pytest
+import sqlite3
 import tempfile
+import threading
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from src.database.database_manager import DatabaseManager
+from src.database.connection_pool import PoolTimeoutError
+from src.database.reservation_sweeper import ReservationSweeper
 from src.models.book import Book
 from src.models.user import User, UserRole
-from src.models.reservation import Reservation, ReservationStatus
+from src.models.reservation import Reservation, ReservationOutcome, ReservationStatus
 
 
 @pytest.fixture
@@ -164,3 +169,1082 @@ class TestDatabaseManager:
         # Проверяем, что книга не активна
         books = temp_db.search_books(id=book_id)
         assert len(books) == 0  # Не должна находиться в поиске
+
+
+class TestFullTextSearch:
+    """Тесты полнотекстового поиска по каталогу"""
+    
+    @pytest.fixture
+    def catalog_db(self, temp_db):
+        """База с несколькими книгами для поиска"""
+        books_data = [
+            ("Мастер и Маргарита", "Михаил Булгаков", "978-5-17-080115-2", "АСТ", "Роман"),
+            ("Собачье сердце", "Михаил Булгаков", "978-5-389-01006-7", "Азбука", "Повесть"),
+            ("Пикник на обочине", "Аркадий Стругацкий", "978-5-17-091543-1", "АСТ", "Фантастика"),
+        ]
+        
+        for title, author, isbn, publisher, genre in books_data:
+            temp_db.add_book(Book(
+                id=0, title=title, author=author, year=1970, isbn=isbn,
+                publisher=publisher, genre=genre, pages=300, quantity=2, available=2
+            ))
+        
+        return temp_db
+    
+    def test_fts_index_created(self, catalog_db):
+        """Тест создания полнотекстового индекса"""
+        assert catalog_db.fts_enabled is True
+    
+    def test_search_by_word_prefix(self, catalog_db):
+        """Тест поиска по префиксу слова без учёта регистра"""
+        books = catalog_db.search_books("булгак")
+        assert {book.title for book in books} == {"Мастер и Маргарита", "Собачье сердце"}
+        
+        books = catalog_db.search_books("МАСТЕР маргарита")
+        assert [book.title for book in books] == ["Мастер и Маргарита"]
+    
+    def test_search_by_publisher_and_genre(self, catalog_db):
+        """Тест поиска по издательству и жанру"""
+        assert len(catalog_db.search_books("Азбука")) == 1
+        assert len(catalog_db.search_books("фантастика")) == 1
+    
+    def test_search_by_exact_isbn(self, catalog_db):
+        """Тест точного поиска по ISBN"""
+        books = catalog_db.search_books("978-5-389-01006-7")
+        assert len(books) == 1
+        assert books[0].title == "Собачье сердце"
+    
+    def test_search_with_fts_syntax_in_query(self, catalog_db):
+        """Тест запроса со служебными символами FTS5"""
+        assert catalog_db.search_books('"сердце" (*') != []
+        assert catalog_db.search_books("***") == []
+    
+    def test_index_follows_updates(self, catalog_db):
+        """Тест синхронизации индекса при изменении книги"""
+        book = catalog_db.search_books("Пикник")[0]
+        
+        catalog_db.update_book(book.id, title="Трудно быть богом")
+        
+        assert catalog_db.search_books("Пикник") == []
+        assert len(catalog_db.search_books("богом")) == 1
+        
+        catalog_db.write_off_book(book.id)
+        assert catalog_db.search_books("богом") == []
+
+
+class TestQueryPlans:
+    """Проверка планов запросов DatabaseManager"""
+    
+    def test_migrations_recorded(self, temp_db):
+        """Тест записи версии схемы после миграций"""
+        conn = temp_db.connect()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        assert version == DatabaseManager.MIGRATIONS[-1][0]
+        
+        # Повторное открытие не применяет миграции заново
+        reopened = DatabaseManager(temp_db.db_path)
+        assert reopened.connect().execute("PRAGMA user_version").fetchone()[0] == version
+        reopened.close()
+    
+    def test_no_full_table_scans(self, temp_db):
+        """Ни один запрос DatabaseManager не должен сканировать таблицу целиком"""
+        statements = []
+        temp_db.set_trace_callback(statements.append)
+        
+        book_id = temp_db.add_book(Book(
+            id=0, title="План запроса", author="Автор", year=2020, isbn="978-0-00-000000-2",
+            publisher="Издательство", genre="Жанр", pages=100, quantity=2, available=2
+        ))
+        temp_db.search_books()
+        temp_db.search_books("план")
+        temp_db.search_books("978-0-00-000000-2")
+        temp_db.search_books(author="Автор")
+        temp_db.search_books(genre="Жанр", year=2020)
+        temp_db.search_books(year=2020)
+        temp_db.search_books(id=book_id)
+        page = temp_db.search_books_page(limit=1, sort="title")
+        temp_db.search_books(limit=1, sort="title", cursor=temp_db.encode_cursor("title", page.books[0]))
+        temp_db.search_books(limit=1, cursor=temp_db.encode_cursor("id", page.books[0]))
+        temp_db.search_books(genre="Жанр", limit=1, sort="year")
+        temp_db.get_book_by_id(book_id, active_only=True)
+        temp_db.get_books_by_ids([book_id, book_id + 1], active_only=True)
+        temp_db.update_book(book_id, available=1)
+        
+        user_id = temp_db.add_user(User(
+            id=0, username="planner", email="planner@example.com", password_hash="hash",
+            role=UserRole.READER, full_name="Планировщик"
+        ))
+        temp_db.get_user_by_username("planner")
+        temp_db.create_reservation(Reservation(
+            id=0, book_id=book_id, user_id=user_id,
+            status=ReservationStatus.PENDING, reservation_date=datetime.now()
+        ))
+        temp_db.get_user_reservations(user_id)
+        reservation = temp_db.reserve_book(book_id, user_id).reservation
+        temp_db.reserve_book(book_id, user_id)
+        temp_db.update_reservation_status(
+            reservation.id, ReservationStatus.CONFIRMED, datetime(2000, 1, 1)
+        )
+        temp_db.get_reservation(reservation.id)
+        temp_db.join_waitlist(book_id, user_id + 1)
+        temp_db.waitlist_position(book_id, user_id + 1)
+        temp_db.expire_reservations()
+        temp_db.join_waitlist(book_id, user_id + 2)
+        temp_db.leave_waitlist(book_id, user_id + 2)
+        temp_db.return_book(book_id)
+        temp_db.write_off_book(book_id)
+        temp_db.reserve_book(book_id, user_id)
+        
+        temp_db.set_trace_callback(None)
+        conn = temp_db.connect()
+        
+        # Служебные запросы FTS5 к теневым таблицам индекса не проверяем
+        queries = [
+            sql for sql in statements
+            if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE")
+            and "'books_fts_" not in sql
+        ]
+        assert queries
+        
+        for sql in queries:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            for row in plan:
+                detail = row['detail']
+                if detail.startswith("SCAN") and "VIRTUAL TABLE" not in detail:
+                    pytest.fail(f"Полное сканирование в запросе:\n{sql}\n{detail}")
+
+
+class TestConnectionPool:
+    """Тесты пула соединений DatabaseManager"""
+    
+    def test_concurrent_reads_and_writes(self, temp_db):
+        """Тест одновременной работы нескольких потоков с одним менеджером"""
+        errors = []
+        
+        def worker(n):
+            try:
+                for i in range(10):
+                    temp_db.add_book(Book(
+                        id=0, title=f"Поток {n} книга {i}", author="Автор", year=2000,
+                        isbn=f"T{n}-{i}", publisher="Изд", genre="Жанр",
+                        pages=10, quantity=1, available=1
+                    ))
+                    temp_db.search_books("Поток")
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert errors == []
+        assert len(temp_db.search_books("Поток")) == 60
+        
+        stats = temp_db.pool_stats()
+        assert stats['readers_in_use'] == 0
+        assert 0 < stats['readers_created'] <= stats['max_readers']
+        assert stats['writer_checkouts'] >= 60
+    
+    def test_reader_checkout_timeout(self, temp_db):
+        """Тест таймаута при исчерпании соединений на чтение"""
+        pool = temp_db._pool
+        pool.timeout = 0.05
+        
+        held = [pool._checkout_reader(1.0) for _ in range(pool.max_readers)]
+        try:
+            assert temp_db.pool_stats()['saturated'] is True
+            with pytest.raises(PoolTimeoutError):
+                temp_db.search_books()
+            assert temp_db.pool_stats()['reader_timeouts'] == 1
+        finally:
+            for conn in held:
+                pool._checkin_reader(conn)
+        
+        assert temp_db.search_books() == []
+    
+    def test_reads_inside_write_see_own_changes(self, temp_db):
+        """Тест чтения через соединение на запись внутри транзакции"""
+        with temp_db._pool.writer() as conn:
+            conn.execute(
+                "INSERT INTO books (title, author, year, isbn) VALUES ('Черновик', 'А', 2000, 'D-1')"
+            )
+            assert len(temp_db.search_books("Черновик")) == 1
+            conn.rollback()
+        
+        assert temp_db.search_books("Черновик") == []
+    
+    def test_reopen_after_close(self, temp_db):
+        """Тест повторного открытия соединений после close()"""
+        temp_db.close()
+        assert temp_db.search_books() == []
+
+
+class TestStorageProfiles:
+    """Тесты профилей хранения SQLite"""
+    
+    def _pragma(self, db, name):
+        with db._pool.reader() as conn:
+            return conn.execute(f"PRAGMA {name}").fetchone()[0]
+    
+    def test_default_profile_is_durable(self, temp_db):
+        """Тест профиля по умолчанию"""
+        assert temp_db.profile == "durable"
+        assert self._pragma(temp_db, "journal_mode") == "delete"
+        assert self._pragma(temp_db, "synchronous") == 2  # FULL
+    
+    def test_read_heavy_profile(self, tmp_path):
+        """Тест профиля read-heavy"""
+        db = DatabaseManager(str(tmp_path / "catalog.db"), profile="read-heavy")
+        try:
+            assert self._pragma(db, "journal_mode") == "wal"
+            assert self._pragma(db, "synchronous") == 1  # NORMAL
+            assert self._pragma(db, "cache_size") == -262144
+            assert self._pragma(db, "mmap_size") > 0
+        finally:
+            db.close()
+    
+    def test_unknown_profile(self, tmp_path):
+        """Тест неизвестного профиля"""
+        with pytest.raises(ValueError):
+            DatabaseManager(str(tmp_path / "catalog.db"), profile="fastest")
+
+
+class TestBulkImport:
+    """Тесты массового добавления книг"""
+    
+    def _books(self, count, prefix="Книга", quantity=2):
+        for i in range(count):
+            yield Book(
+                id=0, title=f"{prefix} {i}", author="Автор", year=2000 + i % 20,
+                isbn=f"BULK-{i}", publisher="Изд", genre="Жанр",
+                pages=100, quantity=quantity, available=quantity
+            )
+    
+    def test_bulk_insert_in_chunks(self, temp_db):
+        """Тест вставки пачками из генератора"""
+        result = temp_db.add_books_bulk(self._books(250), chunk_size=100)
+        
+        assert result.processed == 250
+        assert result.written == 250
+        assert result.skipped == 0
+        assert len(temp_db.search_books()) == 250
+        assert len(temp_db.search_books("Книга")) == 250
+    
+    def test_skip_duplicates(self, temp_db):
+        """Тест пропуска существующих ISBN"""
+        temp_db.add_books_bulk(self._books(10))
+        result = temp_db.add_books_bulk(self._books(15, prefix="Новая"))
+        
+        assert result.written == 5
+        assert result.skipped == 10
+        assert len(temp_db.search_books("Новая")) == 5
+    
+    def test_upsert_duplicates(self, temp_db):
+        """Тест обновления существующих ISBN с сохранением выданных экземпляров"""
+        temp_db.add_books_bulk(self._books(3, quantity=2))
+        book = temp_db.search_books(isbn="BULK-0")[0]
+        temp_db.update_book(book.id, available=1)
+        
+        result = temp_db.add_books_bulk(self._books(3, prefix="Обновлённая", quantity=5),
+                                        on_duplicate="upsert")
+        
+        assert result.written == 3
+        updated = temp_db.search_books(isbn="BULK-0")[0]
+        assert updated.title == "Обновлённая 0"
+        assert updated.quantity == 5
+        assert updated.available == 4
+        assert len(temp_db.search_books("Обновлённая")) == 3
+    
+    def test_error_policy_rolls_back(self, temp_db):
+        """Тест отката всего импорта при дубликате"""
+        temp_db.add_books_bulk(self._books(1))
+        
+        with pytest.raises(Exception):
+            temp_db.add_books_bulk(self._books(5, prefix="Откат"), on_duplicate="error")
+        
+        assert temp_db.search_books("Откат") == []
+
+
+class TestKeysetPagination:
+    """Тесты постраничного поиска по ключу"""
+    
+    @pytest.fixture
+    def paged_db(self, temp_db):
+        """База из 25 книг с повторяющимися названиями"""
+        temp_db.add_books_bulk(
+            Book(
+                id=0, title=f"Том {i % 5}", author="Автор", year=1990 + i % 7,
+                isbn=f"PAGE-{i}", publisher="Изд", genre="Жанр",
+                pages=100, quantity=1, available=1
+            )
+            for i in range(25)
+        )
+        return temp_db
+    
+    def _walk(self, db, **kwargs):
+        pages = []
+        cursor = None
+        while True:
+            page = db.search_books_page(cursor=cursor, **kwargs)
+            pages.append(page.books)
+            cursor = page.next_cursor
+            if cursor is None:
+                return pages
+    
+    @pytest.mark.parametrize("sort", ["id", "title", "year"])
+    def test_pages_cover_all_books_in_order(self, paged_db, sort):
+        """Тест обхода всех книг страницами без пропусков и повторов"""
+        pages = self._walk(paged_db, limit=7, sort=sort)
+        books = [book for page in pages for book in page]
+        
+        assert [len(page) for page in pages] == [7, 7, 7, 4]
+        assert len({book.id for book in books}) == 25
+        keys = [(getattr(book, sort), book.id) for book in books]
+        assert keys == sorted(keys)
+    
+    def test_pagination_with_query_and_filters(self, paged_db):
+        """Тест постраничного полнотекстового поиска с фильтром"""
+        pages = self._walk(paged_db, query="том", limit=2, sort="title", year=1990)
+        books = [book for page in pages for book in page]
+        
+        assert len(books) == len(paged_db.search_books("том", year=1990))
+        assert all(book.year == 1990 for book in books)
+    
+    def test_last_page_has_no_cursor(self, paged_db):
+        """Тест отсутствия курсора, когда книги закончились"""
+        page = paged_db.search_books_page(limit=25)
+        assert len(page.books) == 25
+        assert page.next_cursor is None
+    
+    def test_invalid_cursor(self, paged_db):
+        """Тест некорректного курсора и курсора от другой сортировки"""
+        page = paged_db.search_books_page(limit=5, sort="title")
+        
+        with pytest.raises(ValueError):
+            paged_db.search_books(limit=5, sort="year", cursor=page.next_cursor)
+        with pytest.raises(ValueError):
+            paged_db.search_books(limit=5, cursor="не курсор")
+        with pytest.raises(ValueError):
+            paged_db.search_books(sort="pages")
+
+
+class TestStreamingSearch:
+    """Тесты ленивого поиска iter_search_books"""
+    
+    @pytest.fixture
+    def large_db(self, temp_db):
+        """База из 120 книг"""
+        temp_db.add_books_bulk(
+            Book(
+                id=0, title=f"Поток {i}", author="Автор", year=2000, isbn=f"STREAM-{i}",
+                publisher="Изд", genre="Жанр", pages=100, quantity=1, available=1
+            )
+            for i in range(120)
+        )
+        return temp_db
+    
+    def test_yields_same_books_as_search(self, large_db):
+        """Тест совпадения выдачи с search_books"""
+        streamed = [book.id for book in large_db.iter_search_books("поток", batch_size=7)]
+        assert streamed == [book.id for book in large_db.search_books("поток")]
+    
+    def test_lazy_iteration_releases_connection(self, large_db):
+        """Тест возврата соединения в пул при закрытии генератора"""
+        books = large_db.iter_search_books(batch_size=10)
+        first = next(books)
+        
+        assert first.title == "Поток 0"
+        assert large_db.pool_stats()['readers_in_use'] == 1
+        
+        books.close()
+        assert large_db.pool_stats()['readers_in_use'] == 0
+    
+    def test_invalid_arguments(self, large_db):
+        """Тест проверки аргументов до начала чтения"""
+        with pytest.raises(ValueError):
+            large_db.iter_search_books(sort="pages")
+        with pytest.raises(ValueError):
+            large_db.iter_search_books(batch_size=0)
+
+
+class TestAtomicReservation:
+    """Тесты бронирования одной транзакцией"""
+    
+    def _add_book(self, db, quantity):
+        return db.add_book(Book(
+            id=0, title="Популярная книга", author="Автор", year=2024, isbn="HOT-1",
+            publisher="Изд", genre="Жанр", pages=100, quantity=quantity, available=quantity
+        ))
+    
+    def test_reserve_until_sold_out(self, temp_db):
+        """Тест бронирования до исчерпания экземпляров"""
+        book_id = self._add_book(temp_db, 1)
+        
+        result = temp_db.reserve_book(book_id, user_id=1)
+        assert result.outcome == ReservationOutcome.RESERVED
+        assert result.reservation.id > 0
+        assert result.reservation.status == ReservationStatus.PENDING
+        
+        result = temp_db.reserve_book(book_id, user_id=2)
+        assert result.outcome == ReservationOutcome.SOLD_OUT
+        assert result.reservation is None
+        
+        assert temp_db.search_books(id=book_id)[0].available == 0
+        assert len(temp_db.get_user_reservations(1)) == 1
+        assert temp_db.get_user_reservations(2) == []
+    
+    def test_reserve_missing_or_written_off(self, temp_db):
+        """Тест бронирования несуществующей и списанной книги"""
+        assert temp_db.reserve_book(999, user_id=1).outcome == ReservationOutcome.NOT_FOUND
+        
+        book_id = self._add_book(temp_db, 2)
+        temp_db.write_off_book(book_id)
+        assert temp_db.reserve_book(book_id, user_id=1).outcome == ReservationOutcome.NOT_FOUND
+    
+    def test_concurrent_reservations_never_oversell(self, temp_db):
+        """Тест гонки за последние экземпляры"""
+        book_id = self._add_book(temp_db, 3)
+        outcomes = []
+        lock = threading.Lock()
+        
+        def reserve(user_id):
+            result = temp_db.reserve_book(book_id, user_id)
+            with lock:
+                outcomes.append(result.outcome)
+        
+        threads = [threading.Thread(target=reserve, args=(n,)) for n in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert outcomes.count(ReservationOutcome.RESERVED) == 3
+        assert outcomes.count(ReservationOutcome.SOLD_OUT) == 9
+        assert temp_db.search_books(id=book_id)[0].available == 0
+    
+    def test_reserve_books_policies(self, temp_db):
+        """Тест пакетного бронирования: откат пакета и бронирование возможного"""
+        book_id = self._add_book(temp_db, 3)
+        other_id = temp_db.add_book(Book(
+            id=0, title="Другая", author="Автор", year=2000, isbn="HOT-2",
+            publisher="Изд", genre="Жанр", pages=10, quantity=0, available=0
+        ))
+        
+        results = temp_db.reserve_books([book_id, other_id, 9999], user_id=1)
+        assert [r.outcome for r in results] == [
+            ReservationOutcome.ROLLED_BACK, ReservationOutcome.SOLD_OUT,
+            ReservationOutcome.NOT_FOUND
+        ]
+        assert temp_db.get_book_by_id(book_id).available == 3
+        assert temp_db.get_user_reservations(1) == []
+        
+        results = temp_db.reserve_books([book_id, other_id, book_id], user_id=1,
+                                        policy="best_effort")
+        assert [r.outcome for r in results] == [
+            ReservationOutcome.RESERVED, ReservationOutcome.SOLD_OUT
+        ]
+        assert temp_db.get_book_by_id(book_id).available == 2
+        assert len(temp_db.get_user_reservations(1)) == 1
+        
+        with pytest.raises(ValueError):
+            temp_db.reserve_books([book_id], user_id=1, policy="some")
+
+
+class TestReservationExpiry:
+    """Тесты смены статуса и отмены просроченных бронирований"""
+    
+    def _add_book(self, db, quantity, isbn="EXP-1"):
+        return db.add_book(Book(
+            id=0, title="Книга с очередью", author="Автор", year=2024, isbn=isbn,
+            publisher="Изд", genre="Жанр", pages=100, quantity=quantity, available=quantity
+        ))
+    
+    def test_status_transitions(self, temp_db):
+        """Тест подтверждения, отмены и недопустимых переходов"""
+        book_id = self._add_book(temp_db, 2)
+        reservation = temp_db.reserve_book(book_id, user_id=1).reservation
+        deadline = datetime(2030, 1, 1, 12, 0)
+        
+        assert temp_db.update_reservation_status(
+            reservation.id, ReservationStatus.CONFIRMED, deadline
+        )
+        stored = temp_db.get_reservation(reservation.id)
+        assert stored.status == ReservationStatus.CONFIRMED
+        assert stored.pickup_deadline == deadline
+        assert temp_db.get_book_by_id(book_id).available == 1
+        
+        # Отмена возвращает экземпляр, повторная отмена ничего не меняет
+        assert temp_db.update_reservation_status(reservation.id, ReservationStatus.CANCELLED)
+        assert not temp_db.update_reservation_status(reservation.id, ReservationStatus.CANCELLED)
+        assert temp_db.get_book_by_id(book_id).available == 2
+        
+        assert not temp_db.update_reservation_status(reservation.id, ReservationStatus.CONFIRMED)
+        assert not temp_db.update_reservation_status(9999, ReservationStatus.CANCELLED)
+        with pytest.raises(ValueError):
+            temp_db.update_reservation_status(reservation.id, ReservationStatus.PENDING)
+    
+    def test_expire_in_batches(self, temp_db):
+        """Тест отмены просроченных бронирований пачками"""
+        book_id = self._add_book(temp_db, 5)
+        other_id = self._add_book(temp_db, 1, isbn="EXP-2")
+        past, future = datetime(2000, 1, 1), datetime(2100, 1, 1)
+        
+        expired = []
+        for user_id in range(1, 5):
+            reservation = temp_db.reserve_book(book_id, user_id).reservation
+            temp_db.update_reservation_status(reservation.id, ReservationStatus.CONFIRMED, past)
+            expired.append(reservation.id)
+        fresh = temp_db.reserve_book(book_id, user_id=5).reservation
+        temp_db.update_reservation_status(fresh.id, ReservationStatus.CONFIRMED, future)
+        completed = temp_db.reserve_book(other_id, user_id=1).reservation
+        temp_db.update_reservation_status(completed.id, ReservationStatus.CONFIRMED, past)
+        temp_db.update_reservation_status(completed.id, ReservationStatus.COMPLETED)
+        assert temp_db.get_book_by_id(book_id).available == 0
+        
+        first = temp_db.expire_reservations(batch_size=3)
+        second = temp_db.expire_reservations(batch_size=3)
+        assert len(first) == 3 and len(second) == 1
+        assert sorted(first + second) == expired
+        assert temp_db.expire_reservations(batch_size=3) == []
+        
+        assert temp_db.get_book_by_id(book_id).available == 4
+        assert temp_db.get_book_by_id(other_id).available == 0
+        assert temp_db.get_reservation(fresh.id).status == ReservationStatus.CONFIRMED
+        assert temp_db.get_reservation(expired[0]).status == ReservationStatus.CANCELLED
+    
+    def test_unconfirmed_reservations_expire(self, temp_db):
+        """Тест: неподтверждённые бронирования получают срок и отменяются по нему"""
+        from src.database.database_manager import PICKUP_WINDOW
+        
+        book_id = self._add_book(temp_db, 3)
+        single = temp_db.reserve_book(book_id, user_id=1).reservation
+        batch = [result.reservation for result in temp_db.reserve_books([book_id], user_id=2)]
+        assert temp_db.get_book_by_id(book_id).available == 1
+        
+        for reservation in [single, *batch]:
+            stored = temp_db.get_reservation(reservation.id)
+            assert stored.status == ReservationStatus.PENDING
+            assert stored.pickup_deadline == stored.reservation_date + PICKUP_WINDOW
+        
+        deadline = max(reservation.pickup_deadline for reservation in [single, *batch])
+        assert temp_db.expire_reservations(now=single.pickup_deadline - timedelta(minutes=1)) == []
+        expired = temp_db.expire_reservations(now=deadline + timedelta(minutes=1))
+        assert sorted(expired) == sorted([single.id, *(r.id for r in batch)])
+        assert temp_db.get_book_by_id(book_id).available == 3
+    
+    def test_sweeper_expires_legacy_pending(self, temp_db):
+        """Тест: миграция назначает срок бронированиям, созданным без него"""
+        book_id = self._add_book(temp_db, 1)
+        with temp_db._pool.writer() as conn:
+            conn.execute("UPDATE books SET available = 0 WHERE id = ?", (book_id,))
+            conn.execute(
+                "INSERT INTO reservations (book_id, user_id, status, reservation_date) "
+                "VALUES (?, 1, ?, ?)",
+                (book_id, ReservationStatus.PENDING.value, datetime(2000, 1, 1).isoformat())
+            )
+            conn.execute("PRAGMA user_version = 6")
+            conn.commit()
+        
+        reopened = DatabaseManager(temp_db.db_path)
+        try:
+            assert ReservationSweeper(reopened).sweep() == 1
+            assert reopened.get_book_by_id(book_id).available == 1
+        finally:
+            reopened.close()
+    
+    def test_expiry_uses_index(self, temp_db):
+        """Тест поиска просроченных бронирований по индексу"""
+        conn = temp_db.connect()
+        plan = conn.execute('''
+            EXPLAIN QUERY PLAN SELECT id, book_id FROM reservations
+            WHERE status IN (?, ?) AND pickup_deadline < ? LIMIT ?
+        ''', ('pending', 'confirmed', '2030-01-01', 10)).fetchall()
+        assert any('idx_reservations_status_deadline' in row['detail'] for row in plan)
+    
+    def test_concurrent_sweepers(self, temp_db):
+        """Тест одновременной работы сборщиков из разных менеджеров БД"""
+        book_id = self._add_book(temp_db, 40)
+        for user_id in range(40):
+            reservation = temp_db.reserve_book(book_id, user_id).reservation
+            temp_db.update_reservation_status(
+                reservation.id, ReservationStatus.CONFIRMED, datetime(2000, 1, 1)
+            )
+        
+        managers = [DatabaseManager(temp_db.db_path) for _ in range(3)]
+        sweepers = [ReservationSweeper(db, batch_size=4) for db in managers]
+        threads = [threading.Thread(target=sweeper.sweep) for sweeper in sweepers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for db in managers:
+            db.close()
+        
+        assert sum(sweeper.expired_total for sweeper in sweepers) == 40
+        assert temp_db.get_book_by_id(book_id).available == 40
+
+
+class TestWaitlist:
+    """Тесты очереди ожидания и передачи экземпляров"""
+    
+    def _sold_out_book(self, db, isbn="WAIT-1"):
+        book_id = db.add_book(Book(
+            id=0, title="Дефицитная книга", author="Автор", year=2024, isbn=isbn,
+            publisher="Изд", genre="Жанр", pages=100, quantity=1, available=1
+        ))
+        holder = db.reserve_book(book_id, user_id=100).reservation
+        return book_id, holder
+    
+    def test_order_and_positions(self, temp_db):
+        """Тест порядка очереди: приоритет, затем время записи"""
+        book_id, _ = self._sold_out_book(temp_db)
+        
+        assert temp_db.join_waitlist(book_id, 1).position == 1
+        assert temp_db.join_waitlist(book_id, 2).position == 2
+        assert temp_db.join_waitlist(book_id, 3, priority=-1).position == 1
+        assert temp_db.join_waitlist(book_id, 1).position == 2  # повторная запись
+        
+        assert [temp_db.waitlist_position(book_id, u) for u in (3, 1, 2)] == [1, 2, 3]
+        assert temp_db.leave_waitlist(book_id, 1)
+        assert not temp_db.leave_waitlist(book_id, 1)
+        assert temp_db.waitlist_position(book_id, 1) is None
+        assert temp_db.waitlist_position(book_id, 2) == 2
+        assert temp_db.join_waitlist(9999, 1) is None
+    
+    def test_hand_off_on_cancel_and_return(self, temp_db):
+        """Тест передачи освободившегося экземпляра первому в очереди"""
+        book_id, holder = self._sold_out_book(temp_db)
+        temp_db.join_waitlist(book_id, 1)
+        temp_db.join_waitlist(book_id, 2)
+        
+        assert temp_db.update_reservation_status(holder.id, ReservationStatus.CANCELLED)
+        assert temp_db.get_book_by_id(book_id).available == 0
+        [handed] = temp_db.get_user_reservations(1)
+        assert handed.status == ReservationStatus.PENDING
+        assert handed.pickup_deadline is not None
+        assert temp_db.waitlist_position(book_id, 1) is None
+        assert temp_db.waitlist_position(book_id, 2) == 1
+        
+        # Экземпляр выдан и возвращён: он достаётся следующему
+        temp_db.update_reservation_status(handed.id, ReservationStatus.COMPLETED)
+        assert temp_db.return_book(book_id)
+        assert len(temp_db.get_user_reservations(2)) == 1
+        assert temp_db.waitlist_position(book_id, 2) is None
+        
+        # Очередь пуста: экземпляр возвращается на полку
+        temp_db.update_reservation_status(temp_db.get_user_reservations(2)[0].id,
+                                          ReservationStatus.COMPLETED)
+        assert temp_db.return_book(book_id)
+        assert temp_db.get_book_by_id(book_id).available == 1
+        assert not temp_db.return_book(book_id)
+    
+    def test_join_with_free_copy(self, temp_db):
+        """Тест записи в очередь при свободном экземпляре"""
+        book_id, _ = self._sold_out_book(temp_db)
+        temp_db.update_book(book_id, quantity=2, available=1)
+        
+        entry = temp_db.join_waitlist(book_id, 1)
+        assert entry.position is None
+        assert entry.reservation.user_id == 1
+        assert temp_db.get_book_by_id(book_id).available == 0
+    
+    def test_index_sees_other_process(self, temp_db):
+        """Тест обновления индекса после изменений из другого менеджера БД"""
+        book_id, _ = self._sold_out_book(temp_db)
+        other = DatabaseManager(temp_db.db_path)
+        try:
+            temp_db.join_waitlist(book_id, 1)
+            assert temp_db.waitlist_position(book_id, 1) == 1
+            other.join_waitlist(book_id, 2)
+            assert temp_db.waitlist_position(book_id, 2) == 2
+            
+            other.leave_waitlist(book_id, 1)
+            assert temp_db.waitlist_position(book_id, 1) is None
+            assert temp_db.waitlist_position(book_id, 2) == 1
+            assert other.waitlist_position(book_id, 2) == 1
+        finally:
+            other.close()
+
+
+class TestSearchCache:
+    """Тесты кэша результатов поиска"""
+    
+    @pytest.fixture
+    def cached_db(self, temp_db):
+        """База с двумя книгами разных жанров"""
+        for isbn, title, genre in [("C-1", "Дюна", "Фантастика"), ("C-2", "Ревизор", "Пьеса")]:
+            temp_db.add_book(Book(
+                id=0, title=title, author="Автор", year=1965, isbn=isbn,
+                publisher="Изд", genre=genre, pages=100, quantity=2, available=2
+            ))
+        return temp_db
+    
+    def test_repeated_query_is_served_from_cache(self, cached_db):
+        """Тест попадания повторного запроса в кэш"""
+        cached_db.search_books("дюна")
+        before = cached_db.search_cache_stats()
+        
+        books = cached_db.search_books("  Дюна ")
+        stats = cached_db.search_cache_stats()
+        
+        assert [book.title for book in books] == ["Дюна"]
+        assert stats['hits'] == before['hits'] + 1
+    
+    def test_cached_books_are_copies(self, cached_db):
+        """Тест защиты кэша от изменения возвращённых книг"""
+        cached_db.search_books(genre="Пьеса")[0].available = 0
+        assert cached_db.search_books(genre="Пьеса")[0].available == 2
+    
+    def test_reservation_invalidates_only_affected_results(self, cached_db):
+        """Тест точечной инвалидации по поколениям книг"""
+        dune = cached_db.search_books(genre="Фантастика")[0]
+        cached_db.search_books(genre="Пьеса")
+        
+        cached_db.reserve_book(dune.id, user_id=1)
+        before = cached_db.search_cache_stats()
+        
+        assert cached_db.search_books(genre="Фантастика")[0].available == 1
+        assert len(cached_db.search_books(genre="Пьеса")) == 1
+        
+        stats = cached_db.search_cache_stats()
+        assert stats['invalidations'] == before['invalidations'] + 1
+        assert stats['hits'] == before['hits'] + 1
+    
+    def test_new_book_invalidates_results(self, cached_db):
+        """Тест инвалидации выдач при добавлении книги"""
+        assert len(cached_db.search_books(author="Автор")) == 2
+        
+        cached_db.add_book(Book(
+            id=0, title="Нос", author="Автор", year=1836, isbn="C-3",
+            publisher="Изд", genre="Повесть", pages=50, quantity=1, available=1
+        ))
+        
+        assert len(cached_db.search_books(author="Автор")) == 3
+    
+    def test_other_process_write_invalidates_results(self, cached_db):
+        """Тест сброса выдач, когда версия каталога выдаёт запись другого процесса"""
+        version = cached_db.catalog_version()
+        dune = cached_db.search_books(genre="Фантастика")[0]
+        cached_db.search_books(genre="Пьеса")
+        
+        other = DatabaseManager(cached_db.db_path)
+        try:
+            assert other.reserve_book(dune.id, user_id=1).success
+        finally:
+            other.close()
+        
+        # Пока версия запомнена, выдача согласована со старой версией
+        assert cached_db.catalog_version() == version
+        assert cached_db.search_books(genre="Фантастика")[0].available == 2
+        
+        cached_db.catalog_version_ttl = 0
+        assert cached_db.catalog_version() > version
+        assert cached_db.search_books(genre="Фантастика")[0].available == 1
+        
+        # Свои записи по-прежнему сбрасывают только затронутые выдачи
+        cached_db.search_books(genre="Пьеса")
+        version = cached_db.catalog_version()
+        cached_db.reserve_book(dune.id, user_id=2)
+        before = cached_db.search_cache_stats()
+        assert cached_db.catalog_version() > version
+        assert len(cached_db.search_books(genre="Пьеса")) == 1
+        assert cached_db.search_cache_stats()['hits'] == before['hits'] + 1
+    
+    def test_eviction_and_disabled_cache(self, tmp_path):
+        """Тест вытеснения старых записей и отключения кэша"""
+        db = DatabaseManager(str(tmp_path / "small.db"), search_cache_size=2)
+        for query in ("а", "б", "в"):
+            db.search_books(query)
+        assert db.search_cache_stats()['evictions'] == 1
+        assert db.search_cache_stats()['size'] == 2
+        db.close()
+        
+        db = DatabaseManager(str(tmp_path / "nocache.db"), search_cache_size=0)
+        db.search_books("а")
+        assert db.search_cache_stats() == {}
+        db.close()
+    
+    def test_book_generations_stay_bounded(self):
+        """Тест: поколения книг не копятся с числом записей"""
+        from src.database.cache import SearchCache
+        
+        cache = SearchCache(maxsize=4)
+        book = Book(id=1, title="Дюна", author="Автор", year=1965, isbn="G-1",
+                    publisher="Изд", genre="Фантастика", pages=100, quantity=1, available=1)
+        cache.put("дюна", cache.snapshot(), [book])
+        in_flight = cache.snapshot()
+        
+        for book_id in range(2, 10000):
+            cache.invalidate_books([book_id])
+        
+        assert cache.stats()['book_generations'] <= 4
+        # Выдачу не затронутой записями книги по-прежнему отдаёт кэш
+        assert cache.get("дюна") is not None
+        # Запрос, начатый до чистки, не сохраняет выдачу с удалёнными поколениями
+        cache.put("старая", in_flight, [Book(**{**book.__dict__, 'id': 5000})])
+        assert cache.get("старая") is None
+        
+        cache.invalidate_books([1])
+        assert cache.get("дюна") is None
+        cache.invalidate_membership()
+        assert cache.stats()['book_generations'] == 0
+
+
+class TestBookLookupById:
+    """Тесты выборки книг по первичному ключу"""
+    
+    @pytest.fixture
+    def ids(self, temp_db):
+        """ID трёх добавленных книг"""
+        return [
+            temp_db.add_book(Book(
+                id=0, title=f"Книга {i}", author="Автор", year=2000, isbn=f"ID-{i}",
+                publisher="Изд", genre="Жанр", pages=100, quantity=1, available=1
+            ))
+            for i in range(3)
+        ]
+    
+    def test_get_book_by_id(self, temp_db, ids):
+        """Тест выборки одной книги"""
+        assert temp_db.get_book_by_id(ids[1]).title == "Книга 1"
+        assert temp_db.get_book_by_id(9999) is None
+        
+        temp_db.write_off_book(ids[1])
+        assert temp_db.get_book_by_id(ids[1]).is_active is False
+        assert temp_db.get_book_by_id(ids[1], active_only=True) is None
+    
+    def test_get_books_by_ids_keeps_order(self, temp_db, ids):
+        """Тест пакетной выборки в порядке запроса без дублей и отсутствующих"""
+        books = temp_db.get_books_by_ids([ids[2], 9999, ids[0], ids[2]])
+        assert [book.id for book in books] == [ids[2], ids[0]]
+        assert temp_db.get_books_by_ids([]) == []
+    
+    def test_identity_map(self, temp_db, ids):
+        """Тест повторного использования объектов внутри карты идентичности"""
+        with temp_db.identity_map():
+            first = temp_db.get_book_by_id(ids[0])
+            batch = temp_db.get_books_by_ids(ids)
+            assert batch[0] is first
+        
+        assert temp_db.get_book_by_id(ids[0]) is not first
+
+
+class TestUserCache:
+    """Тесты кэша пользователей"""
+    
+    def _user(self, username="cached"):
+        return User(id=0, username=username, email=f"{username}@example.com",
+                    password_hash="hash", role=UserRole.READER, full_name="Пользователь")
+    
+    def test_negative_cache_dropped_on_add(self, temp_db):
+        """Тест запоминания отсутствующего имени до регистрации"""
+        assert temp_db.get_user_by_username("cached") is None
+        assert temp_db.get_user_by_username("cached") is None
+        assert temp_db.user_cache_stats()['missing']['hits'] == 1
+        
+        user_id = temp_db.add_user(self._user())
+        assert temp_db.get_user_by_username("cached").id == user_id
+    
+    def test_hits_and_invalidation(self, temp_db):
+        """Тест попаданий по имени и id и сброса при блокировке"""
+        user_id = temp_db.add_user(self._user())
+        first = temp_db.get_user_by_username("cached")
+        first.full_name = "Изменено снаружи"
+        
+        assert temp_db.get_user_by_id(user_id).full_name == "Пользователь"
+        assert temp_db.user_cache_stats()['by_id']['hits'] == 1
+        
+        assert temp_db.deactivate_user(user_id) is True
+        assert temp_db.get_user_by_username("cached").is_active is False
+        assert temp_db.get_user_by_id(user_id).is_active is False
+
+
+class TestCatalogVersion:
+    """Тесты версии каталога"""
+    
+    def test_version_changes_on_book_writes(self, temp_db):
+        """Тест смены версии при добавлении, изменении и бронировании"""
+        versions = [temp_db.catalog_version()]
+        book_id = temp_db.add_book(Book(
+            id=0, title="Книга", author="Автор", year=2000, isbn="VERSION-1",
+            publisher="Изд", genre="Жанр", pages=100, quantity=1, available=1
+        ))
+        versions.append(temp_db.catalog_version())
+        user_id = temp_db.add_user(User(
+            id=0, username="versions", email="v@example.com", password_hash="hash",
+            role=UserRole.READER, full_name="Читатель"
+        ))
+        versions.append(temp_db.catalog_version())
+        temp_db.reserve_book(book_id, user_id)
+        versions.append(temp_db.catalog_version())
+        
+        assert versions[0] < versions[1] == versions[2] < versions[3]
+    
+    def test_version_is_memoized(self, temp_db):
+        """Тест запоминания версии без повторного SQL"""
+        statements = []
+        temp_db.catalog_version()
+        temp_db.set_trace_callback(statements.append)
+        temp_db.catalog_version()
+        temp_db.set_trace_callback(None)
+        
+        assert statements == []
+
+
+@pytest.fixture
+def instrumented_db(tmp_path):
+    """БД с замерами запросов; порог 0 записывает в журнал каждое выражение"""
+    db_manager = DatabaseManager(
+        str(tmp_path / "instrumented.db"), instrument=True, slow_query_threshold=0.0,
+        slow_query_log=str(tmp_path / "slow.log")
+    )
+    yield db_manager
+    db_manager.close()
+
+
+class TestQueryInstrumentation:
+    """Тесты замеров запросов и журнала медленных запросов"""
+    
+    def add_books(self, db, count):
+        return [
+            db.add_book(Book(
+                id=0, title=f"Книга {i}", author="Автор", year=2000, isbn=f"STATS-{i}",
+                publisher="Изд", genre="Жанр", pages=100, quantity=1, available=1
+            ))
+            for i in range(count)
+        ]
+    
+    def test_statement_stats(self, instrumented_db):
+        """Тест выражений, строк и методов, к которым они отнесены"""
+        book_ids = self.add_books(instrumented_db, 3)
+        instrumented_db.get_book_by_id(book_ids[0])
+        instrumented_db.get_book_by_id(book_ids[1])
+        instrumented_db.search_books("Книга", limit=2)
+        
+        stats = instrumented_db.query_stats()
+        lookup = stats['methods']['get_book_by_id']
+        assert lookup['statements'] == 2
+        assert sum(lookup['histogram'].values()) == 2
+        assert lookup['p50_ms'] <= lookup['p99_ms']
+        
+        # Выражение относится к функции, которая его выполнила
+        search = stats['methods']['_select_books']
+        assert search['statements'] == 1
+        assert search['rows'] == 0
+        
+        inserts = [s for s in stats['statements'] if s['sql'].startswith("INSERT INTO books (")]
+        assert [(s['method'], s['statements'], s['rows']) for s in inserts] == [('add_book', 3, 3)]
+        commits = [s for s in stats['statements'] if s['sql'] == "COMMIT"]
+        assert commits and commits[0]['statements'] >= 3
+    
+    def test_every_statement_logged(self, instrumented_db):
+        """Тест журнала: каждое выражение дольше порога попадает в него с SQL"""
+        book_id = self.add_books(instrumented_db, 1)[0]
+        for _ in range(50):
+            instrumented_db.get_book_by_id(book_id)
+        
+        entries = [e for e in instrumented_db.slow_queries() if e['method'] == 'get_book_by_id']
+        assert len(entries) == 50
+        assert all(e['sql'].startswith("SELECT") and e['plan'] for e in entries)
+        assert all(e['parameters'] == ['int'] for e in entries)
+    
+    def test_counts_across_threads(self, instrumented_db):
+        """Тест замеров выражений из нескольких потоков"""
+        book_id = self.add_books(instrumented_db, 1)[0]
+        instrumented_db._instrumentation.slow_threshold = float('inf')
+        
+        def lookups():
+            for _ in range(1500):
+                instrumented_db.get_book_by_id(book_id)
+        
+        threads = [threading.Thread(target=lookups) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        # Замеры переносятся в гистограмму пачками и при построении отчёта
+        lookup = instrumented_db.query_stats()['methods']['get_book_by_id']
+        assert lookup['statements'] == 4500
+        assert sum(lookup['histogram'].values()) == 4500
+    
+    def test_errors(self, instrumented_db):
+        """Тест выражения с ошибкой: учитывается и попадает в журнал"""
+        conn = instrumented_db.connect()
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("SELECT * FROM no_such_table")
+        
+        stats = instrumented_db.query_stats()
+        failed = [s for s in stats['statements'] if 'no_such_table' in s['sql']]
+        assert failed[0]['errors'] == 1
+        assert failed[0]['statements'] == 0
+        entry = instrumented_db.slow_queries()[-1]
+        assert entry['error'] == 'OperationalError'
+        assert entry['plan'] == []
+    
+    def test_generator_methods(self, instrumented_db):
+        """Тест генераторов: каждая пачка — отдельное выражение"""
+        self.add_books(instrumented_db, 5)
+        for rows in instrumented_db.iter_book_rows(chunk_size=2):
+            break
+        assert len(list(instrumented_db.iter_book_rows(chunk_size=2))) == 3
+        
+        stats = instrumented_db.query_stats()['methods']['iter_book_rows']
+        assert stats['errors'] == 0
+        assert stats['statements'] == 1 + 3
+    
+    def test_cursor_statements(self, instrumented_db):
+        """Тест выражений через conn.cursor() и executemany: время и изменённые строки"""
+        conn = instrumented_db.connect()
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE t (x INTEGER)")
+        cursor.executemany("INSERT INTO t (x) VALUES (?)", ((i,) for i in range(4)))
+        conn.execute("UPDATE t SET x = x + 1 WHERE x > ?", (1,))
+        conn.commit()
+        
+        statements = {s['sql']: s for s in instrumented_db.query_stats()['statements']}
+        assert statements["INSERT INTO t (x) VALUES (?)"]['rows'] == 4
+        assert statements["UPDATE t SET x = x + 1 WHERE x > ?"]['rows'] == 2
+        assert statements["COMMIT"]['statements'] >= 1
+        
+        entry = [e for e in instrumented_db.slow_queries() if e['sql'].startswith("INSERT INTO t")][0]
+        assert entry['parameters'] == ['int']
+        assert entry['method'] == 'test_cursor_statements'
+    
+    def test_slow_query_log(self, instrumented_db, tmp_path):
+        """Тест журнала: план, типы параметров без значений, файл JSON"""
+        book_ids = self.add_books(instrumented_db, 1)
+        instrumented_db.get_book_by_id(book_ids[0])
+        
+        entry = [e for e in instrumented_db.slow_queries() if e['method'] == 'get_book_by_id'][-1]
+        assert entry['sql'].startswith("SELECT")
+        assert entry['parameters'] == ['int']
+        assert any('books' in line for line in entry['plan'])
+        
+        inserts = [e for e in instrumented_db.slow_queries()
+                   if e['sql'].startswith("INSERT INTO books (")]
+        assert "STATS-0" not in json.dumps(inserts)
+        assert 'str[7]' in inserts[0]['parameters']
+        assert inserts[0]['rows'] == 1
+        
+        with open(tmp_path / "slow.log", encoding='utf-8') as f:
+            logged = [json.loads(line) for line in f]
+        assert len(logged) == instrumented_db.query_stats()['slow_queries']
+    
+    def test_reset(self, instrumented_db):
+        """Тест сброса показателей и журнала"""
+        self.add_books(instrumented_db, 1)
+        instrumented_db._instrumentation.reset()
+        stats = instrumented_db.query_stats()
+        assert stats['methods'] == {}
+        assert stats['slow_queries'] == 0
+        assert instrumented_db.slow_queries() == []
+    
+    def test_disabled_by_default(self, temp_db):
+        """Тест отсутствия замеров без instrument=True"""
+        temp_db.search_books("что-нибудь")
+        assert temp_db.query_stats() == {}
+        assert temp_db.slow_queries() == []
+        assert type(temp_db.connect()) is sqlite3.Connection
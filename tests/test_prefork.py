@@ -0,0 +1,33 @@
+"""
+Тесты многопроцессного режима веб-сервера
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import urllib.request
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="нужен os.fork")
+def test_workers_are_recycled(tmp_path):
+    """Тест обслуживания запросов сверх лимита рабочих процессов"""
+    server = subprocess.Popen(
+        [sys.executable, '-u', '-m', 'src.main', '--mode', 'serve', '--port', '0',
+         '--workers', '2', '--max-requests', '2', '--max-requests-jitter', '0',
+         '--db', str(tmp_path / "library.db")],
+        cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    try:
+        url = server.stdout.readline().split()[-3]
+        
+        for _ in range(10):
+            with urllib.request.urlopen(f"{url}/api/books/search", timeout=10) as response:
+                assert json.load(response)['success'] is True
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=10) == 0
+        server.stdout.close()
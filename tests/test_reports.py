@@ -0,0 +1,114 @@
+"""
+Тесты отчёта об обороте фонда
+"""
+import pytest
+from datetime import datetime
+from src.api.library_api import LibraryAPI
+from src.models.book import Book
+from src.models.user import UserRole
+from src.reports import circulation_report
+from src.reports.circulation_report import CirculationReport
+
+
+def add_reservation(db, book_id, when, status='pending'):
+    """Бронирование с заданной датой"""
+    conn = db.connect()
+    conn.execute(
+        "INSERT INTO reservations (book_id, user_id, status, reservation_date) VALUES (?, ?, ?, ?)",
+        (book_id, 1, status, when.isoformat())
+    )
+    conn.commit()
+
+
+@pytest.fixture
+def library_api(tmp_path):
+    """API с небольшим каталогом и историей бронирований"""
+    api = LibraryAPI(db_path=str(tmp_path / "reports.db"))
+    db = api.db
+    books = [
+        ("Война и мир", "Толстой", "Роман", 2),
+        ("Анна Каренина", "Толстой", "Роман", 1),
+        ("Вишнёвый сад", "Чехов", "Пьеса", 4),
+    ]
+    ids = [
+        db.add_book(Book(id=0, title=title, author=author, year=1900, isbn=f"REP-{i}",
+                         publisher="Изд", genre=genre, pages=100,
+                         quantity=quantity, available=quantity))
+        for i, (title, author, genre, quantity) in enumerate(books)
+    ]
+    # Неделя с понедельника 7 сентября и следующая
+    add_reservation(db, ids[0], datetime(2026, 9, 7, 10))
+    add_reservation(db, ids[0], datetime(2026, 9, 8, 10), 'confirmed')
+    add_reservation(db, ids[0], datetime(2026, 9, 15, 10), 'completed')
+    add_reservation(db, ids[1], datetime(2026, 9, 9, 10))
+    add_reservation(db, ids[2], datetime(2026, 9, 16, 10))
+    add_reservation(db, ids[2], datetime(2026, 9, 16, 11), 'cancelled')
+    # За пределами периода
+    add_reservation(db, ids[2], datetime(2026, 8, 1))
+    yield api
+    api.close()
+
+
+PERIOD = {'since': datetime(2026, 9, 1), 'until': datetime(2026, 10, 1)}
+
+
+class TestCirculationReport:
+    """Тесты показателей отчёта"""
+
+    def test_popularity_and_demand(self, library_api):
+        """Тест рейтинга популярности и спроса по неделям"""
+        report = CirculationReport.load(library_api.db, chunk_size=2, **PERIOD)
+        assert report.total_reservations == 5
+
+        assert [(row['title'], row['reservations']) for row in report.popular_books(2)] == [
+            ("Война и мир", 3), ("Анна Каренина", 1)
+        ]
+        assert report.demand('genre', 'week') == [
+            {'period': '2026-09-07', 'genre': 'Роман', 'reservations': 3},
+            {'period': '2026-09-14', 'genre': 'Пьеса', 'reservations': 1},
+            {'period': '2026-09-14', 'genre': 'Роман', 'reservations': 1},
+        ]
+        assert len(report.demand('author', 'day')) == 5
+
+    def test_utilization(self, library_api):
+        """Тест загрузки фонда по жанрам и авторам"""
+        report = CirculationReport.load(library_api.db, **PERIOD)
+
+        assert report.utilization('genre') == [
+            {'genre': 'Роман', 'reservations': 4, 'quantity': 3, 'utilization': 1.3333},
+            {'genre': 'Пьеса', 'reservations': 1, 'quantity': 4, 'utilization': 0.25},
+        ]
+        assert [row['author'] for row in report.utilization('author')] == ["Толстой", "Чехов"]
+
+        with pytest.raises(ValueError):
+            report.utilization('publisher')
+        with pytest.raises(ValueError):
+            report.demand('genre', 'month')
+
+    def test_empty_period(self, library_api):
+        """Тест отчёта за период без бронирований"""
+        report = CirculationReport.load(library_api.db, since=datetime(2020, 1, 1),
+                                        until=datetime(2020, 2, 1))
+        summary = report.to_dict()
+        assert summary['reservations'] == 0
+        assert summary['popular_books'] == []
+        assert summary['demand_by_genre'] == []
+        assert all(row['reservations'] == 0 for row in summary['utilization_by_genre'])
+
+    def test_fallback_matches(self, library_api, monkeypatch):
+        """Тест совпадения результатов с NumPy и без него"""
+        expected = CirculationReport.load(library_api.db, **PERIOD).to_dict(bucket='day')
+        monkeypatch.setattr(circulation_report, 'np', None)
+        assert CirculationReport.load(library_api.db, **PERIOD).to_dict(bucket='day') == expected
+
+    def test_admin_only(self, library_api):
+        """Тест доступа к отчёту только для администратора"""
+        library_api.auth.register_user("admin", "a@example.com", "secret", "Админ",
+                                       UserRole.ADMIN)
+        library_api.register("reader", "r@example.com", "secret", "Читатель")
+        admin_token = library_api.login_with_token("admin", "secret")[1]
+        reader_token = library_api.login_with_token("reader", "secret")[1]
+
+        assert library_api.circulation_report(token=reader_token, **PERIOD) is None
+        report = library_api.circulation_report(token=admin_token, limit=1, **PERIOD)
+        assert report['popular_books'][0]['title'] == "Война и мир"
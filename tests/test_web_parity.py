@@ -0,0 +1,312 @@
+"""
+Тесты совпадения ответов Flask- и ASGI-приложений
+"""
+import asyncio
+import gzip
+import json
+import pytest
+from urllib.parse import urlencode
+from src.api.library_api import LibraryAPI
+from src.models.book import Book
+from src.ui.web import app as flask_module, handlers, streaming
+from src.ui.web.asgi import LibraryASGIApp
+
+TOKEN_SECRET = "parity-secret"
+
+# Поля, зависящие от времени выполнения запроса
+VOLATILE_FIELDS = {'token', 'created_at', 'reservation_date', 'pickup_deadline'}
+
+
+def seed(api):
+    """Одинаковые данные для обоих приложений"""
+    for i in range(5):
+        api.db.add_book(Book(
+            id=0, title=f"Повесть {i}", author="Тургенев" if i % 2 else "Лесков",
+            year=1850 + i, isbn=f"PARITY-{i}", publisher="Изд", genre="Проза",
+            pages=100, quantity=1, available=1
+        ))
+    api.register("reader", "reader@example.com", "secret", "Читатель")
+
+
+def normalize(payload):
+    """Убрать из ответа поля, зависящие от времени"""
+    if isinstance(payload, dict):
+        return {key: normalize(value) for key, value in payload.items()
+                if key not in VOLATILE_FIELDS}
+    if isinstance(payload, list):
+        return [normalize(item) for item in payload]
+    return payload
+
+
+class FlaskClient:
+    """Запросы к Flask-приложению через тестовый клиент"""
+
+    def __init__(self, tmp_path):
+        flask_module.configure_api(db_path=str(tmp_path / "flask.db"), token_secret=TOKEN_SECRET)
+        seed(flask_module.get_api())
+        # ASGI-приложение не использует сессии, поэтому сравниваем без cookie
+        self.client = flask_module.app.test_client(use_cookies=False)
+
+    def request(self, method, path, params=None, body=None, token=None, headers=None):
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        response = self.client.open(path, method=method, query_string=params,
+                                    json=body, headers=headers)
+        self.last_headers = response.headers
+        self.last_body = response.data
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self):
+        flask_module.configure_api()
+
+
+class ASGIClient:
+    """Запросы к ASGI-приложению прямым вызовом по протоколу ASGI"""
+
+    def __init__(self, tmp_path):
+        self.app = LibraryASGIApp(db_path=str(tmp_path / "asgi.db"), token_secret=TOKEN_SECRET)
+        seed(self.app.api.api)
+
+    def request(self, method, path, params=None, body=None, token=None, headers=None):
+        raw_headers = [(b'content-type', b'application/json')]
+        raw_headers += [(name.lower().encode(), value.encode())
+                        for name, value in (headers or {}).items()]
+        if token:
+            raw_headers.append((b'authorization', f'Bearer {token}'.encode()))
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'headers': raw_headers,
+            'query_string': urlencode(params or {}).encode(),
+        }
+        messages = [{'type': 'http.request',
+                     'body': json.dumps(body).encode() if body is not None else b''}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.app(scope, receive, send))
+        self.last_headers = {name.decode(): value.decode()
+                             for name, value in sent[0]['headers']}
+        body = self.last_body = b''.join(message['body'] for message in sent[1:])
+        if self.last_headers.get('content-type', '').startswith('application/json'):
+            return sent[0]['status'], json.loads(body)
+        return sent[0]['status'], None
+
+    def close(self):
+        asyncio.run(self.app.close())
+
+
+@pytest.fixture
+def clients(tmp_path):
+    """Оба приложения с одинаковыми данными"""
+    pair = FlaskClient(tmp_path), ASGIClient(tmp_path)
+    yield pair
+    for client in pair:
+        client.close()
+
+
+def run_scenario(client):
+    """Последовательность запросов; возвращает ответы без зависящих от времени полей"""
+    responses = []
+
+    def call(*args, **kwargs):
+        status, payload = client.request(*args, **kwargs)
+        responses.append((status, normalize(payload)))
+        return payload
+
+    call('POST', '/api/login', body={'username': 'reader', 'password': 'wrong'})
+    token = call('POST', '/api/login', body={'username': 'reader', 'password': 'secret'})['token']
+
+    call('GET', '/api/books/search', {'q': 'Повесть'})
+    call('GET', '/api/books/search', {'author': 'Тургенев', 'sort': 'year'})
+    first = call('GET', '/api/books/search', {'limit': '2', 'sort': 'title'})
+    call('GET', '/api/books/search', {'limit': '2', 'sort': 'title', 'cursor': first['next_cursor']})
+    call('GET', '/api/books/search', {'limit': 'abc'})
+    call('GET', '/api/books/search', {'sort': 'unknown'})
+    call('GET', '/api/books/search', {'cursor': 'битый'})
+
+    call('POST', '/api/books/reserve', body={'book_id': 1})
+    call('POST', '/api/books/reserve', body={'book_id': 1}, token='подделка')
+    call('POST', '/api/books/reserve', body={}, token=token)
+    call('POST', '/api/books/reserve', body={'book_id': 1}, token=token)
+    call('POST', '/api/books/reserve', body={'book_id': 1}, token=token)
+    call('POST', '/api/books/reserve', body={'book_id': 999}, token=token)
+
+    call('GET', '/api/user/reservations')
+    call('GET', '/api/user/reservations', token=token)
+
+    call('POST', '/api/books/reserve/batch', body={'book_ids': [2, 3]})
+    call('POST', '/api/books/reserve/batch', body={'book_ids': []}, token=token)
+    call('POST', '/api/books/reserve/batch', body={'book_ids': [2], 'policy': 'любая'}, token=token)
+    call('POST', '/api/books/reserve/batch', body={'book_ids': [2, 1, 3]}, token=token)
+    call('POST', '/api/books/reserve/batch',
+         body={'book_ids': [2, 1, 3, 2], 'policy': 'best_effort'}, token=token)
+
+    call('POST', '/api/books/waitlist', body={'book_id': 1})
+    call('POST', '/api/books/waitlist', body={'book_id': 1}, token=token)
+    call('GET', '/api/books/waitlist', {'book_id': '1'}, token=token)
+    call('DELETE', '/api/books/waitlist', {'book_id': '1'}, token=token)
+    call('DELETE', '/api/books/waitlist', {'book_id': '1'}, token=token)
+    call('GET', '/api/books/waitlist', {'book_id': 'abc'}, token=token)
+
+    call('GET', '/api/admin/reports/circulation', {'bucket': 'month'}, token=token)
+    call('GET', '/api/admin/reports/circulation', token=token)
+
+    call('GET', '/api/books/batch', {'ids': '3,1,999,3'})
+    call('GET', '/api/books/batch', {'ids': '1,abc'})
+    call('GET', '/api/books/batch', {'ids': ','.join(str(i) for i in range(1, 102))})
+    return responses
+
+
+class TestWebParity:
+    """Flask и ASGI отвечают одинаково на одинаковые запросы"""
+
+    def test_same_responses(self, clients):
+        flask_client, asgi_client = clients
+        flask_responses = run_scenario(flask_client)
+        asgi_responses = run_scenario(asgi_client)
+
+        assert len(flask_responses) == len(asgi_responses)
+        for expected, actual in zip(flask_responses, asgi_responses):
+            assert actual == expected
+
+        # Сценарий действительно проверяет разные ветви
+        assert flask_responses[1][1]['success'] is True
+        assert flask_responses[12][1]['success'] is True
+        assert flask_responses[13][1].get('sold_out') is True
+        assert [item['outcome'] for item in flask_responses[20][1]['results']] == [
+            'rolled_back', 'sold_out', 'rolled_back'
+        ]
+        assert flask_responses[21][1]['success'] is True
+        assert flask_responses[23][1]['waitlist']['position'] == 1
+        assert flask_responses[24][1] == {'success': True, 'position': 1}
+        assert flask_responses[25][1]['success'] is True
+        assert flask_responses[26][1]['success'] is False
+        assert [book['id'] for book in flask_responses[30][1]['books']] == [3, 1]
+        assert flask_responses[30][1]['missing'] == [999]
+        assert flask_responses[31][1]['success'] is False
+        assert flask_responses[32][1]['success'] is False
+
+    def test_asgi_unknown_route(self, clients):
+        _, asgi_client = clients
+        assert asgi_client.request('GET', '/api/unknown')[0] == 404
+        assert asgi_client.request('GET', '/api/login')[0] == 405
+
+    def test_conditional_search(self, clients):
+        """Тест ответа 304 по ETag и смены ETag после записи"""
+        etags = []
+        for client in clients:
+            params = {'q': 'Повесть', 'limit': '2'}
+            assert client.request('GET', '/api/books/search', params)[0] == 200
+            etag = client.last_headers['etag']
+            assert client.last_headers['cache-control'].startswith('public')
+
+            status, payload = client.request('GET', '/api/books/search', params,
+                                             headers={'If-None-Match': etag})
+            assert (status, payload) == (304, None)
+
+            token = client.request('POST', '/api/login',
+                                   body={'username': 'reader', 'password': 'secret'})[1]['token']
+            client.request('POST', '/api/books/reserve', body={'book_id': 1}, token=token)
+
+            status, _ = client.request('GET', '/api/books/search', params, token=token,
+                                       headers={'If-None-Match': etag})
+            assert status == 200
+            assert client.last_headers['etag'] != etag
+            assert client.last_headers['cache-control'].startswith('private')
+            etags.append(etag)
+
+        assert etags[0] == etags[1]
+
+    def test_search_after_write_by_other_process(self, tmp_path):
+        """Тест: новый ETag выдачи не отдаётся со старыми данными
+
+        Запись через другой LibraryAPI на той же базе имитирует соседний
+        рабочий процесс prefork-сервера.
+        """
+        client = ASGIClient(tmp_path)
+        other = LibraryAPI(db_path=str(tmp_path / "asgi.db"), token_secret=TOKEN_SECRET)
+        try:
+            client.app.api.api.db.catalog_version_ttl = 0
+            params = {'q': 'Повесть 1'}
+            payload = client.request('GET', '/api/books/search', params)[1]
+            etag = client.last_headers['etag']
+            assert payload['books'][0]['available'] == 1
+
+            _, token = other.login_with_token('reader', 'secret')
+            assert other.try_reserve_book(payload['books'][0]['id'], token=token).success
+
+            status, payload = client.request('GET', '/api/books/search', params,
+                                             headers={'If-None-Match': etag})
+            assert status == 200
+            assert client.last_headers['etag'] != etag
+            assert payload['books'][0]['available'] == 0
+        finally:
+            other.close()
+            client.close()
+
+    def test_default_page_follows_cursor(self, clients, monkeypatch):
+        """Тест: выдача без limit обходится по next_cursor, как на главной странице"""
+        monkeypatch.setattr(handlers, 'DEFAULT_PAGE_SIZE', 2)
+
+        for client in clients:
+            isbns, cursor = [], None
+            while True:
+                params = {'q': 'Повесть', **({'cursor': cursor} if cursor else {})}
+                status, payload = client.request('GET', '/api/books/search', params)
+                assert status == 200
+                assert len(payload['books']) <= 2
+                isbns += [book['isbn'] for book in payload['books']]
+                cursor = payload['next_cursor']
+                if not cursor:
+                    break
+
+            assert isbns == [f"PARITY-{i}" for i in range(5)]
+
+        page = flask_module.app.test_client().get('/').get_data(as_text=True)
+        assert 'next_cursor' in page and 'moreBooksBtn' in page
+
+    def test_ndjson_stream_with_gzip(self, clients, monkeypatch):
+        """Тест потоковой выдачи NDJSON постранично и со сжатием"""
+        monkeypatch.setattr(streaming, 'STREAM_PAGE_SIZE', 2)
+        monkeypatch.setattr(streaming, 'FLUSH_EVERY', 100)
+        headers = {'Accept': streaming.NDJSON_MIME, 'Accept-Encoding': 'gzip, deflate'}
+
+        results = []
+        for client in clients:
+            status, _ = client.request('GET', '/api/books/search', {'q': 'Повесть', 'limit': '1'},
+                                       headers=headers)
+            assert status == 200
+            assert client.last_headers['content-type'].startswith(streaming.NDJSON_MIME)
+            assert client.last_headers['content-encoding'] == 'gzip'
+            lines = gzip.decompress(client.last_body).decode('utf-8').splitlines()
+            results.append([normalize(json.loads(line)) for line in lines])
+
+        assert results[0] == results[1]
+        assert [book['isbn'] for book in results[0]] == [f"PARITY-{i}" for i in range(5)]
+
+    def test_ndjson_stream_bypasses_search_cache(self, clients, monkeypatch):
+        """Тест: потоковая выгрузка не заполняет кэш выдач поиска"""
+        monkeypatch.setattr(streaming, 'STREAM_PAGE_SIZE', 2)
+        databases = [flask_module.get_api().db, clients[1].app.api.api.db]
+
+        for client, db in zip(clients, databases):
+            client.request('GET', '/api/books/search', {'q': 'Повесть'})
+            size = db.search_cache_stats()['size']
+
+            status, _ = client.request('GET', '/api/books/search', {'q': 'Повесть'},
+                                       headers={'Accept': streaming.NDJSON_MIME})
+            assert status == 200
+            assert len(client.last_body.splitlines()) == 5
+            assert db.search_cache_stats()['size'] == size
+
+    def test_encoding_negotiation(self):
+        """Тест выбора сжатия по Accept-Encoding"""
+        assert streaming.negotiate_encoding(None) is None
+        assert streaming.negotiate_encoding('gzip;q=0.5, deflate') == 'deflate'
+        assert streaming.negotiate_encoding('gzip;q=0, *') == 'deflate'
+        assert streaming.negotiate_encoding('br') is None